@@ -4,6 +4,7 @@ from flask_mail import Mail, Message
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 import MySQLdb.cursors
+import hmac
 import re
 import os
 from datetime import datetime
@@ -202,6 +203,7 @@ def db_commit():
 
 # Cart Abandonment Detector Integration
 from cart_abandonment_detector import CartAbandonmentDetector
+from cart_abandonment_detector.text_pipeline import SEARCH_TEXT_VERSION, preprocess_product
 import threading
 import asyncio
 import logging
@@ -553,6 +555,45 @@ def cart_count():
         app.logger.error(f"Error getting cart count: {e}")
         return jsonify({'count': 0})
 
+@app.route('/api/cart/recommendations')
+def cart_recommendations():
+    """API endpoint to get product recommendations for the current cart"""
+    if not is_logged_in():
+        return jsonify({'recommendations': []})
+    
+    try:
+        cursor = get_db_cursor(dict_cursor=True)
+        cursor.execute('''
+            SELECT c.product_id, c.quantity, p.name, p.description, p.category
+            FROM cart c 
+            JOIN products p ON c.product_id = p.id 
+            WHERE c.user_id = %s
+        ''', (session['id'],))
+        cart_items = cursor.fetchall()
+        cursor.close()
+        
+        if not cart_items:
+            return jsonify({'recommendations': []})
+        
+        # Shares the detector's engine, so its recommendation cache serves both
+        engine = cart_detector.email_service.recommendation_engine
+        recommendations = engine.get_similar_products(cart_items, count=3)
+        return jsonify({
+            'recommendations': [
+                {
+                    'id': rec['id'],
+                    'name': rec['name'],
+                    'price': rec['price'],
+                    'image': rec['image'],
+                    'url': url_for('product_detail', id=rec['id'])
+                }
+                for rec in recommendations
+            ]
+        })
+    except Exception as e:
+        app.logger.error(f"Error getting cart recommendations: {e}")
+        return jsonify({'recommendations': []})
+
 @app.route('/update_cart', methods=['POST'])
 def update_cart():
     if not is_logged_in():
@@ -980,6 +1021,11 @@ def admin_view_product(product_id):
     
     return render_template('admin/view_product.html', product=product)
 
+def products_have_search_text(cursor):
+    """True once migrations/add_search_text_to_products.py has added products.search_text"""
+    cursor.execute("SHOW COLUMNS FROM products LIKE 'search_text'")
+    return cursor.fetchone() is not None
+
 @app.route('/admin/edit_product/<int:product_id>', methods=['GET', 'POST'])
 def admin_edit_product(product_id):
     app.logger.info(f"Edit product route accessed for product ID: {product_id}, method: {request.method}")
@@ -1000,14 +1046,26 @@ def admin_edit_product(product_id):
         category = request.form['category']
         
         try:
-            cursor.execute('''
-                UPDATE products 
-                SET name = %s, description = %s, price = %s, stock = %s, category = %s
-                WHERE id = %s
-            ''', (name, description, price, stock, category, product_id))
+            if products_have_search_text(cursor):
+                # Keep the recommendation index's preprocessed text in step with the product
+                cursor.execute('''
+                    UPDATE products 
+                    SET name = %s, description = %s, price = %s, stock = %s, category = %s,
+                        search_text = %s, search_text_version = %s
+                    WHERE id = %s
+                ''', (name, description, price, stock, category,
+                      preprocess_product(name, category, description), SEARCH_TEXT_VERSION, product_id))
+            else:
+                cursor.execute('''
+                    UPDATE products 
+                    SET name = %s, description = %s, price = %s, stock = %s, category = %s
+                    WHERE id = %s
+                ''', (name, description, price, stock, category, product_id))
             
             db_commit()
             cursor.close()
+            # Keep the product out of emails until the recommendation index is rebuilt with the new name/price
+            cart_detector.email_service.invalidate_product(product_id)
             
             flash('Product updated successfully!', 'success')
             return redirect(url_for('admin_products'))
@@ -1079,6 +1137,7 @@ def admin_delete_product(product_id):
         
         db_commit()
         cursor.close()
+        cart_detector.email_service.invalidate_product(product_id)
         
         app.logger.info(f"Successfully deleted product {product_id}")
         return jsonify({'success': True, 'message': 'Product deleted successfully'})
@@ -1170,10 +1229,18 @@ def admin_add_product():
                 file.save(os.path.join(app.config['UPLOAD_FOLDER'], image_filename))
         
         cursor = get_db_cursor(dict_cursor=False)
-        cursor.execute('''
-            INSERT INTO products (name, description, price, stock, category, image) 
-            VALUES (%s, %s, %s, %s, %s, %s)
-        ''', (name, description, price, stock, category, image_filename))
+        if products_have_search_text(cursor):
+            # Preprocess once here so index builds can use the stored text
+            cursor.execute('''
+                INSERT INTO products (name, description, price, stock, category, image, search_text, search_text_version) 
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            ''', (name, description, price, stock, category, image_filename,
+                  preprocess_product(name, category, description), SEARCH_TEXT_VERSION))
+        else:
+            cursor.execute('''
+                INSERT INTO products (name, description, price, stock, category, image) 
+                VALUES (%s, %s, %s, %s, %s, %s)
+            ''', (name, description, price, stock, category, image_filename))
         db_commit()
         cursor.close()
         
@@ -1622,6 +1689,25 @@ def get_email_template(template_name):
         app.logger.error(f"Error fetching email template {template_name}: {str(e)}")
         return jsonify({'success': False, 'message': 'Error fetching template'}), 500
 
+@app.route('/admin/llm_health')
+def admin_llm_health():
+    """Groq circuit breaker state, latency histogram and cache/limiter counters"""
+    if not is_logged_in() or not is_admin():
+        return jsonify({'error': 'Access denied'}), 403
+    
+    return jsonify({'success': True, 'llm': cart_detector.email_service.recommendation_engine.llm_health()})
+
+@app.route('/metrics')
+def metrics():
+    """LLM call metrics in Prometheus text format (admin session or METRICS_TOKEN bearer token)"""
+    token = os.getenv('METRICS_TOKEN', '')
+    authorized = bool(token) and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+    if not authorized and (not is_logged_in() or not is_admin()):
+        return make_response('Access denied\n', 403, {'Content-Type': 'text/plain'})
+    
+    body = cart_detector.email_service.recommendation_engine.llm_metrics.render_prometheus()
+    return make_response(body, 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
 @app.route('/admin/reports')
 def admin_reports():
     if not is_logged_in() or not is_admin():
@@ -0,0 +1,536 @@
+"""
+Email Rendering Benchmark
+Renders the same cart abandonment emails with the original f-string builders
+and with the precompiled Jinja2 templates (email_rendering.py), with and
+without the recommendation card cache, checks that they show the same
+content, and reports render time per email.
+
+Usage:
+    python -m cart_abandonment_detector.benchmark_email_rendering
+    python -m cart_abandonment_detector.benchmark_email_rendering --emails 20000 --output bench_email_rendering.json
+"""
+
+import argparse
+import html
+import json
+import platform
+import random
+import re
+import time
+from datetime import datetime
+from functools import partial
+from typing import Callable, Dict, List
+
+from . import config
+from .benchmark_recommendations import generate_catalog
+from .card_cache import CardFragmentCache
+from .email_rendering import email_renderer
+
+_WHITESPACE = re.compile(r'\s+')
+_TAG_SPACE = re.compile(r'\s*(<[^>]+>)\s*')
+
+
+def _legacy_cart_summary_html(cart_items: List[Dict], cart_total: float) -> str:
+    """Reference copy of the original f-string EmailService._build_cart_summary_html"""
+    rows = []
+    for item in cart_items:
+        rows.append(f"""
+            <tr>
+                <td style="padding: 10px; border-bottom: 1px solid #eee;">
+                    <strong>{item['name']}</strong>
+                </td>
+                <td style="padding: 10px; border-bottom: 1px solid #eee; text-align: center;">
+                    {item['quantity']}
+                </td>
+                <td style="padding: 10px; border-bottom: 1px solid #eee; text-align: right;">
+                    ${item['price']:.2f}
+                </td>
+                <td style="padding: 10px; border-bottom: 1px solid #eee; text-align: right;">
+                    <strong>${item['total']:.2f}</strong>
+                </td>
+            </tr>
+        """)
+
+    return f"""
+        <table style="width: 100%; border-collapse: collapse; margin: 20px 0;">
+            <thead>
+                <tr style="background-color: #f8f9fa;">
+                    <th style="padding: 10px; text-align: left;">Product</th>
+                    <th style="padding: 10px; text-align: center;">Qty</th>
+                    <th style="padding: 10px; text-align: right;">Price</th>
+                    <th style="padding: 10px; text-align: right;">Total</th>
+                </tr>
+            </thead>
+            <tbody>
+                {''.join(rows)}
+                <tr>
+                    <td colspan="3" style="padding: 15px; text-align: right; font-size: 18px;">
+                        <strong>Cart Total:</strong>
+                    </td>
+                    <td style="padding: 15px; text-align: right; font-size: 18px; color: #007bff;">
+                        <strong>${cart_total:.2f}</strong>
+                    </td>
+                </tr>
+            </tbody>
+        </table>
+    """
+
+
+def _legacy_recommendations_html(recommendations: List[Dict]) -> str:
+    """Reference copy of the original _build_recommendations_html"""
+    if not recommendations:
+        return ""
+
+    cards = []
+    for product in recommendations:
+        # Get description, handle None/empty cases
+        desc = product.get('description') or 'A great product for you'
+        desc_preview = desc[:100] + "..." if len(desc) > 100 else desc
+
+        # Get category
+        category = product.get('category', 'Product')
+
+        cards.append(f"""
+            <div style="border: 2px solid #007bff; border-radius: 12px; padding: 20px; margin: 10px; 
+                        flex: 1; min-width: 220px; max-width: 280px; background: #f8f9fa; text-align: center;">
+                <div style="background: #007bff; color: white; padding: 5px 10px; border-radius: 5px; 
+                            font-size: 12px; margin-bottom: 10px; display: inline-block;">
+                    {category}
+                </div>
+                <h4 style="margin: 10px 0; color: #333; font-size: 18px;">{product['name']}</h4>
+                <p style="color: #666; font-size: 14px; margin: 10px 0; min-height: 60px;">
+                    {desc_preview}
+                </p>
+                <p style="font-size: 24px; color: #28a745; font-weight: bold; margin: 15px 0;">
+                    ${product['price']:.2f}
+                </p>
+                <div style="background: #fff3cd; padding: 8px; border-radius: 5px; margin: 10px 0; font-size: 12px;">
+                    ✨ Recommended for you
+                </div>
+                <a href="{product['url']}" 
+                   style="display: inline-block; background-color: #28a745; color: white; padding: 12px 24px; 
+                          text-decoration: none; border-radius: 25px; margin-top: 10px; font-weight: bold;">
+                    🛍️ Add to Cart
+                </a>
+            </div>
+        """)
+
+    return f"""
+        <div style="display: flex; flex-wrap: wrap; justify-content: center; gap: 15px; margin: 30px 0;">
+            {''.join(cards)}
+        </div>
+    """
+
+
+def _legacy_email_html(**kwargs) -> str:
+    """Reference copy of the original _build_email_html"""
+    # Calculate savings
+    discount_amount = kwargs['cart_total'] * (kwargs['discount_percent'] / 100)
+    final_total = kwargs['discounted_total']
+
+    # AI content with fallback
+    ai_text = kwargs.get('ai_recommendation_text', 
+        f"We noticed you left some items in your cart. Complete your purchase now and save {kwargs['discount_percent']}% on your entire order!")
+
+    # Hours remaining for urgency
+    hours_remaining = 24
+
+    return f"""
+<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="UTF-8">
+<meta name="viewport" content="width=device-width, initial-scale=1.0">
+<title>Complete Your Purchase - {kwargs['discount_percent']}% OFF!</title>
+</head>
+<body style="margin: 0; padding: 0; font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, 'Helvetica Neue', Arial, sans-serif; background: #f5f7fa;">
+
+<table cellpadding="0" cellspacing="0" border="0" width="100%" style="background: #f5f7fa; padding: 20px 0;">
+    <tr>
+        <td align="center">
+            <table cellpadding="0" cellspacing="0" border="0" width="600" style="max-width: 600px; background: white; border-radius: 16px; overflow: hidden; box-shadow: 0 4px 20px rgba(0,0,0,0.1);">
+
+                <!-- Header -->
+                <tr>
+                    <td style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 40px 30px; text-align: center;">
+                        <h1 style="margin: 0; color: white; font-size: 32px; font-weight: 700;">
+                            🛍 ECommerceStore
+                        </h1>
+                    </td>
+                </tr>
+
+                <!-- Greeting -->
+                <tr>
+                    <td style="padding: 30px 30px 20px;">
+                        <h2 style="margin: 0 0 20px; color: #1a1a1a; font-size: 28px; font-weight: 700;">
+                            Hi {kwargs['user_name'].split()[0]}! 👋
+                        </h2>
+                    </td>
+                </tr>
+
+                <!-- AI Personalized Content -->
+                <tr>
+                    <td style="padding: 0 30px 20px;">
+                        <div style="background: linear-gradient(135deg, #f5f7fa 0%, #c3cfe2 100%); padding: 25px; border-radius: 12px; border-left: 4px solid #667eea;">
+                            <p style="margin: 0; color: #1a1a1a; font-size: 16px; line-height: 1.6;">
+                                {ai_text}
+                            </p>
+                        </div>
+                    </td>
+                </tr>
+
+                <!-- Urgency Timer -->
+                <tr>
+                    <td style="padding: 0 30px 20px;">
+                        <div style="background: #fff3cd; border: 2px solid #ffc107; border-radius: 8px; padding: 15px; text-align: center;">
+                            <span style="font-size: 14px; color: #856404; font-weight: 600;">
+                                ⏰ Offer expires in {hours_remaining} hours! Don't miss out!
+                            </span>
+                        </div>
+                    </td>
+                </tr>
+
+                <!-- Discount Banner -->
+                <tr>
+                    <td style="padding: 0 30px 20px;">
+                        <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 30px; border-radius: 12px; text-align: center;">
+                            <div style="color: white; font-size: 18px; margin-bottom: 10px;">
+                                ✨ Special Offer: {kwargs['discount_percent']}% OFF your entire order!
+                            </div>
+                            <div style="color: white; font-size: 32px; font-weight: 700; margin: 10px 0;">
+                                ${final_total:.2f} <span style="font-size: 20px; text-decoration: line-through; opacity: 0.7;">${kwargs['cart_total']:.2f}</span>
+                            </div>
+                            <div style="color: white; font-size: 16px;">
+                                Save ${discount_amount:.2f}!
+                            </div>
+
+                            <!-- Progress Bar -->
+                            <div style="background: rgba(255,255,255,0.3); height: 8px; border-radius: 4px; margin-top: 15px; overflow: hidden;">
+                                <div style="background: #4caf50; height: 100%; width: {kwargs['discount_percent']}%; border-radius: 4px;"></div>
+                            </div>
+                        </div>
+                    </td>
+                </tr>
+
+                <!-- Free Shipping -->
+                {('<tr><td style="padding: 0 30px 20px;"><div style="background: #d4edda; border: 2px solid #28a745; border-radius: 8px; padding: 15px; text-align: center;"><span style="font-size: 16px; color: #155724; font-weight: 600;">🚚 FREE SHIPPING on your order!</span></div></td></tr>' if kwargs.get('free_shipping') else '')}
+
+                <!-- Cart Header -->
+                <tr>
+                    <td style="padding: 30px 30px 20px;">
+                        <h3 style="margin: 0; color: #1a1a1a; font-size: 22px; font-weight: 700;">
+                            Your Cart Summary
+                        </h3>
+                    </td>
+                </tr>
+
+                <!-- Cart Table (using existing cart_summary HTML) -->
+                <tr>
+                    <td style="padding: 0 30px 20px;">
+                        <div style="background: #f8f9fa; padding: 20px; border-radius: 12px;">
+                            {kwargs['cart_summary']}
+                        </div>
+                    </td>
+                </tr>
+
+                <!-- Discount Row -->
+                <tr>
+                    <td style="padding: 0 30px 10px;">
+                        <table cellpadding="0" cellspacing="0" border="0" width="100%">
+                            <tr>
+                                <td style="text-align: right; padding: 10px; font-weight: 600; font-size: 16px; color: #28a745;">
+                                    Discount ({kwargs['discount_percent']}%):
+                                </td>
+                                <td style="text-align: right; padding: 10px; font-weight: 600; font-size: 18px; color: #28a745; width: 120px;">
+                                    -${discount_amount:.2f}
+                                </td>
+                            </tr>
+                            <tr style="background: #e7f3ff;">
+                                <td style="text-align: right; padding: 15px; font-weight: 700; font-size: 20px; color: #1a1a1a;">
+                                    Final Total:
+                                </td>
+                                <td style="text-align: right; padding: 15px; font-weight: 700; font-size: 28px; color: #667eea; width: 120px;">
+                                    ${final_total:.2f}
+                                </td>
+                            </tr>
+                        </table>
+                    </td>
+                </tr>
+
+                <!-- CTA Button -->
+                <tr>
+                    <td style="padding: 30px; text-align: center;">
+                        <a href="{kwargs['cart_url']}" 
+                           style="display: inline-block; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; text-decoration: none; padding: 18px 50px; border-radius: 50px; font-size: 18px; font-weight: 700; box-shadow: 0 4px 15px rgba(102, 126, 234, 0.4);">
+                            🛒 Complete Your Purchase Now
+                        </a>
+                    </td>
+                </tr>
+
+                <!-- Recommendations Section -->
+                {('<tr><td style="padding: 30px; background: #f8f9fa;"><h3 style="margin: 0 0 20px; color: #1a1a1a; font-size: 22px; font-weight: 700; text-align: center;">✨ You Might Also Love...</h3><div style="padding: 10px;">' + kwargs['recommendations_html'] + '</div></td></tr>' if kwargs.get('recommendations_html') else '')}
+
+                <!-- Company Signature -->
+                <tr>
+                    <td style="padding: 30px; background: #fff; border-top: 1px solid #eee; text-align: left;">
+                        <div style="color: #555; font-size: 16px; margin-bottom: 10px;">
+                            <strong>Thank you for shopping with us!</strong>
+                        </div>
+                        <div style="color: #333; font-size: 16px; margin-bottom: 5px;">
+                            <strong>The ECommerceStore Team</strong>
+                        </div>
+                        <div style="color: #888; font-size: 14px;">
+                            Need help? Contact us at <a href="mailto:support@ecommerce.com" style="color: #667eea; text-decoration: none;">support@ecommerce.com</a>
+                        </div>
+                    </td>
+                </tr>
+
+                <!-- Social Proof -->
+                <tr>
+                    <td style="padding: 30px; background: #fff; border-top: 1px solid #eee; text-align: center;">
+                        <div style="color: #666; font-size: 14px; margin-bottom: 15px;">
+                            ⭐⭐⭐⭐⭐ Trusted by 10,000+ happy customers
+                        </div>
+                        <div style="color: #999; font-size: 12px;">
+                            "Fast shipping, great quality, amazing customer service!" - Sarah M.
+                        </div>
+                    </td>
+                </tr>
+
+                <!-- Footer -->
+                <tr>
+                    <td style="padding: 30px; background: #1a1a1a; text-align: center;">
+                        <p style="margin: 0 0 10px; color: #999; font-size: 14px;">
+                            Need help? <a href="mailto:support@ecommerce.com" style="color: #667eea; text-decoration: none;">Contact us</a>
+                        </p>
+                        <p style="margin: 0; color: #666; font-size: 12px;">
+                            © 2025 ECommerceStore. All rights reserved.
+                        </p>
+                        <div style="margin-top: 15px;">
+                            <a href="#" style="color: #667eea; text-decoration: none; margin: 0 10px; font-size: 12px;">Unsubscribe</a>
+                            <a href="#" style="color: #667eea; text-decoration: none; margin: 0 10px; font-size: 12px;">Privacy Policy</a>
+                        </div>
+                    </td>
+                </tr>
+
+            </table>
+        </td>
+    </tr>
+</table>
+
+<!-- Email Open Tracking Pixel -->
+{('<img src="' + config.BASE_URL + '/track/email/' + str(kwargs.get('log_id', 0)) + '" width="1" height="1" style="display:none;" alt="" />') if kwargs.get('log_id') else ''}
+
+</body>
+</html>
+    """
+
+
+def _legacy_email_text(**kwargs) -> str:
+    """Reference copy of the original _build_email_text (3.12-only nested quotes removed)"""
+    discount_text = ""
+    if kwargs.get('discount_message'):
+        discount_text = f"\n\n{kwargs['discount_message']}\n" \
+                      f"Your new total: ${kwargs['discounted_total']:.2f} " \
+                      f"(save ${kwargs['cart_total'] - kwargs['discounted_total']:.2f}!)\n"
+
+    cart_items_text = "\n".join([
+        f"  - {item['name']} x{item['quantity']} - ${item['total']:.2f}"
+        for item in kwargs['cart_items']
+    ])
+
+    recs_text = ""
+    if kwargs['recommendations']:
+        recs_text = "\n\nYOU MIGHT ALSO LOVE:\n" + "\n".join([
+            f"  - {p['name']} (${p['price']:.2f}) - {kwargs['cart_url'].replace('/cart', '/product/' + str(p['id']))}"
+            for p in kwargs['recommendations']
+        ])
+
+    return f"""
+Hi {kwargs['user_name']}!
+
+We noticed you left some items in your cart. Don't worry, we saved them for you!
+{discount_text}
+{"🚚 FREE SHIPPING on your order!" if kwargs.get('free_shipping') else ""}
+
+YOUR CART:
+{cart_items_text}
+
+Cart Total: ${kwargs['cart_total']:.2f}
+
+Return to your cart and complete your purchase:
+{kwargs['cart_url']}
+{recs_text}
+
+Need help? Contact us at support@ecommerce.com
+
+© 2025 ECommerceStore
+    """
+
+
+def generate_emails(count: int, seed: int = 42) -> List[Dict]:
+    """render_email-shaped inputs: 1-4 cart items and 0-4 recommendations each"""
+    rng = random.Random(seed)
+    catalog = generate_catalog(500, seed=seed)
+    emails = []
+    for n in range(count):
+        cart_items = []
+        for row in rng.sample(catalog, rng.randint(1, 4)):
+            quantity = rng.randint(1, 3)
+            price = float(row['price'])
+            cart_items.append({'name': row['name'], 'quantity': quantity, 'price': price, 'total': price * quantity})
+        cart_total = sum(item['total'] for item in cart_items)
+        discount_percent = rng.choice([0, 10, 20])
+        recommendations = [
+            # Every fifth product has no description (the card's default text)
+            {'id': row['id'], 'name': row['name'], 'description': None if row['id'] % 5 == 0 else row['description'],
+             'price': float(row['price']), 'category': row['category'], 'url': f"{config.BASE_URL}/product/{row['id']}"}
+            for row in rng.sample(catalog, rng.randint(0, 4))
+        ]
+        emails.append({
+            'user_name': rng.choice(['Jane Doe', 'Sam', 'Priya Patel', 'Lee Min']),
+            'cart_items': cart_items,
+            'cart_total': cart_total,
+            'discount_percent': discount_percent,
+            'discount_message': f"Enjoy {discount_percent}% off!" if discount_percent else '',
+            'discounted_total': cart_total * (1 - discount_percent / 100),
+            'free_shipping': config.FREE_SHIPPING_ENABLED,
+            'ai_recommendation_text': "Your picks are still waiting, and they go great together. Come back soon!",
+            'recommendations': recommendations,
+            'cart_url': f"{config.CART_URL}?email_track={n + 1}&discount={discount_percent}&source=abandonment_email",
+            'log_id': n + 1,
+        })
+    return emails
+
+
+def render_legacy(email: Dict) -> Dict[str, str]:
+    """The original render_email body"""
+    return {
+        'html': _legacy_email_html(
+            user_name=email['user_name'],
+            cart_summary=_legacy_cart_summary_html(email['cart_items'], email['cart_total']),
+            cart_total=email['cart_total'],
+            discount_message=email['discount_message'],
+            discount_percent=email['discount_percent'],
+            discounted_total=email['discounted_total'],
+            free_shipping=email['free_shipping'],
+            ai_recommendation_text=email['ai_recommendation_text'],
+            recommendations_html=_legacy_recommendations_html(email['recommendations']),
+            cart_url=email['cart_url'],
+            log_id=email['log_id'],
+        ),
+        'text': _legacy_email_text(
+            user_name=email['user_name'],
+            cart_items=email['cart_items'],
+            cart_total=email['cart_total'],
+            discount_message=email['discount_message'],
+            discounted_total=email['discounted_total'],
+            recommendations=email['recommendations'],
+            cart_url=email['cart_url'],
+        ),
+    }
+
+
+def render_templates(email: Dict, card_cache: CardFragmentCache) -> Dict[str, str]:
+    """The render_email body with precompiled templates (cards through card_cache)"""
+    renderer = email_renderer()
+    cards = [card_cache.get_or_render(product, 1, renderer.recommendation_card) for product in email['recommendations']]
+    return {
+        'html': renderer.email_html(
+            user_name=email['user_name'],
+            cart_items=email['cart_items'],
+            cart_total=email['cart_total'],
+            discount_percent=email['discount_percent'],
+            discounted_total=email['discounted_total'],
+            free_shipping=email['free_shipping'],
+            ai_recommendation_text=email['ai_recommendation_text'],
+            recommendation_cards=cards,
+            cart_url=email['cart_url'],
+            log_id=email['log_id'],
+        ),
+        'text': renderer.email_text(
+            user_name=email['user_name'],
+            cart_items=email['cart_items'],
+            cart_total=email['cart_total'],
+            discount_message=email['discount_message'],
+            discounted_total=email['discounted_total'],
+            recommendations=email['recommendations'],
+            cart_url=email['cart_url'],
+        ),
+    }
+
+
+def _visible(text: str) -> str:
+    """What a mail client shows: entities decoded, whitespace runs collapsed, none next to tags"""
+    return _TAG_SPACE.sub(r'\1', _WHITESPACE.sub(' ', html.unescape(text))).strip()
+
+
+def _time(render: Callable[[Dict], Dict], emails: List[Dict]):
+    start = time.perf_counter()
+    results = [render(email) for email in emails]
+    seconds = time.perf_counter() - start
+    return {
+        'seconds': round(seconds, 4),
+        'microseconds_per_email': round(seconds / len(emails) * 1e6, 1),
+        'emails_per_sec': round(len(emails) / seconds, 1) if seconds else None,
+    }, results
+
+
+def benchmark(count: int, seed: int = 42) -> Dict:
+    """Check equivalence and time the legacy builders against the templates, with and without the card cache"""
+    emails = generate_emails(count, seed)
+    email_renderer()  # compile outside the timed loop, as at service start
+
+    legacy_timing, expected = _time(render_legacy, emails)
+    template_timing, rendered = _time(partial(render_templates, card_cache=CardFragmentCache(max_entries=0)), emails)
+    card_cache = CardFragmentCache()
+    cached_timing, cached = _time(partial(render_templates, card_cache=card_cache), emails)
+
+    mismatches = [
+        n for n, (a, b, c) in enumerate(zip(expected, rendered, cached))
+        if not _visible(a['html']) == _visible(b['html']) == _visible(c['html'])
+        or not _visible(a['text']) == _visible(b['text']) == _visible(c['text'])
+    ]
+    result = {
+        'emails': count,
+        'same_content': not mismatches,
+        'mismatches': len(mismatches),
+        'legacy_fstrings': legacy_timing,
+        'jinja2_templates': template_timing,
+        'jinja2_templates_card_cache': cached_timing,
+        'card_cache': card_cache.stats(),
+        'speedup': round(legacy_timing['seconds'] / cached_timing['seconds'], 2) if cached_timing['seconds'] else None,
+    }
+    print(f"{count:,} emails | same content: {result['same_content']} | "
+          f"f-strings {legacy_timing['microseconds_per_email']:.1f} µs/email | "
+          f"templates {template_timing['microseconds_per_email']:.1f} µs/email | "
+          f"templates + card cache {cached_timing['microseconds_per_email']:.1f} µs/email "
+          f"({result['card_cache']['hit_rate']:.0%} hits) | x{result['speedup']}")
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark email rendering: f-string builders vs Jinja2 templates")
+    parser.add_argument('--emails', type=int, default=5_000, help="Emails rendered per implementation")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='bench_email_rendering.json', help="JSON report path")
+    args = parser.parse_args(argv)
+
+    report = {
+        'generated_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': vars(args),
+        'result': benchmark(args.emails, args.seed),
+    }
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {args.output}")
+    if not report['result']['same_content']:
+        raise SystemExit("Template output differs from the original builders")
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,305 @@
+"""
+Email Throughput Benchmark
+Runs EmailService.generate_email_content and delivery end to end for N
+synthetic carts against the bundled SMTP sink (smtp_sink.py) and reports
+per-cart latency (p50/p99) and messages/sec for each delivery mode:
+
+    threaded  send_email through the SMTP pool in asyncio.to_thread
+    async     send_email through the pipelining asyncio client (smtp_async.py)
+    outbox    enqueue into email_outbox; an OutboxWorker delivers through the
+              pool (needs MySQL with migrations/create_email_outbox.py applied;
+              the benchmark's rows are deleted afterwards)
+
+Latency runs from the start of content generation to the sink's answer
+(inline modes) or to the worker's delivery (outbox). Groq is disabled, so
+every email uses the fallback copy and the timings are the email path's own.
+Failures injected by the sink count as failed sends; the outbox retries them
+later, but the benchmark stops at each message's first delivery attempt.
+
+Usage:
+    python -m cart_abandonment_detector.benchmark_email_throughput
+    python -m cart_abandonment_detector.benchmark_email_throughput --carts 2000 --rtt-ms 20 --latency-ms 50 --latency-jitter-ms 30
+    python -m cart_abandonment_detector.benchmark_email_throughput --temp-failure-rate 0.02 --disconnect-rate 0.01
+    python -m cart_abandonment_detector.benchmark_email_throughput --modes threaded,async,outbox
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List
+
+from . import config
+from .benchmark_recommendations import generate_catalog
+from .load_test import SyntheticShop, generate_carts
+from .metrics import LatencyHistogram
+from .recommendation_cache import generate_cart_hash
+from .smtp_sink import SMTPSink, add_sink_arguments, sink_from_args
+
+logger = logging.getLogger(__name__)
+
+DELIVERY_MODES = ('threaded', 'async', 'outbox')
+
+# Recipient domain of the benchmark's emails (also how its outbox rows are found for cleanup)
+BENCHMARK_DOMAIN = 'benchmark.invalid'
+
+
+class _Run:
+    """Per-cart start and finish times of one mode"""
+
+    def __init__(self, carts: int):
+        self.latency = LatencyHistogram(window=max(1, carts))
+        self.sent = 0
+        self.failed = 0
+        self.peak_threads = threading.active_count()
+        self._started: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.finished = threading.Event()
+        self._expected = carts
+
+    def start(self, to_email: str):
+        self._started[to_email] = time.perf_counter()
+
+    def finish(self, to_email: str, ok: bool):
+        """Record a message's first outcome (later outbox retries are ignored)"""
+        with self._lock:
+            started = self._started.pop(to_email, None)
+            if started is None:
+                return
+            seconds = time.perf_counter() - started
+            self.latency.observe(seconds)
+            if ok:
+                self.sent += 1
+            else:
+                self.failed += 1
+            self.peak_threads = max(self.peak_threads, threading.active_count())
+            if self.sent + self.failed >= self._expected:
+                self.finished.set()
+
+
+def _users(shop: SyntheticShop, mode: str) -> List[Dict]:
+    """The shop's users with addresses unique to this mode"""
+    return [
+        {'user_id': user['user_id'], 'name': user['name'], 'email': f"customer{user['user_id']}.{mode}@{BENCHMARK_DOMAIN}"}
+        for user in shop.users
+    ]
+
+
+async def _run_inline(service, carts: List[List[Dict]], users: List[Dict], concurrency: int, run: _Run):
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one(user: Dict, cart_items: List[Dict]):
+        async with gate:
+            run.start(user['email'])
+            content = await service.generate_email_content(
+                user, cart_items, sum(float(item['total']) for item in cart_items), cart_hash=generate_cart_hash(cart_items)
+            )
+            ok = await service.send_email(user['email'], content['subject'], content['html'], content['text'])
+            run.finish(user['email'], ok)
+
+    await asyncio.gather(*(one(user, cart) for user, cart in zip(users, carts)))
+
+
+async def _run_outbox(service, outbox, carts: List[List[Dict]], users: List[Dict], concurrency: int, run: _Run):
+    gate = asyncio.Semaphore(concurrency)
+    enqueue_lock = threading.Lock()
+    conn = outbox.connect()
+
+    def enqueue(user: Dict, content: Dict) -> bool:
+        # One connection, as the detector's phase 3 queues through a single cursor
+        with enqueue_lock:
+            cursor = conn.cursor()
+            try:
+                return outbox.enqueue(cursor, None, user['email'], content['subject'], content['html'], content['text']) is not None
+            finally:
+                cursor.close()
+
+    async def one(user: Dict, cart_items: List[Dict]):
+        async with gate:
+            run.start(user['email'])
+            content = await service.generate_email_content(
+                user, cart_items, sum(float(item['total']) for item in cart_items), cart_hash=generate_cart_hash(cart_items)
+            )
+            if not await asyncio.to_thread(enqueue, user, content):
+                run.finish(user['email'], False)
+
+    try:
+        await asyncio.gather(*(one(user, cart) for user, cart in zip(users, carts)))
+    finally:
+        conn.close()
+
+
+def _delete_benchmark_rows(outbox):
+    conn = outbox.connect()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM email_outbox WHERE to_email LIKE %s", (f"%@{BENCHMARK_DOMAIN}",))
+        conn.commit()
+        cursor.close()
+    finally:
+        conn.close()
+
+
+def run_mode(mode: str, sink: SMTPSink, shop: SyntheticShop, args, connect_mysql) -> Dict:
+    """Generate and deliver every cart's email in one delivery mode"""
+    from .cart_abandonment_detector import EmailService
+    from .outbox import EmailOutbox, OutboxWorker
+
+    outbox = None
+    if mode == 'outbox':
+        outbox = EmailOutbox.from_config(connect_mysql)
+        try:
+            _delete_benchmark_rows(outbox)
+        except Exception as e:
+            print(f"{mode:<9} skipped: the email_outbox table is not reachable ({e})")
+            return {'skipped': str(e)}
+
+    # EmailService reads these when it is constructed
+    config.SMTP_POOL_ENABLED = True
+    config.SMTP_ASYNC_ENABLED = mode == 'async'
+    service = EmailService()
+    service.recommendation_engine.build_index(shop.catalog)
+    carts, users = shop.carts, _users(shop, mode)
+    run = _Run(len(carts))
+    before = sink.stats()
+    worker = None
+
+    start = time.perf_counter()
+    try:
+        if outbox is not None:
+            def deliver(to_email: str, subject: str, html_content: str, text_content: str):
+                try:
+                    service.deliver(to_email, subject, html_content, text_content)
+                except Exception:
+                    run.finish(to_email, False)
+                    raise
+                run.finish(to_email, True)
+
+            worker = OutboxWorker(outbox, deliver, concurrency=args.worker_concurrency, batch_size=config.OUTBOX_BATCH_SIZE,
+                                  poll_seconds=args.poll_seconds, worker_id=f"benchmark:{os.getpid()}", stats_interval=0)
+            worker_thread = threading.Thread(target=worker.run_forever, name='outbox-benchmark', daemon=True)
+            worker_thread.start()
+            asyncio.run(_run_outbox(service, outbox, carts, users, args.concurrency, run))
+            if not run.finished.wait(args.outbox_timeout):
+                logger.warning(f"Outbox worker delivered {run.sent + run.failed}/{len(carts)} emails within {args.outbox_timeout:g}s")
+        else:
+            asyncio.run(_run_inline(service, carts, users, args.concurrency, run))
+        seconds = time.perf_counter() - start
+    finally:
+        if worker:
+            worker.stop()
+            worker_thread.join(timeout=30)
+            _delete_benchmark_rows(outbox)
+        service.close()
+
+    after = sink.stats()
+    latency = run.latency.snapshot()
+    result = {
+        'sent': run.sent,
+        'failed': run.failed,
+        'seconds': round(seconds, 3),
+        'messages_per_sec': round(run.sent / seconds, 1) if seconds else None,
+        'p50_seconds': latency['p50_seconds'],
+        'p95_seconds': latency['p95_seconds'],
+        'p99_seconds': latency['p99_seconds'],
+        'peak_threads': run.peak_threads,
+        'smtp_connections': after['connections'] - before['connections'],
+        'sink_accepted': after['messages'] - before['messages'],
+        'smtp_pool': service.smtp_pool.stats() if service.smtp_pool else None,
+        'async_smtp': service.async_smtp.stats() if service.async_smtp else None,
+    }
+    if worker:
+        result['outbox_worker'] = worker.stats()
+    print(f"{mode:<9} {result['messages_per_sec']:>9,.1f} msgs/sec | p50 {result['p50_seconds'] * 1000:8.1f} ms | "
+          f"p99 {result['p99_seconds'] * 1000:8.1f} ms | {run.sent:,} sent, {run.failed} failed | "
+          f"{result['smtp_connections']} connections, peak {run.peak_threads} threads")
+    return result
+
+
+def run_benchmark(args) -> Dict:
+    """Start the sink, then run every requested delivery mode over the same carts"""
+    modes = [mode.strip() for mode in args.modes.split(',') if mode.strip()]
+    unknown = set(modes) - set(DELIVERY_MODES)
+    if unknown:
+        raise SystemExit(f"Unknown delivery modes: {', '.join(sorted(unknown))} (choose from {', '.join(DELIVERY_MODES)})")
+
+    # Everything EmailService reads at construction time must be set first
+    config.GROQ_API_KEY = ''
+    config.LLM_PROVIDERS = ''
+    config.EMAIL_COPY_MODE = 'live'
+    config.LLM_COPY_CACHE_PERSIST = False
+    config.SMTP_POOL_SIZE = args.connections
+    config.SMTP_ASYNC_CONNECTIONS = args.connections
+
+    from .cart_abandonment_detector import DatabaseConnection
+
+    if not args.verbose:
+        # Per-email INFO logging would dominate the timings
+        logging.getLogger().setLevel(logging.WARNING)
+        logging.getLogger('cart_abandonment_detector').setLevel(logging.WARNING)
+
+    catalog = generate_catalog(args.catalog_size, seed=args.seed)
+    carts = generate_carts(catalog, args.carts, seed=args.seed)
+    shop = SyntheticShop(catalog, carts)
+    # The outbox needs the real database; everything else reads the synthetic shop
+    connect_mysql = DatabaseConnection.get_connection
+    DatabaseConnection.get_connection = staticmethod(shop.connect)
+
+    sink = sink_from_args(args)
+    host, port = sink.start()
+    os.environ.update(MAIL_SERVER=host, MAIL_PORT=str(port), MAIL_USE_TLS='False', MAIL_USE_SSL='False',
+                      MAIL_USERNAME='benchmark', MAIL_PASSWORD='benchmark')
+
+    print(f"{args.carts:,} carts, {args.concurrency} in flight, {args.connections} SMTP connections | sink: "
+          f"{args.rtt_ms:g} ms RTT, {args.latency_dist} {args.latency_ms:g}±{args.latency_jitter_ms:g} ms per message, "
+          f"{args.temp_failure_rate:.1%} 451 / {args.perm_failure_rate:.1%} 554 / {args.disconnect_rate:.1%} dropped\n")
+    results = {}
+    try:
+        for mode in modes:
+            results[mode] = run_mode(mode, sink, shop, args, connect_mysql)
+    finally:
+        sink.stop()
+
+    return {
+        'generated_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': vars(args),
+        'carts': args.carts,
+        'modes': results,
+        'sink': sink.stats(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark email generation + delivery per delivery mode against a local SMTP sink")
+    parser.add_argument('--carts', type=int, default=500, help="Synthetic carts (emails) per delivery mode")
+    parser.add_argument('--catalog-size', type=int, default=2000, help="Synthetic catalog size")
+    parser.add_argument('--modes', default='threaded,async', help=f"Comma-separated delivery modes ({', '.join(DELIVERY_MODES)})")
+    parser.add_argument('--concurrency', type=int, default=config.LLM_MAX_CONCURRENCY, help="Carts generated and sent at once")
+    parser.add_argument('--connections', type=int, default=config.SMTP_POOL_SIZE, help="SMTP_POOL_SIZE and SMTP_ASYNC_CONNECTIONS")
+    parser.add_argument('--worker-concurrency', type=int, default=config.OUTBOX_WORKER_CONCURRENCY, help="Outbox worker sends at once")
+    parser.add_argument('--poll-seconds', type=float, default=config.OUTBOX_POLL_SECONDS, help="Outbox worker poll interval")
+    parser.add_argument('--outbox-timeout', type=float, default=300, help="Max wait for the outbox worker to drain")
+    parser.add_argument('--output', default='bench_email_throughput.json', help="JSON report path")
+    parser.add_argument('--verbose', action='store_true', help="Keep the detector's INFO logging on")
+    add_sink_arguments(parser)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    report = run_benchmark(args)
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, default=str)
+    print(f"\nReport written to {args.output}")
+    return report
+
+
+if __name__ == '__main__':
+    main()
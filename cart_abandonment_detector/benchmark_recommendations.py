@@ -0,0 +1,401 @@
+"""
+Recommendation Benchmark & Quality Harness
+Times RecommendationEngine on synthetic catalogs of increasing size and measures
+hit-rate@k against held-out co-purchases, writing a JSON report. Also checks
+that co-purchase blending ranks candidates from every cart item on one scale.
+
+Usage:
+    python -m cart_abandonment_detector.benchmark_recommendations
+    python -m cart_abandonment_detector.benchmark_recommendations --sizes 1000 10000 --output bench.json
+    python -m cart_abandonment_detector.benchmark_recommendations --quality-source db
+    python -m cart_abandonment_detector.benchmark_recommendations --vectorizer hashing --sizes 1000000
+"""
+
+import argparse
+import json
+import logging
+import platform
+import random
+import statistics
+import sys
+import time
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, List, Tuple
+
+from . import config
+from .cart_abandonment_detector import DatabaseConnection, RecommendationEngine
+from .copurchase import CoPurchaseModel
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+
+# Synthetic vocabulary: every category gets its own pool of words plus a
+# shared pool so that cross-category matches exist but are weaker
+_SYLLABLES = ['ka', 'lo', 'mi', 'ne', 'ru', 'ta', 'vo', 'zi', 'pe', 'do', 'sa', 'fu', 'gri', 'bel', 'tor', 'max']
+_SHARED_WORDS = ['premium', 'classic', 'compact', 'portable', 'durable', 'deluxe', 'smart', 'eco',
+                 'wireless', 'pro', 'mini', 'ultra', 'light', 'heavy', 'soft', 'modern']
+
+
+def _category_words(rng: random.Random, size: int = 40) -> List[str]:
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 3))))
+    return sorted(words)
+
+
+def generate_catalog(size: int, categories: int = 20, seed: int = 42) -> List[Dict]:
+    """
+    Generate a synthetic product catalog shaped like the products table
+
+    Args:
+        size: Number of products
+        categories: Number of distinct categories
+        seed: Random seed (same seed -> same catalog)
+
+    Returns:
+        List of product rows (id, name, description, price, category, image, stock)
+    """
+    rng = random.Random(seed)
+    vocab = {f"Category {c:02d}": _category_words(rng) for c in range(categories)}
+    names = list(vocab)
+
+    rows = []
+    for product_id in range(1, size + 1):
+        category = rng.choice(names)
+        words = vocab[category]
+        name = ' '.join(rng.sample(words, 2)).title()
+        description_words = [rng.choice(words) for _ in range(rng.randint(10, 40))]
+        description_words += rng.sample(_SHARED_WORDS, 3)
+        rows.append({
+            'id': product_id,
+            'name': name,
+            'description': ' '.join(description_words),
+            'price': Decimal(rng.randint(500, 200_000)) / 100,
+            'category': category,
+            'image': f"product_{product_id}.jpg",
+            'stock': rng.randint(1, 100),
+        })
+    return rows
+
+
+def generate_baskets(catalog: List[Dict], orders: int = 2_000, seed: int = 7) -> List[List[int]]:
+    """
+    Generate synthetic order baskets with co-purchase structure
+
+    Most baskets stay within one category (accessories bought together) and
+    products have a small set of "usual companions" so the signal is learnable.
+
+    Returns:
+        List of baskets, each a list of product ids
+    """
+    rng = random.Random(seed)
+    by_category: Dict[str, List[int]] = {}
+    for row in catalog:
+        by_category.setdefault(row['category'], []).append(row['id'])
+
+    companions: Dict[int, List[int]] = {}
+    baskets = []
+    for _ in range(orders):
+        category = rng.choice(list(by_category))
+        anchor = rng.choice(by_category[category])
+        if anchor not in companions:
+            pool = by_category[category]
+            companions[anchor] = rng.sample(pool, min(len(pool), 4))
+        basket = {anchor}
+        basket.update(rng.sample(companions[anchor], rng.randint(1, min(2, len(companions[anchor])))))
+        if rng.random() < 0.2:
+            basket.add(rng.choice(catalog)['id'])
+        if len(basket) > 1:
+            baskets.append(sorted(basket))
+    return baskets
+
+
+def load_order_baskets() -> List[List[int]]:
+    """Load real co-purchase baskets from order_items, oldest order first"""
+    conn = DatabaseConnection.get_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT oi.order_id, oi.product_id
+        FROM order_items oi
+        JOIN orders o ON oi.order_id = o.id
+        ORDER BY o.created_at, oi.order_id
+    """)
+    baskets: Dict = {}
+    for row in cursor.fetchall():
+        baskets.setdefault(row['order_id'], []).append(row['product_id'])
+    cursor.close()
+    conn.close()
+    return [sorted(set(items)) for items in baskets.values() if len(set(items)) > 1]
+
+
+def split_baskets(baskets: List[List[int]], holdout_fraction: float = 0.2) -> Tuple[List[List[int]], List[List[int]]]:
+    """Split baskets chronologically into (train, held-out)"""
+    cut = int(len(baskets) * (1 - holdout_fraction))
+    return baskets[:cut], baskets[cut:]
+
+
+def _cart_item(row: Dict) -> Dict:
+    """Build a cart item dict from a product row (same fields the detector selects)"""
+    return {
+        'product_id': row['id'],
+        'quantity': 1,
+        'name': row['name'],
+        'description': row['description'],
+        'price': row['price'],
+        'category': row['category'],
+        'image': row['image'],
+        'total': row['price'],
+    }
+
+
+def evaluate_hit_rate(engine: RecommendationEngine, catalog_by_id: Dict[int, Dict], held_out: List[List[int]],
+                      k: int = 3, max_queries: int = 500, seed: int = 11) -> Dict:
+    """
+    Leave-one-in hit-rate@k: each held-out basket contributes queries where one
+    product is the cart and the rest of the basket are the targets.
+    """
+    rng = random.Random(seed)
+    queries = []
+    for basket in held_out:
+        known = [product_id for product_id in basket if product_id in catalog_by_id]
+        if len(known) < 2:
+            continue
+        anchor = rng.choice(known)
+        queries.append((anchor, set(known) - {anchor}))
+    rng.shuffle(queries)
+    queries = queries[:max_queries]
+
+    hits = 0
+    for anchor, targets in queries:
+        recs = engine.get_similar_products([_cart_item(catalog_by_id[anchor])], count=k)
+        if targets & {rec['id'] for rec in recs}:
+            hits += 1
+
+    return {
+        'k': k,
+        'queries': len(queries),
+        'hits': hits,
+        f'hit_rate@{k}': (hits / len(queries)) if queries else None,
+    }
+
+
+def _latency_summary(samples: List[float]) -> Dict:
+    ordered = sorted(samples)
+    if not ordered:
+        return {}
+    return {
+        'calls': len(ordered),
+        'mean_ms': statistics.fmean(ordered) * 1000,
+        'p50_ms': ordered[len(ordered) // 2] * 1000,
+        'p95_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+        'max_ms': ordered[-1] * 1000,
+    }
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def benchmark_size(size: int, carts: int, k: int, max_queries: int, seed: int) -> Dict:
+    """Run latency and quality measurements for one synthetic catalog size"""
+    print(f"\n=== Catalog size: {size:,} products ===")
+    catalog = generate_catalog(size, seed=seed)
+    catalog_by_id = {row['id']: row for row in catalog}
+    rng = random.Random(seed)
+
+    engine = RecommendationEngine()
+
+    # load_products minus the SQL query: sanitize, stem, vectorize
+    start = time.perf_counter()
+    engine.build_index(catalog)
+    build_seconds = time.perf_counter() - start
+    print(f"load_products (index build): {build_seconds:.2f}s")
+
+    # Cycle-shaped batch of abandoned carts (1-3 items each)
+    batch = [
+        [_cart_item(row) for row in rng.sample(catalog, rng.randint(1, 3))]
+        for _ in range(carts)
+    ]
+
+    # Single-item latency, cache disabled so every call does the full ranking
+    cache_size = engine.recommendation_cache.max_entries
+    engine.recommendation_cache.max_entries = 0
+    single = []
+    for cart in batch:
+        start = time.perf_counter()
+        engine.get_similar_products(cart[:1], count=k)
+        single.append(time.perf_counter() - start)
+    print(f"get_similar_products (1 item): p50 {_latency_summary(single)['p50_ms']:.2f}ms")
+
+    # Whole detector cycle, cold then warm recommendation cache
+    start = time.perf_counter()
+    for cart in batch:
+        engine.get_similar_products(cart, count=k)
+    cold_seconds = time.perf_counter() - start
+
+    engine.recommendation_cache.max_entries = cache_size
+    engine.recommendation_cache.clear()
+    for cart in batch:
+        engine.get_similar_products(cart, count=k)
+    start = time.perf_counter()
+    for cart in batch:
+        engine.get_similar_products(cart, count=k)
+    warm_seconds = time.perf_counter() - start
+    print(f"batch of {carts} carts: cold {cold_seconds:.2f}s, warm cache {warm_seconds:.4f}s")
+
+    # Quality against held-out synthetic co-purchases (uncached):
+    # TF-IDF alone, then blended with a co-purchase model trained on the earlier orders
+    engine.recommendation_cache.max_entries = 0
+    train, held_out = split_baskets(generate_baskets(catalog, seed=seed))
+    quality = evaluate_hit_rate(engine, catalog_by_id, held_out, k=k, max_queries=max_queries)
+    engine.copurchase_model.add_baskets(train)
+    quality['blended'] = evaluate_hit_rate(engine, catalog_by_id, held_out, k=k, max_queries=max_queries)
+    print(f"hit-rate@{k}: TF-IDF {quality[f'hit_rate@{k}']}, blended {quality['blended'][f'hit_rate@{k}']}")
+
+    return {
+        'catalog_size': size,
+        'load_products_seconds': build_seconds,
+        'vocabulary_size': len(engine.vectorizer.vocabulary_) if hasattr(engine.vectorizer, 'vocabulary_') else None,
+        'get_similar_products': _latency_summary(single),
+        'batch': {
+            'carts': carts,
+            'cold_seconds': cold_seconds,
+            'warm_cache_seconds': warm_seconds,
+            'carts_per_second_cold': carts / cold_seconds if cold_seconds else None,
+        },
+        'quality': quality,
+        'peak_rss_mb': _peak_rss_mb(),
+    }
+
+
+def check_blend_scale(size: int, carts: int, seed: int) -> Dict:
+    """
+    Check that co-purchase blending keeps one score scale across cart items
+
+    Each cart pairs a product with co-purchase history and one without.
+    Candidates bought with neither must rank in the same order as with
+    TF-IDF alone; otherwise the item with order history has its text
+    matches pushed below the other item's weaker ones.
+    """
+    print(f"\n=== Blend scale: {carts} two-item carts, {size:,} products ===")
+    catalog = generate_catalog(size, seed=seed)
+    engine = RecommendationEngine()
+    engine.build_index(catalog)
+    engine.recommendation_cache.max_entries = 0
+    model = engine.copurchase_model
+    model.add_baskets(generate_baskets(catalog, seed=seed))
+
+    with_history = [row for row in catalog if len(model.similar(row['id'])[0])]
+    without_history = [row for row in catalog if not len(model.similar(row['id'])[0])]
+    rng = random.Random(seed)
+    blend_weight = config.COPURCHASE_BLEND_WEIGHT
+    inverted = 0
+    for _ in range(carts):
+        cart = [_cart_item(rng.choice(with_history)), _cart_item(rng.choice(without_history))]
+        bought_with = {int(product_id) for item in cart for product_id in model.similar(item['product_id'])[0]}
+
+        config.COPURCHASE_BLEND_WEIGHT = 0.0
+        try:
+            text_only = [rec['id'] for rec in engine.get_similar_products(cart, count=20) if rec['id'] not in bought_with]
+        finally:
+            config.COPURCHASE_BLEND_WEIGHT = blend_weight
+        blended = [rec['id'] for rec in engine.get_similar_products(cart, count=20) if rec['id'] not in bought_with]
+
+        common = set(text_only) & set(blended)
+        if [product_id for product_id in text_only if product_id in common] != [product_id for product_id in blended if product_id in common]:
+            inverted += 1
+
+    print(f"carts whose text-only candidates were reordered by blending: {inverted}/{carts}")
+    return {
+        'catalog_size': size,
+        'carts': carts,
+        'blend_weight': blend_weight,
+        'reordered_carts': inverted,
+        'consistent': inverted == 0,
+    }
+
+
+def benchmark_database(k: int, max_queries: int) -> Dict:
+    """Measure quality on the real catalog against held-out order_items baskets"""
+    print("\n=== Database catalog ===")
+    engine = RecommendationEngine()
+    start = time.perf_counter()
+    engine.load_products()
+    load_seconds = time.perf_counter() - start
+
+    store = engine.product_store
+    catalog_by_id = {}
+    for row in range(len(store)):
+        view = store.view(row)
+        catalog_by_id[view['id']] = {
+            'id': view['id'], 'name': view['name'], 'description': view['description'],
+            'price': view['price'], 'category': view['category'], 'image': view['image'],
+        }
+
+    # load_products trained the co-purchase model on every order; retrain on
+    # the earlier orders only so held-out baskets don't leak into the score
+    engine.recommendation_cache.max_entries = 0
+    train, held_out = split_baskets(load_order_baskets())
+    engine.copurchase_model = CoPurchaseModel()
+    quality = evaluate_hit_rate(engine, catalog_by_id, held_out, k=k, max_queries=max_queries)
+    engine.copurchase_model.add_baskets(train)
+    quality['blended'] = evaluate_hit_rate(engine, catalog_by_id, held_out, k=k, max_queries=max_queries)
+    print(f"load_products: {load_seconds:.2f}s, hit-rate@{k}: TF-IDF {quality[f'hit_rate@{k}']}, blended {quality['blended'][f'hit_rate@{k}']}")
+    return {
+        'catalog_size': len(store),
+        'load_products_seconds': load_seconds,
+        'quality': quality,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark RecommendationEngine latency and quality")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="Synthetic catalog sizes")
+    parser.add_argument('--carts', type=int, default=200, help="Carts per simulated detector cycle")
+    parser.add_argument('--k', type=int, default=3, help="Recommendations per cart (hit-rate@k)")
+    parser.add_argument('--max-queries', type=int, default=500, help="Held-out queries per quality run")
+    parser.add_argument('--quality-source', choices=['synthetic', 'db'], default='synthetic',
+                        help="'db' also evaluates the real catalog against order_items")
+    parser.add_argument('--vectorizer', choices=['tfidf', 'hashing'], default=config.RECOMMENDATION_VECTORIZER,
+                        help="Index vectorizer (overrides config.RECOMMENDATION_VECTORIZER)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='bench_recommendations.json', help="JSON report path")
+    parser.add_argument('--verbose', action='store_true', help="Keep the engine's INFO logging on")
+    args = parser.parse_args(argv)
+
+    config.RECOMMENDATION_VECTORIZER = args.vectorizer
+
+    if not args.verbose:
+        # Per-recommendation INFO logging would dominate the timings
+        logging.getLogger('cart_abandonment_detector').setLevel(logging.WARNING)
+
+    report = {
+        'generated_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': vars(args),
+        'results': [],
+    }
+    for size in args.sizes:
+        report['results'].append(benchmark_size(size, args.carts, args.k, args.max_queries, args.seed))
+    report['blend_scale'] = check_blend_scale(min(args.sizes), args.carts, args.seed)
+    if args.quality_source == 'db':
+        report['database'] = benchmark_database(args.k, args.max_queries)
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {args.output}")
+    if not report['blend_scale']['consistent']:
+        raise SystemExit("Co-purchase blending reordered text-only candidates")
+    return report
+
+
+if __name__ == '__main__':
+    main()
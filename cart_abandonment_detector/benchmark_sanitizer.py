@@ -0,0 +1,161 @@
+"""
+Safe Sanitizer Benchmark
+Checks that the precompiled sanitizer matches the original per-call regex
+implementation exactly, and compares their throughput in strings/sec.
+
+Usage:
+    python -m cart_abandonment_detector.benchmark_sanitizer
+    python -m cart_abandonment_detector.benchmark_sanitizer --strings 200000 --output bench_sanitizer.json
+"""
+
+import argparse
+import json
+import logging
+import platform
+import random
+import re
+import time
+from datetime import datetime
+from typing import Callable, Dict, List
+
+from .sanitizer import sanitize_many, sanitize_text
+
+logger = logging.getLogger(__name__)
+
+_WORDS = ['wireless', 'headphones', 'laptop', 'stand', 'organic', 'cotton', 'shirt', 'leather', 'wallet',
+          'Premium', 'Classic', 'USB-C', 'charger', "kid's", 'toy', 'set', 'stainless', 'steel', 'bottle']
+_NOISE = [
+    '<b>', '</b>', '<p class="x">', '<br/>', 'contact sales@example.com', 'see https://shop.example.com/p?id=7',
+    'www.example.org', '123e4567-e89b-12d3-a456-426614174000', 'user123', 'uid_456', 'ID:789', 'account-42',
+    '0771234567', '2024', '99', '@brand', '#deal', '50%', '$19.99', 'Rs.1500', '&amp;', '™', 'café', '—',
+    '!!!', '...', '(new)', '[sale]', '  ', '\t', '\n',
+]
+_EMAIL_PHRASES = [
+    "Don't regret it", "You'll regret this", 'no FOMO here', 'Last Chance!', 'act now or never',
+    "don't be a fool", "What's wrong with you?", 'missing out', 'what a failure', 'shame', 'stupid idea',
+    "what's wrong with you'll regret", 'Hi Jane,', 'Your cart is waiting.', 'Enjoy 10% off!',
+]
+
+
+def _legacy_sanitize(text: str, content_type: str = "product") -> str:
+    """Reference copy of the original per-call implementation (without logging)"""
+    if not text:
+        return ""
+    s = text
+    s = re.sub(r'<[^>]+>', ' ', s)
+    s = re.sub(r'\b[\w\.-]+@[\w\.-]+\.\w{2,}\b', '[EMAIL_REMOVED]', s)
+    s = re.sub(r'https?://\S+|www\.\S+', '[URL_REMOVED]', s)
+    s = re.sub(r'\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b', '[ID_REMOVED]', s)
+    s = re.sub(r'\b(?:user|uid|id|account)[_\-:]?\d+\b', '[USER_ID_REMOVED]', s, flags=re.IGNORECASE)
+    s = re.sub(r'\b\d{4,}\b', '[NUMBER_REMOVED]', s)
+    s = re.sub(r'[@#]\w+', '', s)
+    if content_type == "email":
+        offensive_words = [
+            r'\bregret\b', r'\bfailure\b', r'\bshame\b', r'\bstupid\b',
+            r'\bidiot\b', r'\bloser\b', r'\bpathetic\b', r'\bworthless\b',
+            r'\bmissing out\b', r'\bfomo\b', r'\blast chance\b',
+            r'\bact now or never\b', r'\bdon\'t be a fool\b',
+            r'\byou\'ll regret\b', r'\bwhat\'s wrong with you\b'
+        ]
+        for pattern in offensive_words:
+            s = re.sub(pattern, '', s, flags=re.IGNORECASE)
+    if content_type == "product":
+        s = re.sub(r'[^a-zA-Z0-9\s]', ' ', s)
+    else:
+        s = re.sub(r'[^\w\s\.,!?\-\'%$]', ' ', s)
+    s = re.sub(r'\s+', ' ', s).strip()
+    if content_type == "product":
+        s = s.lower()
+        s = s.replace('[email_removed]', '').replace('[url_removed]', '').replace('[id_removed]', '').replace('[user_id_removed]', '').replace('[number_removed]', '')
+        s = re.sub(r'\s+', ' ', s).strip()
+    return s
+
+
+def generate_texts(count: int, content_type: str, seed: int = 42) -> List[str]:
+    """
+    Generate product- or email-like strings with HTML, PII and noise mixed in
+
+    Args:
+        count: Number of strings
+        content_type: "product" or "email"
+        seed: Random seed
+
+    Returns:
+        List of strings
+    """
+    rng = random.Random(seed)
+    pool = _WORDS + (_EMAIL_PHRASES if content_type == "email" else [])
+    texts = []
+    for _ in range(count):
+        parts = [rng.choice(pool) for _ in range(rng.randint(5, 30))]
+        for _ in range(rng.randint(0, 4)):
+            parts.insert(rng.randrange(len(parts) + 1), rng.choice(_NOISE))
+        texts.append(rng.choice([' ', '  ', '', '-']).join(parts))
+    return texts
+
+
+def _time(fn: Callable[[], List[str]]) -> Dict:
+    start = time.perf_counter()
+    results = fn()
+    seconds = time.perf_counter() - start
+    return {'seconds': round(seconds, 4), 'strings_per_sec': round(len(results) / seconds, 1) if seconds else None}, results
+
+
+def benchmark(count: int, content_type: str, seed: int = 42) -> Dict:
+    """Check equivalence and time legacy vs per-string vs batch sanitization"""
+    texts = generate_texts(count, content_type, seed)
+
+    legacy_timing, expected = _time(lambda: [_legacy_sanitize(t, content_type) for t in texts])
+    single_timing, single = _time(lambda: [sanitize_text(t, content_type) for t in texts])
+    batch_timing, batch = _time(lambda: sanitize_many(texts, content_type))
+
+    mismatches = [i for i, (a, b, c) in enumerate(zip(expected, single, batch)) if not a == b == c]
+    for i in mismatches[:5]:
+        logger.error(f"Mismatch for {texts[i]!r}: legacy={expected[i]!r} new={single[i]!r}")
+
+    result = {
+        'content_type': content_type,
+        'strings': count,
+        'identical_output': not mismatches,
+        'mismatches': len(mismatches),
+        'legacy': legacy_timing,
+        'sanitize_text': single_timing,
+        'sanitize_many': batch_timing,
+        'speedup_batch_vs_legacy': round(legacy_timing['seconds'] / batch_timing['seconds'], 2) if batch_timing['seconds'] else None,
+    }
+    print(f"{content_type:8s} {count:>8,} strings | identical: {result['identical_output']} | "
+          f"legacy {legacy_timing['strings_per_sec']:>10,.0f}/s | sanitize_text {single_timing['strings_per_sec']:>10,.0f}/s | "
+          f"sanitize_many {batch_timing['strings_per_sec']:>10,.0f}/s | x{result['speedup_batch_vs_legacy']}")
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark and verify the Safe Sanitizer")
+    parser.add_argument('--strings', type=int, default=50_000, help="Strings per content type")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='bench_sanitizer.json', help="JSON report path")
+    parser.add_argument('--verbose', action='store_true', help="Keep the sanitizer's INFO logging on")
+    args = parser.parse_args(argv)
+
+    if not args.verbose:
+        # One audit line per string would dominate the timings
+        logging.getLogger('cart_abandonment_detector').setLevel(logging.WARNING)
+
+    report = {
+        'generated_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': vars(args),
+        'results': [benchmark(args.strings, content_type, args.seed) for content_type in ('product', 'email')],
+    }
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {args.output}")
+    if not all(r['identical_output'] for r in report['results']):
+        raise SystemExit("Sanitizer output differs from the reference implementation")
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""
+SMTP Delivery Benchmark
+Sends the same messages from an event loop to a local SMTP sink
+(smtp_sink.py) three ways - a new smtplib connection per message, the
+SMTP connection pool in asyncio.to_thread (the threaded path), and the
+pipelining asyncio client (smtp_async.py) - and reports messages/sec,
+connections opened and peak thread count. --rtt-ms makes the sink behave
+like a mail server that far away.
+
+Usage:
+    python -m cart_abandonment_detector.benchmark_smtp
+    python -m cart_abandonment_detector.benchmark_smtp --messages 2000 --rtt-ms 20 --output bench_smtp.json
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import smtplib
+import threading
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Dict
+
+from .smtp_async import AsyncSMTPSender
+from .smtp_pool import SMTPConnectionPool, mime_message
+from .smtp_sink import SMTPSink
+
+
+def _message(n: int):
+    return mime_message(
+        f"customer{n}@example.com",
+        f"Your cart is waiting - order #{n}",
+        f"<html><body><h1>Hi customer {n}</h1><p>{'Your items are still in your cart. ' * 40}</p></body></html>",
+        f"Hi customer {n}\n\n{'Your items are still in your cart. ' * 40}\n",
+    )
+
+
+async def _drive(send: Callable[[object], Awaitable], messages: int, concurrency: int) -> Dict:
+    """Run `messages` sends with at most `concurrency` in flight, sampling the thread count"""
+    gate = asyncio.Semaphore(concurrency)
+    peak_threads = threading.active_count()
+    failures = 0
+
+    async def one(n: int):
+        nonlocal peak_threads, failures
+        async with gate:
+            try:
+                await send(_message(n))
+            except Exception:
+                failures += 1
+            peak_threads = max(peak_threads, threading.active_count())
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(n) for n in range(messages)))
+    seconds = time.perf_counter() - start
+    return {
+        'seconds': round(seconds, 3),
+        'messages_per_sec': round((messages - failures) / seconds, 1) if seconds else None,
+        'failures': failures,
+        'peak_threads': peak_threads,
+    }
+
+
+def _run_mode(name: str, sink: SMTPSink, make_send: Callable[[], Callable], messages: int, concurrency: int) -> Dict:
+    before = sink.stats()
+    send, close = make_send()
+    try:
+        # Fresh loop and default executor per mode, so thread counts don't carry over
+        result = asyncio.run(_drive(send, messages, concurrency))
+    finally:
+        close()
+    after = sink.stats()
+    result['connections'] = after['connections'] - before['connections']
+    result['received'] = after['messages'] - before['messages']
+    print(f"{name:<22} {result['messages_per_sec']:>9,.1f} msgs/sec | {result['connections']:>5} connections | "
+          f"peak {result['peak_threads']} threads | {result['received']:,} received, {result['failures']} failed")
+    return result
+
+
+def benchmark(messages: int, concurrency: int, connections: int, rtt_ms: float) -> Dict:
+    """Time the per-message, threaded-pool and async pipelined paths against one sink"""
+    sink = SMTPSink('127.0.0.1', 0, rtt_ms=rtt_ms)
+    host, port = sink.start()
+
+    def per_message():
+        def send_one(msg):
+            with smtplib.SMTP(host, port, timeout=30) as smtp:
+                smtp.send_message(msg)
+        return (lambda msg: asyncio.to_thread(send_one, msg)), (lambda: None)
+
+    def pooled_threads():
+        pool = SMTPConnectionPool(host, port, use_tls=False, max_connections=connections)
+        return (lambda msg: asyncio.to_thread(pool.send, msg)), pool.close
+
+    senders = []
+
+    def async_pipelined():
+        sender = AsyncSMTPSender(host, port, use_tls=False, connections=connections)
+        senders.append(sender)
+        return sender.send, (lambda: None)
+
+    print(f"{messages:,} messages, {concurrency} in flight, {connections} connections, {rtt_ms:g} ms RTT\n")
+    try:
+        result = {
+            'messages': messages,
+            'smtplib_per_message': _run_mode('smtplib per message', sink, per_message, messages, concurrency),
+            'pool_in_threads': _run_mode('pool in threads', sink, pooled_threads, messages, concurrency),
+            'async_pipelined': _run_mode('async pipelined', sink, async_pipelined, messages, concurrency),
+        }
+    finally:
+        sink.stop()
+    result['async_sender'] = senders[0].stats() if senders else None
+    result['all_received'] = all(
+        result[mode]['received'] == messages for mode in ('smtplib_per_message', 'pool_in_threads', 'async_pipelined')
+    )
+    threaded = result['pool_in_threads']['messages_per_sec']
+    result['async_speedup_vs_threads'] = round(result['async_pipelined']['messages_per_sec'] / threaded, 2) if threaded else None
+    print(f"\nAsync pipelined vs pool in threads: x{result['async_speedup_vs_threads']}")
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark SMTP delivery: per-message smtplib vs pooled threads vs async pipelining")
+    parser.add_argument('--messages', type=int, default=1_000, help="Messages sent per delivery path")
+    parser.add_argument('--concurrency', type=int, default=50, help="Sends in flight at once (concurrent carts)")
+    parser.add_argument('--connections', type=int, default=2, help="SMTP connections for the pool and the async client")
+    parser.add_argument('--rtt-ms', type=float, default=10, help="Emulated round trip to the mail server")
+    parser.add_argument('--output', default='bench_smtp.json', help="JSON report path")
+    args = parser.parse_args(argv)
+
+    report = {
+        'generated_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': vars(args),
+        'result': benchmark(args.messages, args.concurrency, args.connections, args.rtt_ms),
+    }
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {args.output}")
+    if not report['result']['all_received']:
+        raise SystemExit("The sink did not receive every message")
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Recommendation Card Cache
+LRU cache of rendered recommendation-card HTML keyed by product id and
+catalog index version, so an email's recommendation block is a join of
+cached fragments.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Mapping, Tuple
+
+from markupsafe import Markup
+
+
+class CardFragmentCache:
+    """
+    Thread-safe LRU of rendered cards
+
+    Keys are (product_id, catalog_version) tuples: after an index rebuild
+    every card is rendered again from the new catalog, and the old entries
+    simply age out. invalidate() drops one product's cards right away
+    (admin edits and deletes, which don't bump the version until the next
+    rebuild).
+    """
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[Tuple[int, int], Markup]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get_or_render(self, product: Mapping, catalog_version: int, render: Callable[[Mapping], Markup]) -> Markup:
+        """Cached card for product, rendering (and storing) it on a miss"""
+        key = (int(product['id']), catalog_version)
+        with self._lock:
+            card = self._entries.get(key)
+            if card is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return card
+            self.misses += 1
+
+        # Render outside the lock; two threads may render the same card once each
+        card = render(product)
+        if self.max_entries <= 0:
+            return card
+        with self._lock:
+            self._entries[key] = card
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return card
+
+    def invalidate(self, product_id: Hashable) -> int:
+        """Drop every cached card of one product; returns how many were dropped"""
+        with self._lock:
+            stale = [key for key in self._entries if key[0] == int(product_id)]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+            return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self.evictions += len(self._entries)
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict:
+        """Return hit-rate metrics"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits / lookups) if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
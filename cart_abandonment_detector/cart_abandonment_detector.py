@@ -5,27 +5,45 @@ Main module with detection, email, and recommendation components.
 """
 
 import asyncio
+import json
 import logging
 import threading
+import time
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional, Tuple
+from types import SimpleNamespace
+from typing import List, Dict, Iterable, Iterator, Optional, Tuple
 import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 import MySQLdb
 import MySQLdb.cursors
 # Lazy import for sklearn - only load when recommendations are needed
 # from sklearn.feature_extraction.text import TfidfVectorizer
 # from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
-from openai import OpenAI
 from flask_mail import Message
 from flask import render_template_string
-from nltk.stem import PorterStemmer
-from nltk.tokenize import word_tokenize
 import re
 
 from . import config
+from .card_cache import CardFragmentCache
+from .copurchase import CoPurchaseModel
+from .copy_cache import LLMCopyCache, cacheable, copy_signature, personalize
+from .copy_library import CUSTOMER_SLOT, CopyLibrary
+from .copy_stream import CUTOFF_CLOSING, StreamedCopy, streamed_completion
+from .email_rendering import email_renderer
+from .metrics import DEFAULT_TOKEN_BUCKETS, MetricsRegistry
+from .outbox import EmailOutbox
+from .providers import ProviderPool
+from .rate_limit import TokenBucket
+from .resilience import CircuitBreaker
+from .product_store import DESCRIPTION_PREVIEW_CHARS, ProductStore, ProductView, normalize_category
+from .category_shards import CategoryShards
+from .recommendation_cache import RecommendationCache, generate_cart_hash
+from .recommendation_index import BackgroundIndexBuilder, RecommendationIndex
+from .sanitizer import sanitize_many, sanitize_text, unsafe_content
+from .smtp_async import AsyncSMTPSender, AsyncSMTPUnavailable
+from .smtp_pool import SMTPConnectionPool, mime_message, smtp_settings
+from .streaming_tfidf import StreamingHashingVectorizer
+from .text_pipeline import SEARCH_TEXT_VERSION, build_product_text, shared_stem_cache, stem_many, tokenize
 
 # Configure logging
 # Create logs directory if it doesn't exist
@@ -50,43 +68,247 @@ class DatabaseConnection:
     """Manages MySQL database connections"""
     
     @staticmethod
-    def get_connection():
-        """Create and return a MySQL connection"""
+    def get_connection(server_side: bool = False):
+        """
+        Create and return a MySQL connection
+        
+        Args:
+            server_side: Use an unbuffered server-side cursor (stream rows with fetchmany)
+        """
         return MySQLdb.connect(
             host=config.MYSQL_HOST,
             user=config.MYSQL_USER,
             password=config.MYSQL_PASSWORD,
             database=config.MYSQL_DB,
-            cursorclass=MySQLdb.cursors.DictCursor
+            cursorclass=MySQLdb.cursors.SSDictCursor if server_side else MySQLdb.cursors.DictCursor
         )
 
 
+# Prompt variations, randomized per email for variety (also enumerated by pregenerate_copy.py)
+PROMPT_TONES = [
+    "friendly and enthusiastic",
+    "warm and helpful",
+    "casual and conversational",
+    "excited and upbeat"
+]
+
+PROMPT_APPROACHES = [
+    "Start by mentioning their cart items, then introduce the discount and recommendations naturally",
+    "Lead with the special discount offer, then highlight what's in their cart and suggested items",
+    "Begin with a warm greeting about their selections, weave in the discount and recommendations organically",
+    "Open with excitement about their cart choices, then present the offer and complementary products"
+]
+
+PROMPT_STYLES = [
+    "Use short, punchy sentences and varied structure",
+    "Mix longer descriptive sentences with brief action-oriented ones",
+    "Blend questions with statements to create engagement",
+    "Use conversational fragments alongside complete sentences for natural flow"
+]
+
+
+_PROMPT_CLOSING = "Write the email body now:"
+
+# Live prompts name the customer only by CUSTOMER_SLOT, filled in after generation,
+# so no real name reaches the LLM or the copy cache
+_CUSTOMER_SLOT_REQUIREMENT = (
+    f"Write {CUSTOMER_SLOT} exactly as written wherever you address the customer "
+    f"(it is replaced with their name when the email is sent)"
+)
+
+
+def compose_prompt(user_name: str, cart_header: str, cart_summary: str, discount_percent: float, recs_summary: str,
+                   tone: str, approach: str, style: str, extra_requirements: Tuple[str, ...] = ()) -> str:
+    """Cart recovery prompt text shared by live generation and the offline copy library"""
+    extra = ''.join(f"\n- {requirement}" for requirement in extra_requirements)
+    # Less prescriptive prompt - lets Groq be more creative
+    return f"""
+Write a personalized cart recovery email for {user_name}.
+
+{cart_header}
+{cart_summary}
+
+Special offer: {discount_percent}% discount
+
+Suggested complementary products:
+{recs_summary}
+
+Tone: {tone}
+Approach: {approach}
+Style: {style}
+
+Requirements:
+- Mention 1-2 cart items by name naturally in conversation
+- Work in the {discount_percent}% discount smoothly (don't make it the only focus)
+- Suggest how 1-2 recommended products complement their selections
+- Create subtle urgency through scarcity or time sensitivity
+- Keep under 150 words
+- No signatures, closings, or "Best regards" type phrases
+- Optional: 1-2 tasteful emojis for personality{extra}
+
+{_PROMPT_CLOSING}
+"""
+
+
+def _compose_batch_prompt(section_ids: List[str], prompts: List[str]) -> str:
+    """Combine single-cart prompts into one request for a JSON object of email bodies"""
+    briefs = "\n".join(
+        f"=== {section_id} ===\n{prompt.strip().removesuffix(_PROMPT_CLOSING).strip()}\n"
+        for section_id, prompt in zip(section_ids, prompts)
+    )
+    return f"""
+Write {len(prompts)} separate cart recovery emails, one for each brief below.
+Each email follows only its own brief and never mentions the other customers.
+
+{briefs}
+Reply with a JSON object mapping each brief id to its email body, e.g.
+{{"{section_ids[0]}": "email body", "{section_ids[1]}": "email body"}}
+"""
+
+
+def _parse_batch_sections(content: Optional[str]) -> Dict[str, str]:
+    """Parse a batched JSON response into {brief id: email body} (empty if unparseable)"""
+    content = (content or '').strip()
+    # Tolerate code fences or chatter around the JSON object
+    start, end = content.find('{'), content.rfind('}')
+    if start == -1 or end < start:
+        return {}
+    try:
+        sections = json.loads(content[start:end + 1])
+    except ValueError:
+        return {}
+    if not isinstance(sections, dict):
+        return {}
+    return {str(key): value for key, value in sections.items()}
+
+
+_GROQ_SYSTEM_PROMPT = "You are a creative marketing assistant writing personalized cart abandonment emails. Be warm, conversational, and exciting without being pushy. Vary your writing style and avoid repetitive patterns."
+
+# Signatures/closings the AI sometimes adds despite the prompt
+_SIGNATURE_PATTERNS = [re.compile(pattern, re.IGNORECASE | re.DOTALL) for pattern in [
+    r'Best,.*?(?:\n|$)',  # Match "Best," followed by anything until newline or end
+    r'Sincerely,.*?(?:\n|$)',
+    r'Regards,.*?(?:\n|$)',
+    r'Cheers,.*?(?:\n|$)',
+    r'Thanks,.*?(?:\n|$)',
+    r'\[Your Name\]',  # Match the placeholder exactly
+    r'Best wishes,.*?(?:\n|$)',
+    r'Warm regards,.*?(?:\n|$)',
+    r'Kind regards,.*?(?:\n|$)',
+    r'Best regards,.*?(?:\n|$)',
+    r'Yours sincerely,.*?(?:\n|$)',
+    r'Yours truly,.*?(?:\n|$)',
+    r'With best regards,.*?(?:\n|$)',
+]]
+
+
+def _stream_rows(cursor, chunk_size: int) -> Iterator[Dict]:
+    """Yield rows from an executed cursor, fetching chunk_size at a time"""
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            return
+        yield from rows
+
+
 class RecommendationEngine:
     """
     Generates product recommendations using TF-IDF and Cosine Similarity
     Enhanced with Groq AI for personalized descriptions
     """
     
+    _EMPTY_STORE = ProductStore().freeze()
+    
     def __init__(self):
-        # Lazy import - only load sklearn when needed (during load_products)
-        self.vectorizer = None
-        self.products_cache = []
-        self.tfidf_matrix = None
+        # Current immutable index (store + vectorizer + TF-IDF matrix).
+        # Rebuilds publish a new one with a single reference swap, so readers never block.
+        # sklearn is only imported when an index is built.
+        self._index: Optional[RecommendationIndex] = None
+        self._last_index_version = 0
+        self._index_version_lock = threading.Lock()
+        self._index_builder = BackgroundIndexBuilder(self.load_products)
+        
+        # Products edited or deleted after the current index read its rows (product id -> time.monotonic()).
+        # They are left out of recommendations until a build that read them after the change is published.
+        self._changed_products: Dict[int, float] = {}
+        self._changed_products_lock = threading.Lock()
+        
+        # Recommendation lists keyed by (cart hash, index version)
+        self.recommendation_cache = RecommendationCache(
+            max_entries=config.RECOMMENDATION_CACHE_SIZE,
+            ttl_seconds=config.RECOMMENDATION_CACHE_TTL_SECONDS
+        )
         
-        # Initialize stemmer
-        self.stemmer = PorterStemmer()
+        # Item-item co-purchase model from order_items (blended with TF-IDF)
+        self.copurchase_model = CoPurchaseModel()
+        
+        # Sanitized Groq copy reused for identical prompt signatures
+        self.copy_cache = LLMCopyCache(
+            max_entries=config.LLM_COPY_CACHE_SIZE,
+            ttl_seconds=config.LLM_COPY_CACHE_TTL_SECONDS,
+            max_reuse=config.LLM_COPY_MAX_REUSE,
+            connection_factory=DatabaseConnection.get_connection if config.LLM_COPY_CACHE_PERSIST else None
+        )
+        
+        # Pre-generated copy filled at send time (EMAIL_COPY_MODE = 'library')
+        self.copy_library = CopyLibrary(
+            DatabaseConnection.get_connection,
+            refresh_seconds=config.COPY_LIBRARY_REFRESH_SECONDS
+        )
+        
+        # Shared token -> stem cache, so rebuilds only stem tokens that are new
+        self.stem_cache = shared_stem_cache()
+        self.stemmer = self.stem_cache.stemmer
         logger.info("Porter Stemmer initialized for text preprocessing")
         
-        # Initialize Groq AI
-        if config.GROQ_API_KEY:
-            self.groq_client = OpenAI(
-                api_key=config.GROQ_API_KEY,
-                base_url=config.GROQ_BASE_URL
-            )
-            logger.info("Groq AI initialized successfully")
+        # Initialize Groq AI (plus any other LLM_PROVIDERS endpoints, routed by latency)
+        self.provider_pool = ProviderPool.from_config()
+        if self.provider_pool:
+            # The primary client; the pool picks the endpoint for each request
+            self.groq_client = self.provider_pool.primary.client
+            self.provider_pool.start_health_checks()
+            names = ', '.join(provider.name for provider in self.provider_pool.providers)
+            logger.info(f"Groq AI initialized successfully (providers: {names})")
         else:
             self.groq_client = None
             logger.warning("Groq API key not found - AI features disabled")
+        
+        # Client-side limits matched to Groq's RPM/TPM, shared by all concurrent carts
+        self.groq_request_limiter = TokenBucket.per_minute(config.GROQ_REQUESTS_PER_MINUTE, config.GROQ_RATE_LIMIT_BURST_SECONDS)
+        self.groq_token_limiter = TokenBucket.per_minute(config.GROQ_TOKENS_PER_MINUTE, config.GROQ_RATE_LIMIT_BURST_SECONDS)
+        
+        # Deadlines, circuit breaker and hedging around Groq calls (see llm_health)
+        self.groq_breaker = CircuitBreaker(
+            'groq',
+            failure_threshold=config.GROQ_BREAKER_FAILURE_THRESHOLD,
+            reset_timeout=config.GROQ_BREAKER_RESET_SECONDS
+        )
+        self.groq_timeouts = 0
+        self.groq_hedged = 0
+        self.groq_late_completions = 0
+        self.groq_batches = 0
+        self.groq_batch_fallbacks = 0
+        
+        # Per-call accounting: JSON in llm_health, Prometheus text at /metrics
+        self.llm_metrics = MetricsRegistry(prefix='cart_recovery_')
+        self.groq_latency = self.llm_metrics.histogram('llm_request_seconds', 'Groq chat-completion latency')
+        self.llm_metrics.histogram('llm_queue_wait_seconds', 'Time a Groq call waited on the RPM/TPM limiters')
+        self.llm_metrics.histogram('llm_prompt_tokens', 'Prompt tokens per Groq call (response.usage)', DEFAULT_TOKEN_BUCKETS, unit='tokens')
+        self.llm_metrics.histogram('llm_completion_tokens', 'Completion tokens per Groq call (response.usage)', DEFAULT_TOKEN_BUCKETS, unit='tokens')
+        self.llm_metrics.histogram('llm_first_token_seconds', 'Time to the first streamed token (GROQ_STREAM)')
+        self.llm_metrics.histogram('email_slot_wait_seconds', 'Time a cart waited for one of the LLM_MAX_CONCURRENCY slots')
+        for name, help_text in (
+            ('llm_requests_total', 'Groq calls by outcome'),
+            ('llm_tokens_total', 'Tokens billed by Groq, by kind'),
+            ('llm_cost_usd_total', 'Estimated Groq spend from token usage'),
+            ('llm_finish_reasons_total', 'Completion finish reasons (length = hit GROQ_MAX_TOKENS)'),
+            ('llm_sanitizer_hits_total', 'Unsafe content removed from AI copy, by kind'),
+            ('llm_signature_strips_total', 'Signatures/closings stripped from AI copy'),
+            ('llm_fallbacks_total', 'Emails sent with fallback copy, by reason'),
+            ('llm_copy_source_total', 'Where each email body came from'),
+            ('llm_stream_cutoffs_total', 'Streams closed early because the copy was complete, by reason'),
+        ):
+            self.llm_metrics.counter(name, help_text)
     
     def sanitize_text(self, text: str, content_type: str = "product") -> str:
         """
@@ -97,6 +319,9 @@ class RecommendationEngine:
         - Prevents model errors caused by dirty or malicious input
         - Builds trust and reliability in automated emails and recommendations
         
+        The precompiled implementation lives in sanitizer.py; use
+        sanitize_many there for batches (index builds).
+        
         Args:
             text: Input text to sanitize
             content_type: Type of content - "product" or "email"
@@ -104,83 +329,7 @@ class RecommendationEngine:
         Returns:
             Sanitized text
         """
-        if not text:
-            return ""
-        
-        original_text = text
-        s = text
-        
-        # 1. Remove HTML tags
-        s = re.sub(r'<[^>]+>', ' ', s)
-        
-        # 2. Remove PII and identifiers
-        # Remove emails
-        s = re.sub(r'\b[\w\.-]+@[\w\.-]+\.\w{2,}\b', '[EMAIL_REMOVED]', s)
-        
-        # Remove URLs
-        s = re.sub(r'https?://\S+|www\.\S+', '[URL_REMOVED]', s)
-        
-        # Remove UUIDs
-        s = re.sub(r'\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b', '[ID_REMOVED]', s)
-        
-        # Remove user-like tokens: user123, uid_456, id:1234
-        s = re.sub(r'\b(?:user|uid|id|account)[_\-:]?\d+\b', '[USER_ID_REMOVED]', s, flags=re.IGNORECASE)
-        
-        # Remove long numeric sequences (likely phone numbers or IDs)
-        s = re.sub(r'\b\d{4,}\b', '[NUMBER_REMOVED]', s)
-        
-        # Remove @mentions and hashtags
-        s = re.sub(r'[@#]\w+', '', s)
-        
-        # 3. For email content, remove offensive/manipulative words
-        if content_type == "email":
-            offensive_words = [
-                r'\bregret\b', r'\bfailure\b', r'\bshame\b', r'\bstupid\b',
-                r'\bidiot\b', r'\bloser\b', r'\bpathetic\b', r'\bworthless\b',
-                r'\bmissing out\b', r'\bfomo\b', r'\blast chance\b',
-                r'\bact now or never\b', r'\bdon\'t be a fool\b',
-                r'\byou\'ll regret\b', r'\bwhat\'s wrong with you\b'
-            ]
-            
-            for pattern in offensive_words:
-                s = re.sub(pattern, '', s, flags=re.IGNORECASE)
-        
-        # 4. Remove special characters (keep alphanumeric, spaces, and basic punctuation)
-        if content_type == "product":
-            # For products, be more aggressive - remove all special chars
-            s = re.sub(r'[^a-zA-Z0-9\s]', ' ', s)
-        else:
-            # For emails, keep basic punctuation and percentage symbol
-            s = re.sub(r'[^\w\s\.,!?\-\'%$]', ' ', s)
-        
-        # 5. Collapse multiple spaces
-        s = re.sub(r'\s+', ' ', s).strip()
-        
-        # 6. Convert to lowercase (for products only, preserve case for emails)
-        if content_type == "product":
-            s = s.lower()
-        
-        # 7. Log sanitization for auditing
-        if original_text != s:
-            changes_made = []
-            if '[EMAIL_REMOVED]' in s:
-                changes_made.append('email')
-            if '[URL_REMOVED]' in s:
-                changes_made.append('url')
-            if '[ID_REMOVED]' in s or '[USER_ID_REMOVED]' in s or '[NUMBER_REMOVED]' in s:
-                changes_made.append('identifiers')
-            if re.search(r'<[^>]+>', original_text):
-                changes_made.append('html_tags')
-            
-            logger.info(f"[SAFE_SANITIZER] {content_type.upper()} text sanitized. Removed: {', '.join(changes_made) if changes_made else 'special_chars'}")
-            logger.debug(f"[SAFE_SANITIZER] Original length: {len(original_text)}, Sanitized length: {len(s)}")
-        
-        # Remove placeholder markers for product descriptions
-        if content_type == "product":
-            s = s.replace('[email_removed]', '').replace('[url_removed]', '').replace('[id_removed]', '').replace('[user_id_removed]', '').replace('[number_removed]', '')
-            s = re.sub(r'\s+', ' ', s).strip()
-        
-        return s
+        return sanitize_text(text, content_type)
     
     def stem_text(self, text: str) -> str:
         """
@@ -193,79 +342,312 @@ class RecommendationEngine:
         Returns:
             Stemmed text
         """
-        # Convert to lowercase and remove special characters
-        text = re.sub(r'[^a-zA-Z0-9\s]', ' ', text.lower())
+        # Lowercase, split on special characters, and stem each word through the shared cache
+        return self.stem_cache.stem_tokens([tokenize(text)])[0]
+    
+    @property
+    def index(self) -> Optional[RecommendationIndex]:
+        """The index currently serving recommendations (None until the first build)"""
+        return self._index
+    
+    @property
+    def product_store(self) -> ProductStore:
+        index = self._index
+        return index.store if index else self._EMPTY_STORE
+    
+    @property
+    def vectorizer(self):
+        index = self._index
+        return index.vectorizer if index else None
+    
+    @property
+    def tfidf_matrix(self):
+        index = self._index
+        return index.tfidf_matrix if index else None
+    
+    @property
+    def index_version(self) -> int:
+        index = self._index
+        return index.version if index else 0
+    
+    def start_background_rebuild(self) -> bool:
+        """
+        Rebuild the index on a background thread (no-op if one is already running)
         
-        # Tokenize and stem each word
-        words = text.split()
-        stemmed_words = [self.stemmer.stem(word) for word in words if word]
+        Returns:
+            True if a new build was started
+        """
+        started = self._index_builder.start()
+        if started:
+            logger.info("Started background recommendation index build")
+        return started
+    
+    def ensure_index_fresh(self) -> bool:
+        """Schedule a background rebuild if there is no index or it is older than the rebuild interval"""
+        index = self._index
+        if index is None or index.age_seconds() >= config.INDEX_REBUILD_INTERVAL_SECONDS:
+            return self.start_background_rebuild()
+        return False
+    
+    def product_changed(self, product_id: int):
+        """
+        Take an edited or deleted product out of recommendations and rebuild the index
         
-        return ' '.join(stemmed_words)
+        The current index still holds the old name, price and stock (or the
+        deleted row), so the product is skipped until a build that read its
+        rows after this call has been published.
+        """
+        with self._changed_products_lock:
+            self._changed_products[product_id] = time.monotonic()
+        if self._index_builder.start(rerun=True):
+            logger.info(f"Started background recommendation index build after product {product_id} changed")
+        else:
+            logger.info(f"Product {product_id} changed - index rebuild queued behind the running build")
+    
+    def _release_changed_products(self, rows_read_at: float):
+        """Recommend changed products again once an index read after the change is published"""
+        with self._changed_products_lock:
+            self._changed_products = {
+                product_id: changed_at for product_id, changed_at in self._changed_products.items()
+                if changed_at >= rows_read_at
+            }
+    
+    def _without_changed_products(self, recommendations: List[ProductView]) -> List[ProductView]:
+        """Drop products whose indexed row is out of date (see product_changed)"""
+        changed = self._changed_products
+        if not changed:
+            return recommendations
+        return [product for product in recommendations if product['id'] not in changed]
+    
+    def wait_until_ready(self, timeout: Optional[float] = None) -> bool:
+        """Block until the first build has finished (warm-up only, never on the request path)"""
+        return self._index is not None or self._index_builder.wait(timeout)
+    
+    def index_stats(self) -> Dict:
+        """Return index build duration, staleness and builder state"""
+        index = self._index
+        stats = {
+            'version': index.version if index else None,
+            'products': len(index.store) if index else 0,
+            'build_seconds': index.build_seconds if index else None,
+            'age_seconds': index.age_seconds() if index else None,
+            'rebuild_interval_seconds': config.INDEX_REBUILD_INTERVAL_SECONDS,
+        }
+        stats.update(self._index_builder.stats())
+        return stats
     
     def load_products(self):
         """Load all products from database and build TF-IDF matrix"""
+        # Hashing mode streams rows through a server-side cursor instead of fetching the whole catalog
+        streaming = config.RECOMMENDATION_VECTORIZER == 'hashing'
+        # Product changes after this point are not guaranteed to be in the rows read below
+        rows_read_at = time.monotonic()
         try:
-            # Lazy import sklearn only when needed
-            from sklearn.feature_extraction.text import TfidfVectorizer
-            
-            conn = DatabaseConnection.get_connection()
+            conn = DatabaseConnection.get_connection(server_side=streaming)
             cursor = conn.cursor()
             
-            cursor.execute("""
-                SELECT id, name, description, price, category, image, stock
-                FROM products
-                WHERE stock > 0
-                ORDER BY created_at DESC
-            """)
+            try:
+                # products.search_text holds preprocessed text (migrations/add_search_text_to_products.py)
+                cursor.execute("SHOW COLUMNS FROM products LIKE 'search_text'")
+                has_search_text = bool(cursor.fetchall())
+                
+                if has_search_text:
+                    # Current search_text makes the full description unnecessary (only a preview is kept)
+                    cursor.execute(f"""
+                        SELECT id, name, price, category, image, stock,
+                               CASE WHEN search_text_version = %s
+                                    THEN LEFT(description, {DESCRIPTION_PREVIEW_CHARS + 1})
+                                    ELSE description END AS description,
+                               CASE WHEN search_text_version = %s THEN search_text END AS search_text
+                        FROM products
+                        WHERE stock > 0
+                        ORDER BY created_at DESC
+                    """, (SEARCH_TEXT_VERSION, SEARCH_TEXT_VERSION))
+                else:
+                    cursor.execute("""
+                        SELECT id, name, description, price, category, image, stock
+                        FROM products
+                        WHERE stock > 0
+                        ORDER BY created_at DESC
+                    """)
+                
+                if streaming:
+                    index = self.build_index(_stream_rows(cursor, config.STREAM_CHUNK_SIZE))
+                else:
+                    index = self.build_index(cursor.fetchall())
+            finally:
+                cursor.close()
+                conn.close()
             
-            self.products_cache = cursor.fetchall()
-            cursor.close()
-            conn.close()
+            self._release_changed_products(rows_read_at)
             
-            if not self.products_cache:
+            if not index.store:
                 logger.warning("No products found in database")
                 return
             
-            # Build TF-IDF matrix from product descriptions, names, and categories
-            # Handle cases where description might be NULL or empty
-            product_texts = []
-            sanitized_count = 0
-            for p in self.products_cache:
-                desc = p.get('description') or ''
-                cat = p.get('category') or 'general'
-                name = p.get('name') or ''
-                # Repeat category 4x and name 3x to SIGNIFICANTLY boost their TF-IDF importance
-                # This ensures category gets very high weight and reduces false positives from word coincidences
-                text = f"{name} {name} {name} {cat} {cat} {cat} {cat} {desc}"
-                
-                # SAFE SANITIZER: Clean product text before stemming and TF-IDF
-                # Step 1: Sanitize (remove HTML, PII, special chars)
-                sanitized_text = self.sanitize_text(text, content_type="product")
-                if sanitized_text != text.lower().strip():
-                    sanitized_count += 1
-                
-                # Step 2: Apply stemming to normalized word forms
-                stemmed_text = self.stem_text(sanitized_text)
-                product_texts.append(stemmed_text)
+            self.refresh_copurchase()
+            
+        except Exception as e:
+            logger.error(f"Error loading products: {e}")
+            raise
+    
+    def refresh_copurchase(self) -> int:
+        """
+        Fold orders placed since the last refresh into the co-purchase model
+        
+        Returns:
+            Number of new orders added
+        """
+        if not config.COPURCHASE_ENABLED:
+            return 0
+        
+        try:
+            added = self.copurchase_model.refresh_from_db(DatabaseConnection.get_connection)
+        except Exception as e:
+            logger.error(f"Error refreshing co-purchase model: {e}")
+            return 0
+        
+        if added:
+            # Blended scores changed, so cached rankings are stale
+            self.recommendation_cache.clear()
+        return added
+    
+    def build_index(self, rows: Iterable[Dict]) -> RecommendationIndex:
+        """
+        Build a new index from product rows and publish it
+        
+        The new store and matrix are built off to the side; the engine only
+        switches to them (one reference assignment) once they are complete.
+        With RECOMMENDATION_VECTORIZER = 'hashing' rows are consumed in
+        chunks, so they can come straight from a server-side cursor.
+        
+        Args:
+            rows: Product rows (id, name, description, price, category, image, stock)
+            
+        Returns:
+            The newly published index (empty if there were no rows, so an
+            empty catalog waits for the rebuild interval like any other)
+        """
+        build_start = time.perf_counter()
+        
+        # Build TF-IDF matrix from product descriptions, names, and categories
+        # Full rows are only needed here; the engine keeps a compact column store
+        store = ProductStore()
+        text_chunks = self._product_text_chunks(store, rows, config.STREAM_CHUNK_SIZE)
+        
+        if config.RECOMMENDATION_VECTORIZER == 'hashing':
+            # No vocabulary dict and no full text list: chunks are hashed as they arrive
+            vectorizer = StreamingHashingVectorizer(
+                n_features=config.HASHING_N_FEATURES,
+                stop_words='english',
+                max_df=0.9,
+                ngram_range=(1, 2)
+            )
+            tfidf_matrix = vectorizer.fit_transform_chunks(text_chunks)
+            if not len(store):
+                return self._publish_index(self._EMPTY_STORE, None, None, build_start)
+        else:
+            # Lazy import sklearn only when needed
+            from sklearn.feature_extraction.text import TfidfVectorizer
             
-            logger.info(f"[SAFE_SANITIZER] Sanitized {sanitized_count}/{len(product_texts)} product descriptions")
-            logger.info(f"Applied stemming to {len(product_texts)} product descriptions")
+            product_texts = [text for chunk in text_chunks for text in chunk]
+            if not product_texts:
+                return self._publish_index(self._EMPTY_STORE, None, None, build_start)
             
             # Use min_df=1 to include all terms, even if they appear in only one document
-            self.vectorizer = TfidfVectorizer(
+            vectorizer = TfidfVectorizer(
                 stop_words='english',
                 min_df=1,
                 max_df=0.9,
                 ngram_range=(1, 2)  # Use both single words and bigrams
             )
-            self.tfidf_matrix = self.vectorizer.fit_transform(product_texts)
-            logger.info(f"Loaded {len(self.products_cache)} products for recommendations")
+            tfidf_matrix = vectorizer.fit_transform(product_texts)
+        store.freeze()
+        
+        # Per-category shards + cross-category side index (score ~1/#categories of the catalog per item)
+        shards = None
+        if config.CATEGORY_SHARDING_ENABLED:
+            shards = CategoryShards(store, tfidf_matrix, min_cross_similarity=config.CROSS_CATEGORY_MIN_SIMILARITY)
+        
+        return self._publish_index(store, vectorizer, tfidf_matrix, build_start, shards)
+    
+    def _publish_index(self, store: ProductStore, vectorizer, tfidf_matrix, build_start: float, shards=None) -> RecommendationIndex:
+        """Version a finished index and swap it in for readers"""
+        with self._index_version_lock:
+            self._last_index_version += 1
+            version = self._last_index_version
+        index = RecommendationIndex(store, vectorizer, tfidf_matrix, version, time.perf_counter() - build_start, shards)
+        
+        # Atomic hot-swap: readers pick up the new index on their next call
+        self._index = index
+        
+        # Cached recommendations were computed against the old index
+        self.recommendation_cache.clear()
+        logger.info(f"Loaded {len(index.store)} products for recommendations (index version {version}, built in {index.build_seconds:.2f}s)")
+        return index
+    
+    def _product_text_chunks(self, store: ProductStore, rows: Iterable[Dict], chunk_size: int) -> Iterator[List[str]]:
+        """
+        Add rows to the store and yield their preprocessed text, chunk_size products at a time
+        
+        Stored search_text is used as is; everything else goes through the
+        sanitizer and the stem cache in one batch per chunk.
+        """
+        stats = {'products': 0, 'preprocessed': 0, 'sanitized': 0}
+        chunk = []
+        for p in rows:
+            chunk.append(p)
+            if len(chunk) >= chunk_size:
+                yield self._preprocess_chunk(store, chunk, stats)
+                chunk = []
+        if chunk:
+            yield self._preprocess_chunk(store, chunk, stats)
+        
+        if stats['preprocessed']:
+            if config.STEM_TABLE_PATH:
+                self.stem_cache.save(config.STEM_TABLE_PATH)
+            logger.info(f"[SAFE_SANITIZER] Sanitized {stats['sanitized']}/{stats['preprocessed']} product descriptions")
+            logger.info(f"Applied stemming to {stats['preprocessed']} product descriptions (stem cache: {self.stem_cache.stats()})")
+        logger.info(f"Used stored search_text for {stats['products'] - stats['preprocessed']}/{stats['products']} products")
+    
+    def _preprocess_chunk(self, store: ProductStore, rows: List[Dict], stats: Dict) -> List[str]:
+        """Preprocessed text for one chunk of product rows (see _product_text_chunks)"""
+        product_texts = []
+        pending = []  # (position, raw text) of products without current stored search_text
+        for p in rows:
+            store.add(p)
+            search_text = p.get('search_text')
+            if search_text is not None:
+                # Already sanitized and stemmed when the product was written
+                product_texts.append(search_text)
+                continue
+            # Handle cases where description might be NULL or empty
+            desc = p.get('description') or ''
+            cat = p.get('category') or 'general'
+            name = p.get('name') or ''
+            pending.append((len(product_texts), build_product_text(name, cat, desc)))
+            product_texts.append(None)
+        
+        if pending:
+            raw_texts = [text for _, text in pending]
+            
+            # SAFE SANITIZER: Clean product text before stemming and TF-IDF
+            # Step 1: Sanitize in one batch (remove HTML, PII, special chars)
+            sanitized_texts = sanitize_many(raw_texts, content_type="product")
+            stats['sanitized'] += sum(
+                1 for text, sanitized_text in zip(raw_texts, sanitized_texts)
+                if sanitized_text != text.lower().strip()
+            )
             
-        except Exception as e:
-            logger.error(f"Error loading products: {e}")
-            raise
+            # Step 2: Apply stemming to normalized word forms (each unique token is stemmed once)
+            for (position, _), stemmed_text in zip(pending, stem_many(sanitized_texts, self.stem_cache)):
+                product_texts[position] = stemmed_text
+        
+        stats['products'] += len(rows)
+        stats['preprocessed'] += len(pending)
+        return product_texts
     
-    def get_similar_products(self, cart_items: List[Dict], count: int = 3) -> List[Dict]:
+    def get_similar_products(self, cart_items: List[Dict], count: int = 3, cart_hash: Optional[str] = None) -> List[ProductView]:
         """
         Find similar products based on cart items using PER-ITEM TF-IDF + Cosine Similarity
         
@@ -277,16 +659,34 @@ class RecommendationEngine:
         Args:
             cart_items: List of items currently in cart
             count: Number of recommendations to return
+            cart_hash: Precomputed cart contents hash (computed if omitted)
             
         Returns:
-            List of recommended products with similarity scores
+            List of recommended product views with similarity scores
         """
-        if not self.products_cache or self.tfidf_matrix is None:
-            self.load_products()
+        # Use one index snapshot for the whole call, even if a rebuild swaps in a new one
+        index = self._index
+        if index is None:
+            # Never build inline: start a background build and recommend nothing this time
+            self.start_background_rebuild()
+            logger.warning("Recommendation index is not built yet - skipping recommendations")
+            return []
         
-        if not self.products_cache:
+        store = index.store
+        if not store:
             return []
         
+        # Identical carts (popular bundles, retries) reuse the cached ranking
+        cache_key = RecommendationCache.make_key(
+            cart_hash or generate_cart_hash(cart_items),
+            index.version,
+            count
+        )
+        cached = self.recommendation_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"Using cached recommendations for cart {cache_key[0][:8]}... ({len(cached)} products)")
+            return self._without_changed_products(cached)
+        
         try:
             # Lazy import sklearn only when needed
             from sklearn.metrics.pairwise import cosine_similarity
@@ -294,53 +694,73 @@ class RecommendationEngine:
             # Get cart product IDs to exclude from recommendations
             cart_product_ids = {item['product_id'] for item in cart_items}
             
+            # Weight of the co-purchase score in the blended ranking (0 = TF-IDF only)
+            blend_weight = config.COPURCHASE_BLEND_WEIGHT if config.COPURCHASE_ENABLED else 0.0
+            
             # NEW: Generate recommendations PER cart item (not averaged)
-            all_recommendations = {}  # product_id -> (product, max_score, source_item)
+            all_recommendations = {}  # product_id -> (row, max_score, source_item, source_category)
+            
+            # Repeat category 4x and name 3x for better matching
+            item_texts = [
+                build_product_text(cart_item.get('name', ''), cart_item.get('category', ''), cart_item.get('description', ''))
+                for cart_item in cart_items
+            ]
+            
+            # SAFE SANITIZER: Clean cart item text (same pipeline as products), whole cart in one batch
+            sanitized_item_texts = sanitize_many(item_texts, content_type="product")
             
-            for cart_item in cart_items:
+            # Apply stemming to cart items (same as products)
+            stemmed_item_texts = stem_many(sanitized_item_texts, self.stem_cache)
+            
+            for cart_item, stemmed_item_text in zip(cart_items, stemmed_item_texts):
                 # Build query for THIS specific cart item
-                name = cart_item.get('name', '')
                 cat = cart_item.get('category', '')
-                desc = cart_item.get('description', '')
                 
-                # Repeat category 4x and name 3x for better matching
-                item_text = f"{name} {name} {name} {cat} {cat} {cat} {cat} {desc}"
+                # Transform to TF-IDF vector
+                item_vector = index.vectorizer.transform([stemmed_item_text])
                 
-                # SAFE SANITIZER: Clean cart item text (same pipeline as products)
-                # Step 1: Sanitize
-                sanitized_item_text = self.sanitize_text(item_text, content_type="product")
+                # Get category of current cart item
+                cart_item_category = normalize_category(cat)
                 
-                # Step 2: Apply stemming to cart item (same as products)
-                stemmed_item_text = self.stem_text(sanitized_item_text)
+                # Calculate similarity for this specific item (own category shard when possible)
+                scored_rows, item_similarities = self._score_item(index, item_vector, cart_item, cart_item_category)
                 
-                # Transform to TF-IDF vector
-                item_vector = self.vectorizer.transform([stemmed_item_text])
+                # Precomputed co-purchase neighbours of this item (dict lookup, no matrix work)
+                cf_scores = {}
+                if blend_weight > 0 and 'product_id' in cart_item:
+                    neighbor_ids, neighbor_scores = self.copurchase_model.similar(cart_item['product_id'])
+                    cf_scores = dict(zip(neighbor_ids.tolist(), neighbor_scores.tolist()))
                 
-                # Calculate similarity for this specific item
-                item_similarities = cosine_similarity(item_vector, self.tfidf_matrix)[0]
+                # Find top matches for THIS item
+                top = np.argsort(item_similarities)[::-1][:count * 2]  # Get extra candidates
+                candidates = dict(zip(scored_rows[top].tolist(), item_similarities[top].tolist()))
                 
-                # Get category of current cart item
-                cart_item_category = (cat or '').strip().lower()
+                # Co-purchase neighbours outside the top text matches still get scored
+                extra_rows = [row for row in map(store.row_of, cf_scores) if row is not None and row not in candidates]
+                if extra_rows:
+                    extra_similarities = cosine_similarity(item_vector, index.tfidf_matrix[extra_rows])[0]
+                    candidates.update(zip(extra_rows, extra_similarities.tolist()))
                 
-                # Find top matches for THIS item
-                for idx in np.argsort(item_similarities)[::-1][:count * 2]:  # Get extra candidates
-                    product = self.products_cache[idx]
-                    product_id = product['id']
+                for idx, similarity_score in candidates.items():
+                    product_id = int(store.ids[idx])
                     
                     # Skip if already in cart
                     if product_id in cart_product_ids:
                         continue
                     
-                    product_cat = (product.get('category') or '').strip().lower()
-                    similarity_score = item_similarities[idx]
+                    product_cat = store.category_of(idx)
+                    cf_score = cf_scores.get(product_id)
                     
                     # STRONG CATEGORY FILTERING: Only recommend same-category products
                     # This prevents iPhone recommendations for laptop carts!
                     if cart_item_category and product_cat:
                         if cart_item_category != product_cat:
                             # Different category - skip unless very high similarity
-                            if similarity_score < 0.5:  # Much stricter threshold
-                                continue
+                            if similarity_score < config.CROSS_CATEGORY_MIN_SIMILARITY:  # Much stricter threshold
+                                if cf_score is None:
+                                    continue
+                                # Actually bought together: rank on co-purchase strength alone
+                                similarity_score = 0.0
                             else:
                                 # Penalize cross-category matches heavily
                                 similarity_score *= 0.3
@@ -349,9 +769,14 @@ class RecommendationEngine:
                     if cart_item_category and product_cat == cart_item_category:
                         similarity_score *= 1.5  # 50% boost for exact category match
                     
+                    # Blend text similarity with co-purchase score (0 when never bought together), for every
+                    # candidate, so all cart items rank on one scale whether or not they have order history
+                    if blend_weight:
+                        similarity_score = (1 - blend_weight) * similarity_score + blend_weight * (cf_score or 0.0)
+                    
                     # Track best score for each product
                     if product_id not in all_recommendations or similarity_score > all_recommendations[product_id][1]:
-                        all_recommendations[product_id] = (product, similarity_score, cart_item.get('name', 'Unknown'), cart_item_category)
+                        all_recommendations[product_id] = (idx, similarity_score, cart_item.get('name', 'Unknown'), cart_item_category)
             
             # TOP RECOMMENDATIONS: Get products with highest cosine similarity scores
             # Sort all recommendations by similarity score (descending)
@@ -365,35 +790,22 @@ class RecommendationEngine:
             
             # Build recommendation list with top N highest scores
             recommendations = []
-            for product_id, (product, similarity_score, source_item, source_category) in sorted_recommendations[:count]:
-                product_copy = product.copy()
-                product_copy['similarity_score'] = float(similarity_score)
-                product_copy['recommended_because_of'] = source_item
-                product_copy['url'] = f"{config.BASE_URL}/product/{product['id']}"
-                recommendations.append(product_copy)
-                logger.info(f"  - {product['name'][:40]:40s} (score: {similarity_score:.4f}, source: {source_item[:30]})")
+            for product_id, (idx, similarity_score, source_item, source_category) in sorted_recommendations[:count]:
+                recommendations.append(store.view(idx, similarity_score, source_item))
+                logger.info(f"  - {store.names[idx][:40]:40s} (score: {similarity_score:.4f}, source: {source_item[:30]})")
             
             # If we don't have enough recommendations, add category-matched products
             if len(recommendations) < count:
                 logger.info(f"Only found {len(recommendations)} similar products, adding category-matched products")
                 
                 # Get all categories from cart
-                cart_categories = {(item.get('category') or '').strip().lower() for item in cart_items if item.get('category')}
+                cart_categories = {normalize_category(item.get('category')) for item in cart_items if item.get('category')}
                 
-                for product in self.products_cache:
-                    if product['id'] not in cart_product_ids and product['id'] not in all_recommendations:
-                        product_cat = (product.get('category') or '').strip().lower()
-                        
-                        # Add if same category as any cart item
-                        if product_cat in cart_categories:
-                            product_copy = product.copy()
-                            product_copy['similarity_score'] = 0.3  # Lower score for category-only match
-                            product_copy['recommended_because_of'] = f"Same category ({product_cat})"
-                            product_copy['url'] = f"{config.BASE_URL}/product/{product['id']}"
-                            recommendations.append(product_copy)
-                            
-                            if len(recommendations) >= count:
-                                break
+                # Vectorized scan: same-category products not in cart and not already scored
+                excluded_ids = cart_product_ids | set(all_recommendations)
+                for idx in store.rows_excluding(excluded_ids, cart_categories)[:count - len(recommendations)]:
+                    # Lower score for category-only match
+                    recommendations.append(store.view(idx, 0.3, f"Same category ({store.category_of(idx)})"))
             
             logger.info(f"Generated {len(recommendations)} recommendations using per-item TF-IDF strategy with balanced categories")
             if recommendations:
@@ -405,27 +817,59 @@ class RecommendationEngine:
                     rec_categories[cat] = rec_categories.get(cat, 0) + 1
                 logger.info(f"Recommendation categories: {rec_categories}")
             
-            return recommendations
+            self.recommendation_cache.put(cache_key, recommendations)
+            return self._without_changed_products(recommendations)
             
         except Exception as e:
             logger.error(f"Error generating recommendations: {e}")
             # Fallback: return first N products not in cart
-            recommendations = []
-            for product in self.products_cache:
-                if product['id'] not in {item['product_id'] for item in cart_items}:
-                    product_copy = product.copy()
-                    product_copy['similarity_score'] = 0.0
-                    product_copy['url'] = f"{config.BASE_URL}/product/{product['id']}"
-                    recommendations.append(product_copy)
-                    if len(recommendations) >= count:
-                        break
+            recommendations = [
+                store.view(idx)
+                for idx in store.rows_excluding(item['product_id'] for item in cart_items)[:count]
+            ]
             logger.info(f"Using fallback recommendations: {len(recommendations)} products")
-            return recommendations
+            return self._without_changed_products(recommendations)
+    
+    def _score_item(self, index: RecommendationIndex, item_vector, cart_item: Dict, cart_item_category: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Cosine similarity of one cart item against the rows it can be recommended from
+        
+        When the item's product is in the index and has a known category, only its
+        category shard, uncategorized products and its precomputed cross-category
+        neighbours are scored; every other product would be dropped by the category
+        filter anyway. Otherwise the whole catalog is scored.
+        
+        Returns:
+            Tuple of (row numbers, similarities)
+        """
+        from sklearn.metrics.pairwise import cosine_similarity
+        
+        store = index.store
+        shards = index.shards
+        row = store.row_of(cart_item['product_id']) if 'product_id' in cart_item else None
+        category_code = store.category_code(cart_item_category) if cart_item_category else None
+        
+        if shards is None or row is None or category_code is None or category_code != store.category_codes[row]:
+            return np.arange(len(store)), cosine_similarity(item_vector, index.tfidf_matrix)[0]
+        
+        rows, similarities = [], []
+        for shard_rows, shard_matrix in shards.candidate_shards(category_code, row):
+            if shard_matrix is None:
+                shard_matrix = index.tfidf_matrix[shard_rows]
+            rows.append(shard_rows)
+            similarities.append(cosine_similarity(item_vector, shard_matrix)[0])
+        return np.concatenate(rows), np.concatenate(similarities)
     
     async def enhance_with_groq(self, recommendations: List[Dict], user_name: str, cart_items: List[Dict], cart_total: float, discount_percent: float) -> str:
         """
         Use Groq AI to create engaging, personalized email content
         
+        In 'library' mode (config.EMAIL_COPY_MODE) pre-generated copy from
+        copy_library.py is filled in instead, and Groq is only called when the
+        library has nothing for this cart. Copy generated for an identical
+        prompt signature (see copy_cache.py) is reused instead of calling Groq
+        again, up to LLM_COPY_MAX_REUSE times.
+        
         Args:
             recommendations: List of recommended products
             user_name: Customer's name
@@ -436,161 +880,528 @@ class RecommendationEngine:
         Returns:
             AI-generated personalized email content
         """
+        library_text = await self._library_copy(recommendations, user_name, cart_items, discount_percent)
+        if library_text:
+            return library_text
+        
         if not self.groq_client:
-            return self._fallback_recommendation_text(recommendations, cart_items)
+            return self._fallback_copy('disabled', recommendations, cart_items)
         
         try:
-            # Build cart items summary
-            cart_summary = "\n".join([
-                f"- {item['name']} (Qty: {item.get('quantity', 1)}) - ${item.get('total', item.get('price', 0)):.2f}"
-                for item in cart_items
-            ])
-            
-            # Sample 1-3 recommendations to highlight (creates variety per email)
-            import random
-            if recommendations:
-                sample_size = min(len(recommendations), random.randint(1, 3))
-                highlighted_recs = random.sample(recommendations, sample_size)
-                recs_summary = "\n".join([
-                    f"- {p['name']}: {p.get('description', 'Great product')[:80]}... (${p['price']:.2f})"
-                    for p in highlighted_recs
-                ])
-            else:
-                recs_summary = "No specific recommendations available"
-            
-            # Randomize prompt structure for variety - injects randomness without hardcoded content
-            tones = [
-                "friendly and enthusiastic",
-                "warm and helpful",
-                "casual and conversational",
-                "excited and upbeat"
-            ]
-            
-            approaches = [
-                "Start by mentioning their cart items, then introduce the discount and recommendations naturally",
-                "Lead with the special discount offer, then highlight what's in their cart and suggested items",
-                "Begin with a warm greeting about their selections, weave in the discount and recommendations organically",
-                "Open with excitement about their cart choices, then present the offer and complementary products"
-            ]
-            
-            style_variations = [
-                "Use short, punchy sentences and varied structure",
-                "Mix longer descriptive sentences with brief action-oriented ones",
-                "Blend questions with statements to create engagement",
-                "Use conversational fragments alongside complete sentences for natural flow"
-            ]
-            
-            tone = random.choice(tones)
-            approach = random.choice(approaches)
-            style = random.choice(style_variations)
-            
-            # Less prescriptive prompt - lets Groq be more creative
-            prompt = f"""
-Write a personalized cart recovery email for {user_name}.
-
-Cart contents (${cart_total:.2f}):
-{cart_summary}
-
-Special offer: {discount_percent}% discount
-
-Suggested complementary products:
-{recs_summary}
-
-Tone: {tone}
-Approach: {approach}
-Style: {style}
-
-Requirements:
-- Mention 1-2 cart items by name naturally in conversation
-- Work in the {discount_percent}% discount smoothly (don't make it the only focus)
-- Suggest how 1-2 recommended products complement their selections
-- Create subtle urgency through scarcity or time sensitivity
-- Keep under 150 words
-- No signatures, closings, or "Best regards" type phrases
-- Optional: 1-2 tasteful emojis for personality
-
-Write the email body now:
-"""
+            prompt, tone, approach, signature = self._build_groq_prompt(recommendations, cart_items, cart_total, discount_percent)
             
-            # Log prompt for debugging with randomization details
-            logger.info(f"Sending prompt to Groq (length: {len(prompt)} chars, tone={tone}, approach={approach[:50]}...)")
-            logger.debug(f"Prompt: {prompt[:500]}...")
-            
-            # Call Groq API with increased diversity parameters to reduce repetition
-            response = await asyncio.to_thread(
-                self.groq_client.chat.completions.create,
-                model=config.GROQ_MODEL,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a creative marketing assistant writing personalized cart abandonment emails. Be warm, conversational, and exciting without being pushy. Vary your writing style and avoid repetitive patterns."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                temperature=0.85,  # Increased from 0.7 for more creativity
-                max_tokens=config.GROQ_MAX_TOKENS,
-                top_p=0.9,
-                presence_penalty=0.4,  # Encourage new topics and varied vocabulary
-                frequency_penalty=0.4  # Discourage repetitive phrases and patterns
-            )
+            cached_text = await self._cached_copy(signature, user_name)
+            if cached_text:
+                return cached_text
             
-            # Extract content from response
-            ai_text = response.choices[0].message.content.strip()
-            
-            logger.info(f"[AI_OUTPUT] Groq generated {len(ai_text)} chars before sanitization")
-            
-            # SAFE SANITIZER: Clean AI-generated email content
-            # This protects users from harmful, manipulative, or offensive content
-            ai_text_original = ai_text
-            ai_text = self.sanitize_text(ai_text, content_type="email")
-            
-            if ai_text != ai_text_original:
-                logger.warning(f"[SAFE_SANITIZER] AI email content was sanitized for safety")
-                logger.debug(f"[SAFE_SANITIZER] Original AI text: {ai_text_original[:200]}...")
-                logger.debug(f"[SAFE_SANITIZER] Sanitized AI text: {ai_text[:200]}...")
-            
-            # Post-processing: Remove any signatures the AI might still add
-            import re
-            signature_patterns = [
-                r'Best,.*?(?:\n|$)',  # Match "Best," followed by anything until newline or end
-                r'Sincerely,.*?(?:\n|$)',
-                r'Regards,.*?(?:\n|$)',
-                r'Cheers,.*?(?:\n|$)',
-                r'Thanks,.*?(?:\n|$)',
-                r'\[Your Name\]',  # Match the placeholder exactly
-                r'Best wishes,.*?(?:\n|$)',
-                r'Warm regards,.*?(?:\n|$)',
-                r'Kind regards,.*?(?:\n|$)',
-                r'Best regards,.*?(?:\n|$)',
-                r'Yours sincerely,.*?(?:\n|$)',
-                r'Yours truly,.*?(?:\n|$)',
-                r'With best regards,.*?(?:\n|$)',
-            ]
+            return await self._generate_copy(prompt, tone, approach, signature, recommendations, user_name, cart_items)
             
-            logger.debug(f"AI text before signature removal: {repr(ai_text)}")
-            for pattern in signature_patterns:
-                before = ai_text
-                ai_text = re.sub(pattern, '', ai_text, flags=re.IGNORECASE | re.DOTALL)
-                if before != ai_text:
-                    logger.info(f"Removed signature with pattern: {pattern}")
+        except Exception as e:
+            logger.error(f"Error generating Groq content: {e}")
+            return self._fallback_copy('error', recommendations, cart_items)
+    
+    async def enhance_many(self, requests: List[Dict]) -> List[str]:
+        """
+        Batched enhance_with_groq for a whole detector cycle
+        
+        Library and cached copy is used first. The remaining carts are sent to
+        Groq LLM_BATCH_SIZE at a time in one JSON-mode completion; any cart
+        whose section is missing or fails validation is generated on its own.
+        
+        Args:
+            requests: enhance_with_groq keyword arguments, one dict per cart
             
-            ai_text = ai_text.strip()
-            logger.debug(f"AI text after signature removal: {repr(ai_text)}")
+        Returns:
+            Email copy for every request, in order
+        """
+        texts: List[Optional[str]] = [None] * len(requests)
+        pending = []
+        for i, request in enumerate(requests):
+            texts[i] = await self._library_copy(request['recommendations'], request['user_name'], request['cart_items'], request['discount_percent'])
+            if texts[i] is not None:
+                continue
+            if not self.groq_client:
+                texts[i] = self._fallback_copy('disabled', request['recommendations'], request['cart_items'])
+                continue
+            try:
+                prompt, tone, approach, signature = self._build_groq_prompt(
+                    request['recommendations'], request['cart_items'], request['cart_total'], request['discount_percent']
+                )
+                texts[i] = await self._cached_copy(signature, request['user_name'])
+            except Exception as e:
+                logger.error(f"Error generating Groq content: {e}")
+                texts[i] = self._fallback_copy('error', request['recommendations'], request['cart_items'])
+            if texts[i] is None:
+                pending.append((i, request, prompt, tone, approach, signature))
+        
+        batch_size = max(1, config.LLM_BATCH_SIZE)
+        batches = [pending[start:start + batch_size] for start in range(0, len(pending), batch_size)]
+        semaphore = asyncio.Semaphore(max(1, config.LLM_MAX_CONCURRENCY))
+        
+        async def run(batch):
+            async with semaphore:
+                return await self._enhance_batch(batch)
+        
+        for generated in await asyncio.gather(*(run(batch) for batch in batches)):
+            for i, text in generated.items():
+                texts[i] = text
+        return texts
+    
+    async def _enhance_batch(self, batch: List[Tuple]) -> Dict[int, str]:
+        """
+        Generate copy for up to LLM_BATCH_SIZE carts with one Groq call
+        
+        Args:
+            batch: (request index, request, prompt, tone, approach, signature) tuples
             
-            logger.info(f"✅ Groq AI generated personalized content ({len(ai_text)} chars)")
-            logger.info(f"Finish reason: {response.choices[0].finish_reason}")
+        Returns:
+            Request index -> email copy
+        """
+        async def single(i, request, prompt, tone, approach, signature):
+            try:
+                return i, await self._generate_copy(prompt, tone, approach, signature, request['recommendations'], request['user_name'], request['cart_items'])
+            except Exception as e:
+                logger.error(f"Error generating Groq content: {e}")
+                return i, self._fallback_copy('error', request['recommendations'], request['cart_items'])
+        
+        if len(batch) == 1:
+            return dict([await single(*batch[0])])
+        
+        section_ids = [f"cart_{n}" for n in range(1, len(batch) + 1)]
+        batch_prompt = _compose_batch_prompt(section_ids, [prompt for _, _, prompt, _, _, _ in batch])
+        logger.info(f"Sending batched prompt to Groq for {len(batch)} carts (length: {len(batch_prompt)} chars)")
+        
+        try:
+            response = await self._call_groq(batch_prompt, max_tokens=config.GROQ_MAX_TOKENS * len(batch) + 50, json_output=True)
+        except Exception as e:
+            logger.warning(f"Batched Groq call failed ({e}) - generating {len(batch)} carts individually")
+            self.groq_batch_fallbacks += len(batch)
+            return dict(await asyncio.gather(*(single(*entry) for entry in batch)))
+        
+        if response is None:
+            # Circuit open, deadline missed or hedged: don't hold these emails back
+            return {i: self._fallback_copy('unavailable', request['recommendations'], request['cart_items'])
+                    for i, request, _, _, _, _ in batch}
+        
+        self.groq_batches += 1
+        sections = _parse_batch_sections(response.choices[0].message.content)
+        
+        results, retry = {}, []
+        for section_id, entry in zip(section_ids, batch):
+            i, request, _, _, _, signature = entry
+            try:
+                ai_text = self._validate_batch_section(sections.get(section_id))
+            except ValueError as e:
+                logger.warning(f"Batched copy for {section_id} rejected ({e}) - generating it individually")
+                retry.append(entry)
+                continue
+            results[i] = personalize(ai_text, request['user_name'])
+            self.llm_metrics.inc('llm_copy_source_total', source='batch')
+            if config.LLM_COPY_CACHE_ENABLED and cacheable(ai_text):
+                await asyncio.to_thread(self.copy_cache.put, signature, ai_text)
+        
+        logger.info(f"✅ Groq batch generated {len(results)}/{len(batch)} emails")
+        self.groq_batch_fallbacks += len(retry)
+        if retry:
+            results.update(await asyncio.gather(*(single(*entry) for entry in retry)))
+        return results
+    
+    def _validate_batch_section(self, section: Optional[str]) -> str:
+        """
+        Clean one cart's section of a batched response (customer still as CUSTOMER_SLOT)
+        
+        Raises:
+            ValueError: If the section is missing, empty after sanitization
+                or had PII removed
+        """
+        if not isinstance(section, str):
+            raise ValueError("missing section")
+        ai_text = self._clean_ai_text(section)
+        if '_REMOVED' in ai_text:
+            raise ValueError("sanitizer removed personal data")
+        return ai_text
+    
+    async def _library_copy(self, recommendations: List[Dict], user_name: str, cart_items: List[Dict], discount_percent: float) -> Optional[str]:
+        """Filled copy library variant in 'library' mode, or None"""
+        if config.EMAIL_COPY_MODE != 'library':
+            return None
+        try:
+            if await asyncio.to_thread(self.copy_library.ensure_loaded):
+                library_text = self.copy_library.render(recommendations, user_name, cart_items, discount_percent)
+                if library_text:
+                    self.llm_metrics.inc('llm_copy_source_total', source='library')
+                    logger.info(f"📚 Using pre-generated library copy ({len(library_text)} chars)")
+                    return library_text
+        except Exception as e:
+            logger.error(f"Error rendering library copy: {e}")
+        return None
+    
+    async def _cached_copy(self, signature: str, user_name: str) -> Optional[str]:
+        """Personalized copy cached for this prompt signature, or None"""
+        if not config.LLM_COPY_CACHE_ENABLED:
+            return None
+        cached_text = await asyncio.to_thread(self.copy_cache.get, signature)
+        if not cached_text:
+            return None
+        self.llm_metrics.inc('llm_copy_source_total', source='cache')
+        logger.info(f"♻️ Reusing cached AI copy for signature {signature[:8]}... ({len(cached_text)} chars)")
+        return personalize(cached_text, user_name)
+    
+    async def _generate_copy(self, prompt: str, tone: str, approach: str, signature: str,
+                             recommendations: List[Dict], user_name: str, cart_items: List[Dict]) -> str:
+        """One Groq completion for one cart, cleaned, cached with CUSTOMER_SLOT and filled with user_name"""
+        # Log prompt for debugging with randomization details
+        logger.info(f"Sending prompt to Groq (length: {len(prompt)} chars, tone={tone}, approach={approach[:50]}...)")
+        logger.debug(f"Prompt: {prompt[:500]}...")
+        
+        response = await self._call_groq(prompt, signature, stream=config.GROQ_STREAM)
+        if response is None:
+            # Circuit open, deadline missed or hedged: don't hold the email back
+            return self._fallback_copy('unavailable', recommendations, cart_items)
+        
+        # Extract content from response
+        ai_text = self._response_text(response)
+        
+        self.llm_metrics.inc('llm_copy_source_total', source='live')
+        logger.info(f"✅ Groq AI generated personalized content ({len(ai_text)} chars)")
+        logger.info(f"Finish reason: {response.choices[0].finish_reason}")
+        
+        if config.LLM_COPY_CACHE_ENABLED and cacheable(ai_text):
+            await asyncio.to_thread(self.copy_cache.put, signature, ai_text)
+        
+        return personalize(ai_text, user_name)
+    
+    def _build_groq_prompt(self, recommendations: List[Dict], cart_items: List[Dict], cart_total: float, discount_percent: float) -> Tuple[str, str, str, str]:
+        """
+        Build a randomized Groq prompt (the customer is named only as CUSTOMER_SLOT)
+        
+        Returns:
+            (prompt, tone, approach, copy cache signature)
+        """
+        # Build cart items summary
+        cart_summary = "\n".join([
+            f"- {item['name']} (Qty: {item.get('quantity', 1)}) - ${item.get('total', item.get('price', 0)):.2f}"
+            for item in cart_items
+        ])
+        
+        # Sample 1-3 recommendations to highlight (creates variety per email)
+        import random
+        highlighted_recs = []
+        if recommendations:
+            sample_size = min(len(recommendations), random.randint(1, 3))
+            highlighted_recs = random.sample(recommendations, sample_size)
+            recs_summary = "\n".join([
+                f"- {p['name']}: {p.get('description', 'Great product')[:80]}... (${p['price']:.2f})"
+                for p in highlighted_recs
+            ])
+        else:
+            recs_summary = "No specific recommendations available"
+        
+        # Randomize prompt structure for variety - injects randomness without hardcoded content
+        tone = random.choice(PROMPT_TONES)
+        approach = random.choice(PROMPT_APPROACHES)
+        style = random.choice(PROMPT_STYLES)
+        
+        prompt = compose_prompt(
+            CUSTOMER_SLOT, f"Cart contents (${cart_total:.2f}):", cart_summary,
+            discount_percent, recs_summary, tone, approach, style,
+            extra_requirements=(_CUSTOMER_SLOT_REQUIREMENT,)
+        )
+        
+        signature = copy_signature(
+            cart_items, discount_percent, tone, approach, style,
+            [p['id'] for p in highlighted_recs], config.GROQ_MODEL
+        )
+        return prompt, tone, approach, signature
+    
+    async def _call_groq(self, prompt: str, signature: Optional[str] = None, max_tokens: Optional[int] = None,
+                         json_output: bool = False, stream: bool = False):
+        """
+        Run one Groq completion under the breaker, rate limits, deadline and hedge
+        
+        Args:
+            prompt: User prompt
+            signature: Copy cache signature a late single-cart answer is stored under
+            max_tokens: Completion budget (defaults to GROQ_MAX_TOKENS)
+            json_output: Ask for a JSON object (batched prompts)
+            stream: Stream the completion and stop once the copy is complete
+                (the response content is then already cleaned)
+        
+        Returns:
+            The completion response, or None if the caller should use fallback copy
             
-            if not ai_text or not ai_text.strip():
+        Raises:
+            Exception: The API error, if the call failed within the deadline
+        """
+        if not self.groq_breaker.allow():
+            self.llm_metrics.inc('llm_requests_total', outcome='short_circuited')
+            logger.warning(f"Groq circuit breaker is {self.groq_breaker.state} - using fallback copy")
+            return None
+        
+        # Stay inside Groq's rate limits when many carts are generated concurrently
+        queued = time.perf_counter()
+        await self.groq_request_limiter.acquire()
+        max_tokens = max_tokens or config.GROQ_MAX_TOKENS
+        await self.groq_token_limiter.acquire(self._estimate_groq_tokens(prompt, max_tokens))
+        self.llm_metrics.observe('llm_queue_wait_seconds', time.perf_counter() - queued)
+        
+        started = time.perf_counter()
+        if stream:
+            call = asyncio.ensure_future(asyncio.to_thread(self._stream_groq_completion, prompt, max_tokens))
+        else:
+            call = asyncio.ensure_future(asyncio.to_thread(self._request_groq_completion, prompt, max_tokens, json_output))
+        deadline = config.GROQ_DEADLINE_SECONDS
+        hedge_after = config.GROQ_HEDGE_AFTER_SECONDS
+        budget = min(hedge_after, deadline) if hedge_after > 0 else deadline
+        
+        done, _ = await asyncio.wait({call}, timeout=budget)
+        if not done:
+            hedged = budget < deadline
+            self.llm_metrics.inc('llm_requests_total', outcome='hedged' if hedged else 'timeout')
+            if hedged:
+                # The late answer is still useful: it records the real outcome and warms the copy cache
+                self.groq_hedged += 1
+                logger.warning(f"Groq missed the {budget:.1f}s latency budget - sending fallback copy (hedged)")
+            else:
+                self.groq_timeouts += 1
+                self.groq_breaker.record_failure()
+                logger.warning(f"Groq call exceeded the {deadline:.1f}s deadline - using fallback copy")
+            call.add_done_callback(lambda future: self._finish_late_groq_call(future, started, signature, record_outcome=hedged))
+            return None
+        
+        try:
+            response = call.result()
+        except Exception:
+            self.groq_latency.observe(time.perf_counter() - started)
+            self.groq_breaker.record_failure()
+            self.llm_metrics.inc('llm_requests_total', outcome='error')
+            raise
+        
+        self.groq_latency.observe(time.perf_counter() - started)
+        self.groq_breaker.record_success()
+        self.llm_metrics.inc('llm_requests_total', outcome='success')
+        self._record_usage(response)
+        return response
+    
+    def _record_usage(self, response):
+        """Token, cost and finish-reason accounting for one completion"""
+        usage = getattr(response, 'usage', None)
+        if usage is not None:
+            prompt_tokens = getattr(usage, 'prompt_tokens', 0) or 0
+            completion_tokens = getattr(usage, 'completion_tokens', 0) or 0
+            self.llm_metrics.observe('llm_prompt_tokens', prompt_tokens)
+            self.llm_metrics.observe('llm_completion_tokens', completion_tokens)
+            self.llm_metrics.inc('llm_tokens_total', prompt_tokens, kind='prompt')
+            self.llm_metrics.inc('llm_tokens_total', completion_tokens, kind='completion')
+            self.llm_metrics.inc('llm_cost_usd_total', (
+                prompt_tokens * config.GROQ_INPUT_COST_PER_MILLION_TOKENS
+                + completion_tokens * config.GROQ_OUTPUT_COST_PER_MILLION_TOKENS
+            ) / 1_000_000)
+        if getattr(response, 'choices', None):
+            self.llm_metrics.inc('llm_finish_reasons_total', reason=response.choices[0].finish_reason or 'unknown')
+    
+    def _finish_late_groq_call(self, future: asyncio.Future, started: float, signature: str, record_outcome: bool):
+        """Done-callback for a Groq call whose email already went out with fallback copy"""
+        if future.cancelled():
+            return
+        self.groq_latency.observe(time.perf_counter() - started)
+        error = future.exception()
+        if error is not None:
+            if record_outcome:
+                self.groq_breaker.record_failure()
+            logger.warning(f"Late Groq call failed: {error}")
+            return
+        
+        if record_outcome:
+            self.groq_breaker.record_success()
+        self.groq_late_completions += 1
+        # Late tokens are billed all the same
+        self._record_usage(future.result())
+        if signature is None:
+            # Batched answer: nothing to cache per cart
+            return
+        try:
+            ai_text = self._response_text(future.result())
+        except Exception as e:
+            logger.warning(f"Late Groq response unusable: {e}")
+            return
+        if config.LLM_COPY_CACHE_ENABLED and cacheable(ai_text):
+            # The next identical prompt gets this copy instantly
+            asyncio.ensure_future(asyncio.to_thread(self.copy_cache.put, signature, ai_text))
+    
+    def llm_health(self) -> Dict:
+        """Breaker state, latency histogram and deadline/hedge counters for the Groq client"""
+        return {
+            'enabled': self.groq_client is not None,
+            'breaker': self.groq_breaker.stats(),
+            'latency': self.groq_latency.snapshot(),
+            'timeouts': self.groq_timeouts,
+            'hedged': self.groq_hedged,
+            'late_completions': self.groq_late_completions,
+            'batches': self.groq_batches,
+            'batch_fallbacks': self.groq_batch_fallbacks,
+            'deadline_seconds': config.GROQ_DEADLINE_SECONDS,
+            'hedge_after_seconds': config.GROQ_HEDGE_AFTER_SECONDS,
+            'rate_limits': {
+                'requests': self.groq_request_limiter.stats(),
+                'tokens': self.groq_token_limiter.stats(),
+            },
+            'providers': self.provider_pool.stats() if self.provider_pool else None,
+            'copy_cache': self.copy_cache.stats(),
+            'copy_mode': config.EMAIL_COPY_MODE,
+            'metrics': self.llm_metrics.snapshot(),
+            'copy_library': self.copy_library.stats(),
+        }
+    
+    @staticmethod
+    def _estimate_groq_tokens(prompt: str, max_tokens: Optional[int] = None) -> int:
+        """Rough token cost of one request (~4 chars per token, plus the completion budget)"""
+        return (len(_GROQ_SYSTEM_PROMPT) + len(prompt)) // 4 + (max_tokens or config.GROQ_MAX_TOKENS)
+    
+    def _request_groq_completion(self, prompt: str, max_tokens: Optional[int] = None, json_output: bool = False,
+                                 stream: bool = False):
+        """
+        Blocking chat-completions call on the fastest healthy provider (run it in a worker thread)
+        
+        A provider that errors is failed over to the next one within the same
+        call. stream=True returns the chunk stream.
+        """
+        # Structured output for batched prompts; Groq requires the word JSON in the messages
+        extra = {'response_format': {'type': 'json_object'}} if json_output else {}
+        if stream:
+            # The final chunk carries the usage block (when the stream runs to the end)
+            extra.update(stream=True, stream_options={'include_usage': True})
+        # Call Groq API with increased diversity parameters to reduce repetition
+        return self.provider_pool.call(lambda provider: provider.client.chat.completions.create(
+            model=provider.model,
+            messages=[
+                {
+                    "role": "system",
+                    "content": _GROQ_SYSTEM_PROMPT
+                },
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            temperature=0.85,  # Increased from 0.7 for more creativity
+            max_tokens=max_tokens or config.GROQ_MAX_TOKENS,
+            top_p=0.9,
+            presence_penalty=0.4,  # Encourage new topics and varied vocabulary
+            frequency_penalty=0.4,  # Discourage repetitive phrases and patterns
+            **extra
+        ))
+    
+    def _stream_groq_completion(self, prompt: str, max_tokens: Optional[int] = None):
+        """
+        Blocking streamed Groq call (run it in a worker thread)
+        
+        Sentences are sanitized and checked for sign-offs as they arrive; the
+        stream is closed once GROQ_STREAM_MAX_WORDS is reached or the model
+        starts a closing, so the remaining tokens are neither waited for nor
+        generated.
+        
+        Returns:
+            A completion-shaped response whose content is already cleaned
+        """
+        started = time.perf_counter()
+        stream = self._request_groq_completion(prompt, max_tokens, stream=True)
+        copy = StreamedCopy(self._sanitize_ai_fragment, _SIGNATURE_PATTERNS, config.GROQ_STREAM_MAX_WORDS)
+        finish_reason, usage, chunks = None, None, 0
+        try:
+            for chunk in stream:
+                usage = getattr(chunk, 'usage', None) or usage
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                finish_reason = choice.finish_reason or finish_reason
+                delta = choice.delta.content if choice.delta else None
+                if not delta:
+                    continue
+                if chunks == 0:
+                    self.llm_metrics.observe('llm_first_token_seconds', time.perf_counter() - started)
+                chunks += 1
+                if copy.feed(delta):
+                    break
+        finally:
+            # Closing the HTTP response is what stops Groq generating (and billing) the rest
+            stream.close()
+        
+        ai_text = copy.finish()
+        if copy.cutoff:
+            finish_reason = copy.cutoff
+            self.llm_metrics.inc('llm_stream_cutoffs_total', reason=copy.cutoff)
+            if copy.cutoff == CUTOFF_CLOSING:
+                self.llm_metrics.inc('llm_signature_strips_total')
+            logger.info(f"✂️ Closed Groq stream after {copy.words} words ({copy.cutoff})")
+        if usage is None:
+            # Cut off before the usage chunk: one content chunk is roughly one token
+            usage = SimpleNamespace(prompt_tokens=(len(_GROQ_SYSTEM_PROMPT) + len(prompt)) // 4, completion_tokens=chunks)
+        return streamed_completion(ai_text, finish_reason, usage)
+    
+    def _response_text(self, response) -> str:
+        """
+        Clean copy from a completion (streamed responses were cleaned as they arrived)
+        
+        Raises:
+            ValueError: If nothing usable is left
+        """
+        if getattr(response, 'cleaned', False):
+            ai_text = response.choices[0].message.content
+            if not ai_text:
                 raise ValueError("No text content in Groq response")
-            
             return ai_text
-            
-        except Exception as e:
-            logger.error(f"Error generating Groq content: {e}")
-            return self._fallback_recommendation_text(recommendations, cart_items)
+        return self._clean_ai_text(response.choices[0].message.content)
+    
+    def _sanitize_ai_fragment(self, ai_text: str) -> str:
+        """Sanitize AI email text, counting what was removed"""
+        for kind in unsafe_content(ai_text):
+            self.llm_metrics.inc('llm_sanitizer_hits_total', kind=kind)
+        return self.sanitize_text(ai_text, content_type="email")
+    
+    def _clean_ai_text(self, ai_text: Optional[str]) -> str:
+        """
+        Sanitize AI output and strip any signatures
+        
+        Raises:
+            ValueError: If nothing usable is left
+        """
+        ai_text = (ai_text or '').strip()
+        
+        logger.info(f"[AI_OUTPUT] Groq generated {len(ai_text)} chars before sanitization")
+        
+        # SAFE SANITIZER: Clean AI-generated email content
+        # This protects users from harmful, manipulative, or offensive content
+        ai_text_original = ai_text
+        ai_text = self._sanitize_ai_fragment(ai_text)
+        
+        if ai_text != ai_text_original:
+            logger.warning(f"[SAFE_SANITIZER] AI email content was sanitized for safety")
+            logger.debug(f"[SAFE_SANITIZER] Original AI text: {ai_text_original[:200]}...")
+            logger.debug(f"[SAFE_SANITIZER] Sanitized AI text: {ai_text[:200]}...")
+        
+        # Post-processing: Remove any signatures the AI might still add
+        logger.debug(f"AI text before signature removal: {repr(ai_text)}")
+        for pattern in _SIGNATURE_PATTERNS:
+            before = ai_text
+            ai_text = pattern.sub('', ai_text)
+            if before != ai_text:
+                self.llm_metrics.inc('llm_signature_strips_total')
+                logger.info(f"Removed signature with pattern: {pattern.pattern}")
+        
+        ai_text = ai_text.strip()
+        logger.debug(f"AI text after signature removal: {repr(ai_text)}")
+        
+        if not ai_text:
+            raise ValueError("No text content in Groq response")
+        
+        return ai_text
+    
+    def _fallback_copy(self, reason: str, recommendations: List[Dict], cart_items: List[Dict] = None) -> str:
+        """Fallback text for one email, counted by reason (disabled, unavailable, error)"""
+        self.llm_metrics.inc('llm_fallbacks_total', reason=reason)
+        self.llm_metrics.inc('llm_copy_source_total', source='fallback')
+        return self._fallback_recommendation_text(recommendations, cart_items)
     
     def _fallback_recommendation_text(self, recommendations: List[Dict], cart_items: List[Dict] = None) -> str:
         """Fallback recommendation text when Groq is unavailable"""
@@ -615,10 +1426,22 @@ class EmailService:
         
         Args:
             mail_app: Flask-Mail instance (optional, will use SMTP if not provided)
-            flask_app: Flask application instance (for app context)
+            flask_app: Flask application instance (for app context and MAIL_* settings)
         """
         self.mail_app = mail_app
         self.flask_app = flask_app
+        # Logged-in SMTP connections shared by every send (MAIL_SUPPRESS_SEND keeps Flask-Mail's test outbox)
+        self.smtp_pool = None
+        if config.SMTP_POOL_ENABLED and not (flask_app is not None and flask_app.config.get('MAIL_SUPPRESS_SEND')):
+            self.smtp_pool = SMTPConnectionPool.from_settings(smtp_settings(flask_app))
+        # Pipelined sends from the event loop itself; the pool (in a thread) is the fallback
+        self.async_smtp = None
+        if self.smtp_pool and config.SMTP_ASYNC_ENABLED:
+            self.async_smtp = AsyncSMTPSender.from_settings(smtp_settings(flask_app))
+        # Precompiled, autoescaped email templates (shared by every EmailService)
+        self.renderer = email_renderer()
+        # Rendered recommendation cards keyed by (product id, catalog version)
+        self.card_cache = CardFragmentCache(max_entries=config.EMAIL_CARD_CACHE_SIZE)
         self.recommendation_engine = RecommendationEngine()
     
     def calculate_discount(self, cart_total: float) -> Tuple[float, str]:
@@ -649,7 +1472,8 @@ class EmailService:
         user: Dict,
         cart_items: List[Dict],
         cart_total: float,
-        log_id: int = None
+        log_id: int = None,
+        cart_hash: str = None
     ) -> Dict[str, str]:
         """
         Generate personalized email content with AI recommendations
@@ -659,426 +1483,149 @@ class EmailService:
             cart_items: List of cart items
             cart_total: Total cart value
             log_id: Cart abandonment log ID for tracking
+            cart_hash: Cart contents hash (used as the recommendation cache key)
             
         Returns:
             Dictionary with 'subject', 'html', 'text' keys
         """
         try:
-            # Calculate discount
-            discount_percent, discount_message = self.calculate_discount(cart_total)
-            discounted_total = cart_total * (1 - discount_percent / 100)
-            
-            # Fixed count: Top 3 products with highest cosine similarity
-            recommendation_count = 3
-            
-            logger.info(f"Cart size: {len(cart_items)} items → Generating top {recommendation_count} recommendations by cosine similarity")
-            
-            # Get product recommendations (top 3 highest similarity scores)
-            recommendations = self.recommendation_engine.get_similar_products(
-                cart_items,
-                count=recommendation_count
-            )
+            draft = self.prepare_email(cart_items, cart_total, cart_hash)
             
             # Generate AI-enhanced personalized email content with cart items and discount info
-            ai_recommendation_text = await self.recommendation_engine.enhance_with_groq(
-                recommendations=recommendations,
-                user_name=user['name'],
-                cart_items=cart_items,
-                cart_total=cart_total,
-                discount_percent=discount_percent
-            )
-            
-            # Build cart summary HTML
-            cart_summary_html = self._build_cart_summary_html(cart_items, cart_total)
-            
-            # Build recommendations HTML
-            recommendations_html = self._build_recommendations_html(recommendations)
-            
-            # Build tracking URL with log_id parameter
-            tracking_cart_url = config.CART_URL
-            if log_id:
-                separator = '&' if '?' in tracking_cart_url else '?'
-                tracking_cart_url = f"{tracking_cart_url}{separator}email_track={log_id}&discount={discount_percent}&source=abandonment_email"
-            
-            # Build complete email HTML
-            email_html = self._build_email_html(
-                user_name=user['name'],
-                cart_summary=cart_summary_html,
-                cart_total=cart_total,
-                discount_message=discount_message,
-                discount_percent=discount_percent,
-                discounted_total=discounted_total,
-                free_shipping=config.FREE_SHIPPING_ENABLED,
-                ai_recommendation_text=ai_recommendation_text,
-                recommendations_html=recommendations_html,
-                cart_url=tracking_cart_url,
-                log_id=log_id
-            )
-            
-            # Build plain text version
-            email_text = self._build_email_text(
-                user_name=user['name'],
-                cart_items=cart_items,
-                cart_total=cart_total,
-                discount_message=discount_message,
-                discounted_total=discounted_total,
-                recommendations=recommendations,
-                cart_url=tracking_cart_url
-            )
-            
-            subject = f"🛒 {user['name']}, you left something in your cart!"
-            if discount_percent > 0:
-                subject += f" + {discount_percent}% OFF!"
-            
-            logger.info(f"Generated email for {user['email']} - Cart: ${cart_total:.2f}, Discount: {discount_percent}%")
+            ai_recommendation_text = await self.recommendation_engine.enhance_with_groq(**self.copy_request(user, cart_items, cart_total, draft))
             
-            return {
-                'subject': subject,
-                'html': email_html,
-                'text': email_text
-            }
+            return self.render_email(user, cart_items, cart_total, draft, ai_recommendation_text, log_id)
             
         except Exception as e:
             logger.error(f"Error generating email content: {e}")
             raise
     
-    def _build_cart_summary_html(self, cart_items: List[Dict], cart_total: float) -> str:
-        """Build HTML table for cart items"""
-        rows = []
-        for item in cart_items:
-            rows.append(f"""
-                <tr>
-                    <td style="padding: 10px; border-bottom: 1px solid #eee;">
-                        <strong>{item['name']}</strong>
-                    </td>
-                    <td style="padding: 10px; border-bottom: 1px solid #eee; text-align: center;">
-                        {item['quantity']}
-                    </td>
-                    <td style="padding: 10px; border-bottom: 1px solid #eee; text-align: right;">
-                        ${item['price']:.2f}
-                    </td>
-                    <td style="padding: 10px; border-bottom: 1px solid #eee; text-align: right;">
-                        <strong>${item['total']:.2f}</strong>
-                    </td>
-                </tr>
-            """)
-        
-        return f"""
-            <table style="width: 100%; border-collapse: collapse; margin: 20px 0;">
-                <thead>
-                    <tr style="background-color: #f8f9fa;">
-                        <th style="padding: 10px; text-align: left;">Product</th>
-                        <th style="padding: 10px; text-align: center;">Qty</th>
-                        <th style="padding: 10px; text-align: right;">Price</th>
-                        <th style="padding: 10px; text-align: right;">Total</th>
-                    </tr>
-                </thead>
-                <tbody>
-                    {''.join(rows)}
-                    <tr>
-                        <td colspan="3" style="padding: 15px; text-align: right; font-size: 18px;">
-                            <strong>Cart Total:</strong>
-                        </td>
-                        <td style="padding: 15px; text-align: right; font-size: 18px; color: #007bff;">
-                            <strong>${cart_total:.2f}</strong>
-                        </td>
-                    </tr>
-                </tbody>
-            </table>
+    def prepare_email(self, cart_items: List[Dict], cart_total: float, cart_hash: str = None) -> Dict:
         """
-    
-    def _build_recommendations_html(self, recommendations: List[Dict]) -> str:
-        """Build HTML for product recommendations"""
-        if not recommendations:
-            return ""
-        
-        cards = []
-        for product in recommendations:
-            # Get description, handle None/empty cases
-            desc = product.get('description') or 'A great product for you'
-            desc_preview = desc[:100] + "..." if len(desc) > 100 else desc
-            
-            # Get category
-            category = product.get('category', 'Product')
-            
-            cards.append(f"""
-                <div style="border: 2px solid #007bff; border-radius: 12px; padding: 20px; margin: 10px; 
-                            flex: 1; min-width: 220px; max-width: 280px; background: #f8f9fa; text-align: center;">
-                    <div style="background: #007bff; color: white; padding: 5px 10px; border-radius: 5px; 
-                                font-size: 12px; margin-bottom: 10px; display: inline-block;">
-                        {category}
-                    </div>
-                    <h4 style="margin: 10px 0; color: #333; font-size: 18px;">{product['name']}</h4>
-                    <p style="color: #666; font-size: 14px; margin: 10px 0; min-height: 60px;">
-                        {desc_preview}
-                    </p>
-                    <p style="font-size: 24px; color: #28a745; font-weight: bold; margin: 15px 0;">
-                        ${product['price']:.2f}
-                    </p>
-                    <div style="background: #fff3cd; padding: 8px; border-radius: 5px; margin: 10px 0; font-size: 12px;">
-                        ✨ Recommended for you
-                    </div>
-                    <a href="{product['url']}" 
-                       style="display: inline-block; background-color: #28a745; color: white; padding: 12px 24px; 
-                              text-decoration: none; border-radius: 25px; margin-top: 10px; font-weight: bold;">
-                        🛍️ Add to Cart
-                    </a>
-                </div>
-            """)
+        First half of generate_email_content: discount and recommendations
         
-        return f"""
-            <div style="display: flex; flex-wrap: wrap; justify-content: center; gap: 15px; margin: 30px 0;">
-                {''.join(cards)}
-            </div>
+        Returns:
+            Draft dict with discount_percent, discount_message, discounted_total
+            and recommendations, for copy_request and render_email
         """
+        # Calculate discount
+        discount_percent, discount_message = self.calculate_discount(cart_total)
+        discounted_total = cart_total * (1 - discount_percent / 100)
+        
+        # Fixed count: Top 3 products with highest cosine similarity
+        recommendation_count = 3
+        
+        logger.info(f"Cart size: {len(cart_items)} items → Generating top {recommendation_count} recommendations by cosine similarity")
+        
+        # Get product recommendations (top 3 highest similarity scores)
+        recommendations = self.recommendation_engine.get_similar_products(
+            cart_items,
+            count=recommendation_count,
+            cart_hash=cart_hash
+        )
+        
+        return {
+            'discount_percent': discount_percent,
+            'discount_message': discount_message,
+            'discounted_total': discounted_total,
+            'recommendations': recommendations,
+        }
     
-    def _build_email_html(self, **kwargs) -> str:
-        """Build complete email HTML with modern, engaging design"""
-        # Calculate savings
-        discount_amount = kwargs['cart_total'] * (kwargs['discount_percent'] / 100)
-        final_total = kwargs['discounted_total']
-        
-        # AI content with fallback
-        ai_text = kwargs.get('ai_recommendation_text', 
-            f"We noticed you left some items in your cart. Complete your purchase now and save {kwargs['discount_percent']}% on your entire order!")
-        
-        # Hours remaining for urgency
-        hours_remaining = 24
-        
-        return f"""
-<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Complete Your Purchase - {kwargs['discount_percent']}% OFF!</title>
-</head>
-<body style="margin: 0; padding: 0; font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, 'Helvetica Neue', Arial, sans-serif; background: #f5f7fa;">
-    
-    <table cellpadding="0" cellspacing="0" border="0" width="100%" style="background: #f5f7fa; padding: 20px 0;">
-        <tr>
-            <td align="center">
-                <table cellpadding="0" cellspacing="0" border="0" width="600" style="max-width: 600px; background: white; border-radius: 16px; overflow: hidden; box-shadow: 0 4px 20px rgba(0,0,0,0.1);">
-                    
-                    <!-- Header -->
-                    <tr>
-                        <td style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 40px 30px; text-align: center;">
-                            <h1 style="margin: 0; color: white; font-size: 32px; font-weight: 700;">
-                                🛍 ECommerceStore
-                            </h1>
-                        </td>
-                    </tr>
-                    
-                    <!-- Greeting -->
-                    <tr>
-                        <td style="padding: 30px 30px 20px;">
-                            <h2 style="margin: 0 0 20px; color: #1a1a1a; font-size: 28px; font-weight: 700;">
-                                Hi {kwargs['user_name'].split()[0]}! 👋
-                            </h2>
-                        </td>
-                    </tr>
-                    
-                    <!-- AI Personalized Content -->
-                    <tr>
-                        <td style="padding: 0 30px 20px;">
-                            <div style="background: linear-gradient(135deg, #f5f7fa 0%, #c3cfe2 100%); padding: 25px; border-radius: 12px; border-left: 4px solid #667eea;">
-                                <p style="margin: 0; color: #1a1a1a; font-size: 16px; line-height: 1.6;">
-                                    {ai_text}
-                                </p>
-                            </div>
-                        </td>
-                    </tr>
-                    
-                    <!-- Urgency Timer -->
-                    <tr>
-                        <td style="padding: 0 30px 20px;">
-                            <div style="background: #fff3cd; border: 2px solid #ffc107; border-radius: 8px; padding: 15px; text-align: center;">
-                                <span style="font-size: 14px; color: #856404; font-weight: 600;">
-                                    ⏰ Offer expires in {hours_remaining} hours! Don't miss out!
-                                </span>
-                            </div>
-                        </td>
-                    </tr>
-                    
-                    <!-- Discount Banner -->
-                    <tr>
-                        <td style="padding: 0 30px 20px;">
-                            <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 30px; border-radius: 12px; text-align: center;">
-                                <div style="color: white; font-size: 18px; margin-bottom: 10px;">
-                                    ✨ Special Offer: {kwargs['discount_percent']}% OFF your entire order!
-                                </div>
-                                <div style="color: white; font-size: 32px; font-weight: 700; margin: 10px 0;">
-                                    ${final_total:.2f} <span style="font-size: 20px; text-decoration: line-through; opacity: 0.7;">${kwargs['cart_total']:.2f}</span>
-                                </div>
-                                <div style="color: white; font-size: 16px;">
-                                    Save ${discount_amount:.2f}!
-                                </div>
-                                
-                                <!-- Progress Bar -->
-                                <div style="background: rgba(255,255,255,0.3); height: 8px; border-radius: 4px; margin-top: 15px; overflow: hidden;">
-                                    <div style="background: #4caf50; height: 100%; width: {kwargs['discount_percent']}%; border-radius: 4px;"></div>
-                                </div>
-                            </div>
-                        </td>
-                    </tr>
-                    
-                    <!-- Free Shipping -->
-                    {('<tr><td style="padding: 0 30px 20px;"><div style="background: #d4edda; border: 2px solid #28a745; border-radius: 8px; padding: 15px; text-align: center;"><span style="font-size: 16px; color: #155724; font-weight: 600;">🚚 FREE SHIPPING on your order!</span></div></td></tr>' if kwargs.get('free_shipping') else '')}
-                    
-                    <!-- Cart Header -->
-                    <tr>
-                        <td style="padding: 30px 30px 20px;">
-                            <h3 style="margin: 0; color: #1a1a1a; font-size: 22px; font-weight: 700;">
-                                Your Cart Summary
-                            </h3>
-                        </td>
-                    </tr>
-                    
-                    <!-- Cart Table (using existing cart_summary HTML) -->
-                    <tr>
-                        <td style="padding: 0 30px 20px;">
-                            <div style="background: #f8f9fa; padding: 20px; border-radius: 12px;">
-                                {kwargs['cart_summary']}
-                            </div>
-                        </td>
-                    </tr>
-                    
-                    <!-- Discount Row -->
-                    <tr>
-                        <td style="padding: 0 30px 10px;">
-                            <table cellpadding="0" cellspacing="0" border="0" width="100%">
-                                <tr>
-                                    <td style="text-align: right; padding: 10px; font-weight: 600; font-size: 16px; color: #28a745;">
-                                        Discount ({kwargs['discount_percent']}%):
-                                    </td>
-                                    <td style="text-align: right; padding: 10px; font-weight: 600; font-size: 18px; color: #28a745; width: 120px;">
-                                        -${discount_amount:.2f}
-                                    </td>
-                                </tr>
-                                <tr style="background: #e7f3ff;">
-                                    <td style="text-align: right; padding: 15px; font-weight: 700; font-size: 20px; color: #1a1a1a;">
-                                        Final Total:
-                                    </td>
-                                    <td style="text-align: right; padding: 15px; font-weight: 700; font-size: 28px; color: #667eea; width: 120px;">
-                                        ${final_total:.2f}
-                                    </td>
-                                </tr>
-                            </table>
-                        </td>
-                    </tr>
-                    
-                    <!-- CTA Button -->
-                    <tr>
-                        <td style="padding: 30px; text-align: center;">
-                            <a href="{kwargs['cart_url']}" 
-                               style="display: inline-block; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; text-decoration: none; padding: 18px 50px; border-radius: 50px; font-size: 18px; font-weight: 700; box-shadow: 0 4px 15px rgba(102, 126, 234, 0.4);">
-                                🛒 Complete Your Purchase Now
-                            </a>
-                        </td>
-                    </tr>
-                    
-                    <!-- Recommendations Section -->
-                    {('<tr><td style="padding: 30px; background: #f8f9fa;"><h3 style="margin: 0 0 20px; color: #1a1a1a; font-size: 22px; font-weight: 700; text-align: center;">✨ You Might Also Love...</h3><div style="padding: 10px;">' + kwargs['recommendations_html'] + '</div></td></tr>' if kwargs.get('recommendations_html') else '')}
-                    
-                    <!-- Company Signature -->
-                    <tr>
-                        <td style="padding: 30px; background: #fff; border-top: 1px solid #eee; text-align: left;">
-                            <div style="color: #555; font-size: 16px; margin-bottom: 10px;">
-                                <strong>Thank you for shopping with us!</strong>
-                            </div>
-                            <div style="color: #333; font-size: 16px; margin-bottom: 5px;">
-                                <strong>The ECommerceStore Team</strong>
-                            </div>
-                            <div style="color: #888; font-size: 14px;">
-                                Need help? Contact us at <a href="mailto:support@ecommerce.com" style="color: #667eea; text-decoration: none;">support@ecommerce.com</a>
-                            </div>
-                        </td>
-                    </tr>
-                    
-                    <!-- Social Proof -->
-                    <tr>
-                        <td style="padding: 30px; background: #fff; border-top: 1px solid #eee; text-align: center;">
-                            <div style="color: #666; font-size: 14px; margin-bottom: 15px;">
-                                ⭐⭐⭐⭐⭐ Trusted by 10,000+ happy customers
-                            </div>
-                            <div style="color: #999; font-size: 12px;">
-                                "Fast shipping, great quality, amazing customer service!" - Sarah M.
-                            </div>
-                        </td>
-                    </tr>
-                    
-                    <!-- Footer -->
-                    <tr>
-                        <td style="padding: 30px; background: #1a1a1a; text-align: center;">
-                            <p style="margin: 0 0 10px; color: #999; font-size: 14px;">
-                                Need help? <a href="mailto:support@ecommerce.com" style="color: #667eea; text-decoration: none;">Contact us</a>
-                            </p>
-                            <p style="margin: 0; color: #666; font-size: 12px;">
-                                © 2025 ECommerceStore. All rights reserved.
-                            </p>
-                            <div style="margin-top: 15px;">
-                                <a href="#" style="color: #667eea; text-decoration: none; margin: 0 10px; font-size: 12px;">Unsubscribe</a>
-                                <a href="#" style="color: #667eea; text-decoration: none; margin: 0 10px; font-size: 12px;">Privacy Policy</a>
-                            </div>
-                        </td>
-                    </tr>
-                    
-                </table>
-            </td>
-        </tr>
-    </table>
-    
-    <!-- Email Open Tracking Pixel -->
-    {('<img src="' + config.BASE_URL + '/track/email/' + str(kwargs.get('log_id', 0)) + '" width="1" height="1" style="display:none;" alt="" />') if kwargs.get('log_id') else ''}
+    @staticmethod
+    def copy_request(user: Dict, cart_items: List[Dict], cart_total: float, draft: Dict) -> Dict:
+        """enhance_with_groq / enhance_many arguments for a prepared email"""
+        return {
+            'recommendations': draft['recommendations'],
+            'user_name': user['name'],
+            'cart_items': cart_items,
+            'cart_total': cart_total,
+            'discount_percent': draft['discount_percent'],
+        }
     
-</body>
-</html>
+    def render_email(self, user: Dict, cart_items: List[Dict], cart_total: float, draft: Dict,
+                     ai_recommendation_text: str, log_id: int = None) -> Dict[str, str]:
+        """
+        Second half of generate_email_content: build the email around the copy
+        
+        Returns:
+            Dictionary with 'subject', 'html', 'text' keys
         """
+        discount_percent = draft['discount_percent']
+        discount_message = draft['discount_message']
+        discounted_total = draft['discounted_total']
+        
+        # Materialize recommendation views into plain dicts for rendering
+        recommendations = [rec.to_dict() for rec in draft['recommendations']]
+        
+        # Cards are rendered once per product and catalog version, then reused
+        catalog_version = self.recommendation_engine.index_version
+        recommendation_cards = [
+            self.card_cache.get_or_render(product, catalog_version, self.renderer.recommendation_card)
+            for product in recommendations
+        ]
+        
+        # Build tracking URL with log_id parameter
+        tracking_cart_url = config.CART_URL
+        if log_id:
+            separator = '&' if '?' in tracking_cart_url else '?'
+            tracking_cart_url = f"{tracking_cart_url}{separator}email_track={log_id}&discount={discount_percent}&source=abandonment_email"
+        
+        # Build complete email HTML
+        email_html = self.renderer.email_html(
+            user_name=user['name'],
+            cart_items=cart_items,
+            cart_total=cart_total,
+            discount_percent=discount_percent,
+            discounted_total=discounted_total,
+            free_shipping=config.FREE_SHIPPING_ENABLED,
+            ai_recommendation_text=ai_recommendation_text,
+            recommendation_cards=recommendation_cards,
+            cart_url=tracking_cart_url,
+            log_id=log_id
+        )
+        
+        # Build plain text version
+        email_text = self.renderer.email_text(
+            user_name=user['name'],
+            cart_items=cart_items,
+            cart_total=cart_total,
+            discount_message=discount_message,
+            discounted_total=discounted_total,
+            recommendations=recommendations,
+            cart_url=tracking_cart_url
+        )
+        
+        subject = f"🛒 {user['name']}, you left something in your cart!"
+        if discount_percent > 0:
+            subject += f" + {discount_percent}% OFF!"
+        
+        logger.info(f"Generated email for {user['email']} - Cart: ${cart_total:.2f}, Discount: {discount_percent}%")
+        
+        return {
+            'subject': subject,
+            'html': email_html,
+            'text': email_text
+        }
     
-    def _build_email_text(self, **kwargs) -> str:
-        """Build plain text version of email"""
-        discount_text = ""
-        if kwargs.get('discount_message'):
-            discount_text = f"\n\n{kwargs['discount_message']}\n" \
-                          f"Your new total: ${kwargs['discounted_total']:.2f} " \
-                          f"(save ${kwargs['cart_total'] - kwargs['discounted_total']:.2f}!)\n"
-        
-        cart_items_text = "\n".join([
-            f"  - {item['name']} x{item['quantity']} - ${item['total']:.2f}"
-            for item in kwargs['cart_items']
-        ])
+    def invalidate_product(self, product_id: int) -> int:
+        """
+        Stop emails showing a product's old data after it was edited or deleted
         
-        recs_text = ""
-        if kwargs['recommendations']:
-            recs_text = "\n\nYOU MIGHT ALSO LOVE:\n" + "\n".join([
-                f"  - {p['name']} (${p['price']:.2f}) - {kwargs['cart_url'].replace('/cart', f'/product/{p['id']}')}"
-                for p in kwargs['recommendations']
-            ])
+        The product is left out of recommendations until the index has been
+        rebuilt from the updated table, and its rendered cards are dropped.
         
-        return f"""
-Hi {kwargs['user_name']}!
-
-We noticed you left some items in your cart. Don't worry, we saved them for you!
-{discount_text}
-{"🚚 FREE SHIPPING on your order!" if kwargs.get('free_shipping') else ""}
-
-YOUR CART:
-{cart_items_text}
-
-Cart Total: ${kwargs['cart_total']:.2f}
-
-Return to your cart and complete your purchase:
-{kwargs['cart_url']}
-{recs_text}
-
-Need help? Contact us at support@ecommerce.com
-
-© 2025 ECommerceStore
+        Returns:
+            Number of cached cards dropped
         """
+        self.recommendation_engine.product_changed(product_id)
+        dropped = self.card_cache.invalidate(product_id)
+        if dropped:
+            logger.info(f"Invalidated {dropped} cached recommendation cards for product {product_id}")
+        return dropped
     
-    async def send_email(self, to_email: str, subject: str, html_content: str, text_content: str) -> bool:
+    def deliver(self, to_email: str, subject: str, html_content: str, text_content: str):
         """
-        Send email using Flask-Mail or SMTP
+        Send one email through the SMTP connection pool, Flask-Mail or SMTP (blocking)
         
         Args:
             to_email: Recipient email
@@ -1086,65 +1633,78 @@ Need help? Contact us at support@ecommerce.com
             html_content: HTML email body
             text_content: Plain text email body
             
+        Raises:
+            Exception: Whatever the mail transport raised (outbox workers retry on it)
+        """
+        if self.smtp_pool:
+            # Reuse a logged-in connection
+            self.smtp_pool.send(mime_message(to_email, subject, html_content, text_content))
+        elif self.mail_app and self.flask_app:
+            # Use Flask-Mail with app context
+            with self.flask_app.app_context():
+                self.mail_app.send(self._flask_message(to_email, subject, html_content, text_content))
+        elif self.mail_app:
+            # Use Flask-Mail without app context (might fail)
+            self.mail_app.send(self._flask_message(to_email, subject, html_content, text_content))
+        else:
+            # Use SMTP directly
+            msg = mime_message(to_email, subject, html_content, text_content)
+            
+            # Send via SMTP
+            import os
+            smtp_server = os.getenv('MAIL_SERVER', 'smtp.gmail.com')
+            smtp_port = int(os.getenv('MAIL_PORT', 587))
+            smtp_user = os.getenv('MAIL_USERNAME', '')
+            smtp_pass = os.getenv('MAIL_PASSWORD', '')
+            
+            server = smtplib.SMTP(smtp_server, smtp_port)
+            server.starttls()
+            server.login(smtp_user, smtp_pass)
+            server.send_message(msg)
+            server.quit()
+    
+    async def send_email(self, to_email: str, subject: str, html_content: str, text_content: str) -> bool:
+        """
+        Send email without blocking the event loop
+        
+        Uses the async SMTP client when enabled, otherwise (or when the server
+        doesn't suit it) deliver() in a worker thread.
+        
         Returns:
             True if sent successfully, False otherwise
         """
         try:
-            if self.mail_app and self.flask_app:
-                # Use Flask-Mail with app context
-                def send_with_context():
-                    with self.flask_app.app_context():
-                        msg = Message(
-                            subject=subject,
-                            sender=(config.SENDER_NAME, config.SENDER_EMAIL),
-                            recipients=[to_email],
-                            html=html_content,
-                            body=text_content
-                        )
-                        self.mail_app.send(msg)
-                
-                # Run in thread to avoid blocking
-                await asyncio.to_thread(send_with_context)
-            elif self.mail_app:
-                # Use Flask-Mail without app context (might fail)
-                msg = Message(
-                    subject=subject,
-                    sender=(config.SENDER_NAME, config.SENDER_EMAIL),
-                    recipients=[to_email],
-                    html=html_content,
-                    body=text_content
-                )
-                # Send in thread to avoid blocking
-                await asyncio.to_thread(self.mail_app.send, msg)
-            else:
-                # Use SMTP directly
-                msg = MIMEMultipart('alternative')
-                msg['Subject'] = subject
-                msg['From'] = f"{config.SENDER_NAME} <{config.SENDER_EMAIL}>"
-                msg['To'] = to_email
-                
-                msg.attach(MIMEText(text_content, 'plain'))
-                msg.attach(MIMEText(html_content, 'html'))
-                
-                # Send via SMTP
-                import os
-                smtp_server = os.getenv('MAIL_SERVER', 'smtp.gmail.com')
-                smtp_port = int(os.getenv('MAIL_PORT', 587))
-                smtp_user = os.getenv('MAIL_USERNAME', '')
-                smtp_pass = os.getenv('MAIL_PASSWORD', '')
-                
-                server = smtplib.SMTP(smtp_server, smtp_port)
-                server.starttls()
-                server.login(smtp_user, smtp_pass)
-                await asyncio.to_thread(server.send_message, msg)
-                server.quit()
-            
+            if self.async_smtp and not self.async_smtp.unavailable:
+                try:
+                    await self.async_smtp.send(mime_message(to_email, subject, html_content, text_content))
+                    logger.info(f"Email sent successfully to {to_email}")
+                    return True
+                except AsyncSMTPUnavailable:
+                    self.async_smtp.fallbacks += 1
+            await asyncio.to_thread(self.deliver, to_email, subject, html_content, text_content)
             logger.info(f"Email sent successfully to {to_email}")
             return True
             
         except Exception as e:
             logger.error(f"Failed to send email to {to_email}: {e}")
             return False
+    
+    @staticmethod
+    def _flask_message(to_email: str, subject: str, html_content: str, text_content: str) -> Message:
+        return Message(
+            subject=subject,
+            sender=(config.SENDER_NAME, config.SENDER_EMAIL),
+            recipients=[to_email],
+            html=html_content,
+            body=text_content
+        )
+    
+    def close(self):
+        """Close pooled SMTP connections"""
+        if self.async_smtp:
+            self.async_smtp.close()
+        if self.smtp_pool:
+            self.smtp_pool.close()
 
 
 class CartAbandonmentDetector:
@@ -1178,6 +1738,8 @@ class CartAbandonmentDetector:
             
         self.email_service = EmailService(mail_app, flask_app)
         self.flask_app = flask_app
+        # Outbox mode: rendered emails are queued and delivered by outbox_worker.py
+        self.outbox = EmailOutbox.from_config(DatabaseConnection.get_connection) if config.EMAIL_DELIVERY_MODE == 'outbox' else None
         self.processed_carts = set()  # Track processed cart IDs
         self.running = False
         self._initialized = True
@@ -1259,18 +1821,11 @@ class CartAbandonmentDetector:
     
     def _generate_cart_hash(self, cart_items: List[Dict]) -> str:
         """Generate a unique hash for cart contents to identify the same cart"""
-        import hashlib
-        # Sort items by product_id and create a string representation
-        sorted_items = sorted(cart_items, key=lambda x: x['product_id'])
-        cart_signature = "|".join([
-            f"{item['product_id']}:{item['quantity']}" 
-            for item in sorted_items
-        ])
-        # Generate SHA256 hash
-        return hashlib.sha256(cart_signature.encode()).hexdigest()
+        return generate_cart_hash(cart_items)
     
     async def check_abandoned_carts(self):
         """Check for abandoned carts and send recovery emails"""
+        cycle_start = time.perf_counter()
         try:
             conn = DatabaseConnection.get_connection()
             cursor = conn.cursor()
@@ -1280,6 +1835,12 @@ class CartAbandonmentDetector:
             
             logger.info(f"🔍 Checking for abandoned carts (threshold: {threshold_time})")
             
+            # Pick up orders placed since the last cycle (incremental, cheap when nothing changed)
+            self.email_service.recommendation_engine.refresh_copurchase()
+            
+            # Rebuild a stale index in the background; this cycle keeps using the current one
+            self.email_service.recommendation_engine.ensure_index_fresh()
+            
             # Find abandoned carts - check USER IDLE TIME instead of cart age
             # This prevents false positives (emails to active users)
             query = """
@@ -1312,6 +1873,8 @@ class CartAbandonmentDetector:
                 idle_time = datetime.now() - cart_info['last_activity']
                 logger.info(f"   🚨 User {cart_info['user_id']} ({cart_info['name']}): idle for {idle_time.total_seconds():.0f}s")
             
+            # Phase 1 (serial, one DB cursor): dedupe carts and log the ones that get an email
+            jobs = []
             for cart_info in abandoned_carts:
                 # Get cart details first to generate hash
                 cursor.execute("""
@@ -1370,6 +1933,20 @@ class CartAbandonmentDetector:
                             logger.info(f"Skipping cart {cart_hash[:8]}... for user {cart_info['user_id']} - processing already in progress")
                             self.processed_carts.add(cart_key)
                             continue
+                        # A backlogged outbox is not a failed send: don't queue the same email twice
+                        if self.outbox and self.outbox.is_queued(cursor, existing_log['id']):
+                            logger.info(f"Skipping cart {cart_hash[:8]}... for user {cart_info['user_id']} - email queued for delivery")
+                            self.processed_carts.add(cart_key)
+                            continue
+                        # Dead-lettered (e.g. a permanent 5xx rejection): a restart must not send a fresh copy
+                        dead_id = self.outbox.dead_letter_id(cursor, existing_log['id']) if self.outbox else None
+                        if dead_id:
+                            logger.warning(
+                                f"Skipping cart {cart_hash[:8]}... for user {cart_info['user_id']} - outbox email {dead_id} was dead-lettered "
+                                f"(requeue with: UPDATE email_outbox SET status = 'pending', attempts = 0, next_attempt_at = NOW() WHERE id = {dead_id})"
+                            )
+                            self.processed_carts.add(cart_key)
+                            continue
                 
                 # Mark as processed IMMEDIATELY to prevent duplicate processing in same cycle
                 self.processed_carts.add(cart_key)
@@ -1390,48 +1967,178 @@ class CartAbandonmentDetector:
                 # Log to database first to get the log_id for tracking (include discount)
                 log_id = self._log_abandonment_event(cursor, cart_info['user_id'], cart_hash, cart_total, email_sent=False, discount_percent=discount_percent)
                 
-                # Generate and send email with tracking log_id
-                try:
-                    email_content = await self.email_service.generate_email_content(
-                        user=user,
-                        cart_items=cart_items,
-                        cart_total=cart_total,
-                        log_id=log_id
-                    )
-                    
-                    success = await self.email_service.send_email(
-                        to_email=user['email'],
-                        subject=email_content['subject'],
-                        html_content=email_content['html'],
-                        text_content=email_content['text']
-                    )
-                    
-                    if success:
-                        # Update the log entry to mark email as sent
-                        cursor.execute("""
-                            UPDATE cart_abandonment_log 
-                            SET email_sent = TRUE 
-                            WHERE id = %s
-                        """, (log_id,))
-                        cursor.connection.commit()
-                        
-                        logger.info(f"Sent abandonment email to {user['email']} for cart worth ${cart_total:.2f} (log_id: {log_id}, cart hash: {cart_hash[:8]}...)")
-                    else:
-                        # If email failed to send, remove from processed set so it can be retried
-                        self.processed_carts.discard(cart_key)
-                        logger.warning(f"Failed to send email to {user['email']}, will retry next cycle")
-                    
-                except Exception as e:
+                jobs.append({
+                    'user_id': cart_info['user_id'],
+                    'user': user,
+                    'cart_items': cart_items,
+                    'cart_total': cart_total,
+                    'cart_hash': cart_hash,
+                    'cart_key': cart_key,
+                    'log_id': log_id,
+                })
+            
+            # Phase 2 (concurrent): generate and send (or render for the outbox) every email, at most LLM_MAX_CONCURRENCY at once
+            semaphore = asyncio.Semaphore(max(1, config.LLM_MAX_CONCURRENCY))
+            if config.LLM_BATCH_SIZE > 1 and len(jobs) > 1:
+                results = await self._generate_and_send_batched(jobs, semaphore)
+            else:
+                results = await asyncio.gather(
+                    *(self._generate_and_send(job, semaphore) for job in jobs),
+                    return_exceptions=True
+                )
+            
+            # Phase 3 (serial, in cart order): queue outbox emails and record outcomes
+            sent = 0
+            queued = 0
+            for job, result in zip(jobs, results):
+                if result is True and 'email_content' in job:
+                    # The outbox worker sends it and sets email_sent
+                    content = job['email_content']
+                    if self.outbox.enqueue(cursor, job['log_id'], job['user']['email'], content['subject'], content['html'], content['text']):
+                        queued += 1
+                        logger.info(f"Queued abandonment email to {job['user']['email']} for cart worth ${job['cart_total']:.2f} (log_id: {job['log_id']})")
+                        continue
+                    # Outbox unavailable: deliver inline rather than lose the email
+                    result = await self.email_service.send_email(job['user']['email'], content['subject'], content['html'], content['text'])
+                
+                if isinstance(result, BaseException):
                     # If error occurred, remove from processed set so it can be retried
-                    self.processed_carts.discard(cart_key)
-                    logger.error(f"Error processing cart for user {cart_info['user_id']}: {e}")
+                    self.processed_carts.discard(job['cart_key'])
+                    logger.error(f"Error processing cart for user {job['user_id']}: {result}")
+                elif result:
+                    # Update the log entry to mark email as sent
+                    cursor.execute("""
+                        UPDATE cart_abandonment_log 
+                        SET email_sent = TRUE 
+                        WHERE id = %s
+                    """, (job['log_id'],))
+                    cursor.connection.commit()
+                    sent += 1
+                    
+                    logger.info(f"Sent abandonment email to {job['user']['email']} for cart worth ${job['cart_total']:.2f} (log_id: {job['log_id']}, cart hash: {job['cart_hash'][:8]}...)")
+                else:
+                    # If email failed to send, remove from processed set so it can be retried
+                    self.processed_carts.discard(job['cart_key'])
+                    logger.warning(f"Failed to send email to {job['user']['email']}, will retry next cycle")
             
             cursor.close()
             conn.close()
             
+            cycle_seconds = time.perf_counter() - cycle_start
+            logger.info(f"⏱️ Cycle finished in {cycle_seconds:.2f}s: {sent}/{len(jobs)} emails sent{f', {queued} queued' if self.outbox else ''} (concurrency {config.LLM_MAX_CONCURRENCY}, {cycle_seconds / len(jobs) if jobs else 0:.2f}s per cart)")
+            groq_wait = self.email_service.recommendation_engine.groq_request_limiter.stats()
+            if groq_wait['waits']:
+                logger.info(f"Groq rate limiter: {groq_wait['waits']} waits, {groq_wait['wait_seconds']:.1f}s total")
+            llm_health = self.email_service.recommendation_engine.llm_health()
+            if llm_health['latency']['count']:
+                logger.info(f"Groq latency p50 {llm_health['latency']['p50_seconds']:.2f}s / p95 {llm_health['latency']['p95_seconds']:.2f}s, breaker {llm_health['breaker']['state']}, {llm_health['timeouts']} timeouts, {llm_health['hedged']} hedged")
+            llm_tokens = llm_health['metrics']['llm_tokens_total']
+            if llm_tokens:
+                logger.info(f"LLM usage: {llm_tokens.get('kind=prompt', 0):.0f} prompt / {llm_tokens.get('kind=completion', 0):.0f} completion tokens (≈${llm_health['metrics']['llm_cost_usd_total']:.4f})")
+            
+            cache_stats = self.email_service.recommendation_engine.recommendation_cache.stats()
+            logger.info(f"Recommendation cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses (hit rate {cache_stats['hit_rate']:.1%}, {cache_stats['entries']} entries)")
+            card_stats = self.email_service.card_cache.stats()
+            logger.info(f"Card cache: {card_stats['hits']} hits / {card_stats['misses']} misses (hit rate {card_stats['hit_rate']:.1%}, {card_stats['entries']} cards)")
+            copy_stats = self.email_service.recommendation_engine.copy_cache.stats()
+            logger.info(f"AI copy cache: {copy_stats['hits']} hits ({copy_stats['persistent_hits']} from MySQL) / {copy_stats['misses']} misses (hit rate {copy_stats['hit_rate']:.1%}, {copy_stats['entries']} entries)")
+            if config.EMAIL_COPY_MODE == 'library':
+                library_stats = self.email_service.recommendation_engine.copy_library.stats()
+                logger.info(f"Copy library: {library_stats['renders']} renders, {library_stats['general_fallbacks']} general fallbacks, {library_stats['misses']} misses ({library_stats['variants']} variants)")
+            if self.outbox:
+                try:
+                    depth = self.outbox.depth(cursor)
+                    logger.info(f"Email outbox: {depth['pending']} pending, {depth['sending']} sending, {depth['sent']} sent, {depth['dead']} dead")
+                except Exception as e:
+                    logger.warning(f"Could not read email outbox depth: {e}")
+            elif self.email_service.async_smtp and self.email_service.async_smtp.messages_sent:
+                async_stats = self.email_service.async_smtp.stats()
+                logger.info(f"Async SMTP: {async_stats['messages_sent']} sent over {async_stats['connections_opened']} connections ({async_stats['pipelined']} pipelined, {async_stats['reconnects']} reconnects, {async_stats['send_failures']} failures, {async_stats['fallbacks']} threaded fallbacks), {async_stats['messages_per_second']:.1f} msgs/sec")
+            if not self.outbox and self.email_service.smtp_pool and (not self.email_service.async_smtp or self.email_service.smtp_pool.messages_sent):
+                smtp_stats = self.email_service.smtp_pool.stats()
+                logger.info(f"SMTP pool: {smtp_stats['messages_sent']} sent over {smtp_stats['connections_opened']} connections ({smtp_stats['messages_per_connection']:.1f} per connection, {smtp_stats['reconnects']} reconnects, {smtp_stats['send_failures']} failures), {smtp_stats['messages_per_second']:.1f} msgs/sec")
+            index_stats = self.email_service.recommendation_engine.index_stats()
+            if index_stats['version'] is not None:
+                logger.info(f"Recommendation index: version {index_stats['version']}, {index_stats['products']} products, built in {index_stats['build_seconds']:.2f}s, {index_stats['age_seconds']:.0f}s old{' (rebuilding)' if index_stats['building'] else ''}")
+            
         except Exception as e:
             logger.error(f"Error checking abandoned carts: {e}")
     
+    async def _generate_and_send(self, job: Dict, semaphore: asyncio.Semaphore) -> bool:
+        """
+        Generate and send one cart's email (no DB access, safe to run concurrently)
+        
+        Returns:
+            True if the email was sent
+        """
+        queued = time.perf_counter()
+        async with semaphore:
+            self.email_service.recommendation_engine.llm_metrics.observe('email_slot_wait_seconds', time.perf_counter() - queued)
+            # Generate and send email with tracking log_id
+            email_content = await self.email_service.generate_email_content(
+                user=job['user'],
+                cart_items=job['cart_items'],
+                cart_total=job['cart_total'],
+                log_id=job['log_id'],
+                cart_hash=job['cart_hash']
+            )
+            
+            return await self._deliver(job, email_content)
+    
+    async def _generate_and_send_batched(self, jobs: List[Dict], semaphore: asyncio.Semaphore) -> List:
+        """
+        Batch-mode phase 2: prepare every email, write the copy for the whole
+        cycle with enhance_many (LLM_BATCH_SIZE carts per Groq call), then
+        render and send concurrently
+        
+        Returns:
+            Per job: True/False send result, or the exception that stopped it
+        """
+        drafts = []
+        for job in jobs:
+            try:
+                drafts.append(self.email_service.prepare_email(job['cart_items'], job['cart_total'], job['cart_hash']))
+            except Exception as e:
+                logger.error(f"Error generating email content: {e}")
+                drafts.append(e)
+        
+        prepared = [(job, draft) for job, draft in zip(jobs, drafts) if not isinstance(draft, BaseException)]
+        try:
+            texts = await self.email_service.recommendation_engine.enhance_many([
+                self.email_service.copy_request(job['user'], job['cart_items'], job['cart_total'], draft)
+                for job, draft in prepared
+            ])
+        except Exception as e:
+            logger.error(f"Error generating batched email copy: {e}")
+            return [e] * len(jobs)
+        ai_texts = {id(job): text for (job, _), text in zip(prepared, texts)}
+        
+        async def render_and_send(job, draft):
+            if isinstance(draft, BaseException):
+                raise draft
+            queued = time.perf_counter()
+            async with semaphore:
+                self.email_service.recommendation_engine.llm_metrics.observe('email_slot_wait_seconds', time.perf_counter() - queued)
+                email_content = self.email_service.render_email(job['user'], job['cart_items'], job['cart_total'], draft, ai_texts[id(job)], job['log_id'])
+                return await self._deliver(job, email_content)
+        
+        return await asyncio.gather(
+            *(render_and_send(job, draft) for job, draft in zip(jobs, drafts)),
+            return_exceptions=True
+        )
+    
+    async def _deliver(self, job: Dict, email_content: Dict) -> bool:
+        """Send the email now, or keep it on the job for phase 3 to queue (outbox mode)"""
+        if self.outbox:
+            job['email_content'] = email_content
+            return True
+        return await self.email_service.send_email(
+            to_email=job['user']['email'],
+            subject=email_content['subject'],
+            html_content=email_content['html'],
+            text_content=email_content['text']
+        )
+    
     def _log_abandonment_event(self, cursor, user_id: int, cart_hash: str, cart_total: float, email_sent: bool, discount_percent: float = 0):
         """Log abandonment event to database with cart hash for duplicate prevention"""
         try:
@@ -1457,6 +2164,11 @@ class CartAbandonmentDetector:
         self.running = True
         logger.info(f"Cart abandonment monitor started (checking every {config.CHECK_INTERVAL_SECONDS}s)")
         
+        # Warm the recommendation index before the first cycle so early emails get recommendations
+        engine = self.email_service.recommendation_engine
+        engine.start_background_rebuild()
+        await asyncio.to_thread(engine.wait_until_ready, config.INDEX_WARMUP_TIMEOUT_SECONDS)
+        
         while self.running:
             try:
                 await self.check_abandoned_carts()
@@ -1468,6 +2180,7 @@ class CartAbandonmentDetector:
     def stop_monitoring(self):
         """Stop the monitoring loop"""
         self.running = False
+        self.email_service.close()
         logger.info("Cart abandonment monitor stopped")
 
 
@@ -0,0 +1,151 @@
+"""
+Category Shards
+Per-category slices of the TF-IDF matrix plus a side index of high-similarity
+cross-category pairs, so a cart item is only scored against the products it
+could actually be recommended.
+"""
+
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from .product_store import NO_CATEGORY, ProductStore
+
+logger = logging.getLogger(__name__)
+
+# Residual norm left after prefix filtering (see _prefix_matrix)
+_PREFIX_RESIDUAL = 0.25
+_EPSILON = 1e-9
+
+
+class CategoryShards:
+    """
+    Category-sharded view of a recommendation index.
+
+    get_similar_products drops cross-category products unless their
+    similarity is at least min_cross_similarity. So for a cart item whose
+    product is in the index, the only rows worth scoring are:
+
+    - its own category's shard
+    - the shard of uncategorized products (never filtered)
+    - its precomputed cross-category neighbours with similarity >= min_cross_similarity
+
+    The side index is exact. Features that occur in only one category cannot
+    contribute to a cross-category dot product, so they are dropped first.
+    Candidate pairs then come from a prefix-filtered product, and every
+    candidate is verified with the exact dot product.
+    """
+
+    def __init__(self, store: ProductStore, tfidf_matrix, min_cross_similarity: float = 0.5, chunk_rows: int = 2048):
+        start = time.perf_counter()
+        self.min_cross_similarity = min_cross_similarity
+        matrix = sparse.csr_matrix(tfidf_matrix)
+
+        # code -> (row numbers, shard matrix)
+        self.shards: Dict[int, Tuple[np.ndarray, sparse.csr_matrix]] = {}
+        for code in np.unique(store.category_codes):
+            rows = np.flatnonzero(store.category_codes == code)
+            self.shards[int(code)] = (rows, matrix[rows])
+
+        # row -> rows in other categories with similarity >= min_cross_similarity
+        self.cross_category: Dict[int, np.ndarray] = self._build_cross_category(store, matrix, chunk_rows)
+        self.build_seconds = time.perf_counter() - start
+
+        pairs = sum(len(rows) for rows in self.cross_category.values())
+        logger.info(f"Built {len(self.shards)} category shards and {pairs} cross-category pairs in {self.build_seconds:.2f}s")
+
+    def candidate_shards(self, category_code: int, row: int) -> List[Tuple[np.ndarray, Optional[sparse.csr_matrix]]]:
+        """
+        Return (rows, matrix) pieces to score for a cart item in category_code whose product is at row.
+        A None matrix means the rows should be sliced from the full matrix.
+        """
+        pieces = []
+        for code in (category_code, NO_CATEGORY):
+            shard = self.shards.get(code)
+            if shard is not None:
+                pieces.append(shard)
+        side = self.cross_category.get(row)
+        if side is not None and len(side):
+            pieces.append((side, None))
+        return pieces
+
+    def _build_cross_category(self, store: ProductStore, matrix: sparse.csr_matrix, chunk_rows: int) -> Dict[int, np.ndarray]:
+        codes = store.category_codes
+        categorized = np.flatnonzero(codes != NO_CATEGORY)
+        if len(store.category_names) < 2 or len(categorized) == 0:
+            return {}
+
+        threshold = self.min_cross_similarity - _EPSILON
+        sub = matrix[categorized]
+        sub_codes = codes[categorized]
+
+        # Keep only features that appear in at least two categories
+        presence = sub.copy()
+        presence.data[:] = 1
+        onehot = sparse.csr_matrix(
+            (np.ones(len(categorized)), (np.arange(len(categorized)), sub_codes)),
+            shape=(len(categorized), len(store.category_names))
+        )
+        feature_categories = (presence.T @ onehot).tocsr()
+        shared = np.diff(feature_categories.indptr) > 1
+        shared_part = (sub @ sparse.diags(shared.astype(np.float64))).tocsr()
+        shared_part.eliminate_zeros()
+
+        # cos(a, b) <= |a_shared| * |b_shared|, so rows whose shared part is short can't reach the threshold
+        norms = np.sqrt(np.asarray(shared_part.multiply(shared_part).sum(axis=1)).ravel())
+        eligible = np.flatnonzero(norms >= threshold)
+        if len(eligible) < 2:
+            return {}
+
+        vectors = shared_part[eligible]
+        vectors_t = vectors.T.tocsr()
+        prefix = _prefix_matrix(vectors, _PREFIX_RESIDUAL)
+        eligible_codes = sub_codes[eligible]
+        eligible_rows = categorized[eligible]
+
+        cross_category = {}
+        for chunk_start in range(0, len(eligible), chunk_rows):
+            chunk_end = min(chunk_start + chunk_rows, len(eligible))
+            # a . b >= prefix(a) . b - residual, so anything below this can't reach the threshold
+            bounds = (prefix[chunk_start:chunk_end] @ vectors_t).tocsr()
+            for offset in range(chunk_end - chunk_start):
+                i = chunk_start + offset
+                start, end = bounds.indptr[offset], bounds.indptr[offset + 1]
+                cols = bounds.indices[start:end]
+                keep = (bounds.data[start:end] >= threshold - _PREFIX_RESIDUAL) & (eligible_codes[cols] != eligible_codes[i])
+                cols = cols[keep]
+                if len(cols) == 0:
+                    continue
+                exact = np.asarray((vectors[cols] @ vectors[i].T).todense()).ravel()
+                cols = cols[exact >= threshold]
+                if len(cols):
+                    cross_category[int(eligible_rows[i])] = eligible_rows[cols]
+        return cross_category
+
+
+def _prefix_matrix(matrix: sparse.csr_matrix, residual: float) -> sparse.csr_matrix:
+    """
+    Keep each row's heaviest features until the dropped ones have norm <= residual.
+
+    For unit-length b: a . b <= prefix(a) . b + |a - prefix(a)| <= prefix(a) . b + residual
+    """
+    lengths = np.diff(matrix.indptr)
+    row_ids = np.repeat(np.arange(matrix.shape[0]), lengths)
+    order = np.lexsort((-matrix.data, row_ids))
+    squares = matrix.data[order] ** 2
+
+    # Sum of squares from each position to the end of its row (inclusive)
+    cumulative = np.cumsum(squares)
+    row_end = np.cumsum(lengths)
+    row_total_cumulative = np.where(lengths > 0, cumulative[np.maximum(row_end - 1, 0)], 0.0)
+    from_here = row_total_cumulative[row_ids] - cumulative + squares
+
+    keep = from_here > residual * residual
+    kept = order[keep]
+    return sparse.csr_matrix(
+        (matrix.data[kept], (row_ids[keep], matrix.indices[kept])),
+        shape=matrix.shape
+    )
@@ -24,17 +24,82 @@ FREE_SHIPPING_ENABLED = True
 SENDER_EMAIL = os.getenv('MAIL_USERNAME', 'noreply@ecommerce.com')
 SENDER_NAME = 'ECommerceStore'
 EMAIL_TEMPLATE_PATH = 'templates/emails/cart_abandonment.html'
+SMTP_POOL_ENABLED = True  # Send through pooled, logged-in SMTP connections (smtp_pool.py) instead of connecting per email
+SMTP_POOL_SIZE = 4  # Concurrent SMTP connections (and sends) per process
+SMTP_MAX_MESSAGES_PER_CONNECTION = 100  # A connection is closed and replaced after this many messages (0 = no limit)
+SMTP_IDLE_TIMEOUT_SECONDS = 60  # Idle connections older than this are closed instead of reused (keep below the server's timeout)
+SMTP_TIMEOUT_SECONDS = 30  # Socket timeout, and max wait for a free pooled connection
+SMTP_ASYNC_ENABLED = True  # Send from the detector's event loop over pipelined asyncio connections (smtp_async.py); falls back to the pool in a thread
+SMTP_ASYNC_CONNECTIONS = 2  # Connections the async client opens per process (each pipelines many messages)
+EMAIL_DELIVERY_MODE = 'inline'  # 'inline' sends during the detection cycle; 'outbox' queues rendered emails for outbox_worker.py
+OUTBOX_BATCH_SIZE = 20  # Messages one worker claims per poll
+OUTBOX_WORKER_CONCURRENCY = 4  # Messages one worker sends at once (at most SMTP_POOL_SIZE use the pool concurrently)
+OUTBOX_POLL_SECONDS = 2  # Worker sleep when the outbox had no full batch due
+OUTBOX_MAX_ATTEMPTS = 5  # Deliveries tried before a message is dead-lettered
+OUTBOX_RETRY_BASE_SECONDS = 30  # First retry delay; doubles per attempt
+OUTBOX_RETRY_MAX_SECONDS = 3600  # Retry delay cap
+OUTBOX_CLAIM_TIMEOUT_SECONDS = 300  # Messages left 'sending' (crashed worker) are claimed again after this long
 
 # Groq AI Settings (Fast & Free)
 GROQ_API_KEY = os.getenv('GROQ_API_KEY', '')
 GROQ_MODEL = 'llama-3.3-70b-versatile'  # Latest model (as of Oct 2025)
-GROQ_BASE_URL = 'https://api.groq.com/openai/v1'
+GROQ_BASE_URL = os.getenv('GROQ_BASE_URL', 'https://api.groq.com/openai/v1')  # Override to use mock_llm_server.py or another OpenAI-compatible endpoint
 GROQ_TEMPERATURE = 0.7
 GROQ_MAX_TOKENS = 200
+GROQ_STREAM = False  # Stream single-email completions and close the stream once the copy is complete
+GROQ_STREAM_MAX_WORDS = 150  # Streamed copy ends at the sentence that reaches this many words
+GROQ_INPUT_COST_PER_MILLION_TOKENS = 0.59  # USD, for the llm_cost_usd_total metric (GROQ_MODEL pricing)
+GROQ_OUTPUT_COST_PER_MILLION_TOKENS = 0.79  # USD per million completion tokens
+GROQ_REQUESTS_PER_MINUTE = 30  # Groq rate limit for GROQ_MODEL (0 disables client-side limiting)
+GROQ_TOKENS_PER_MINUTE = 12000  # Groq token rate limit (prompt + completion, 0 disables)
+GROQ_RATE_LIMIT_BURST_SECONDS = 5  # Rate limiters allow bursts of this many seconds' worth of quota
+LLM_MAX_CONCURRENCY = 8  # Carts generated and sent concurrently per detector cycle
+LLM_BATCH_SIZE = 1  # Carts written by one Groq request as a JSON object (1 = one request per email)
+GROQ_TIMEOUT_SECONDS = 10  # Per-attempt HTTP timeout of the Groq client
+GROQ_MAX_RETRIES = 1  # Client retries on connection errors, 429s and 5xx
+GROQ_DEADLINE_SECONDS = 15  # Hard deadline per email (all attempts); fallback copy is used after it
+GROQ_HEDGE_AFTER_SECONDS = 6  # Send fallback copy if Groq hasn't answered by then (0 = wait for the deadline)
+GROQ_BREAKER_FAILURE_THRESHOLD = 5  # Consecutive Groq failures that open the circuit breaker
+GROQ_BREAKER_RESET_SECONDS = 60  # Open breaker lets one trial call through after this long
+LLM_PROVIDERS = os.getenv('LLM_PROVIDERS', '')  # JSON list of OpenAI-compatible endpoints (see providers.py); empty = GROQ_* only
+LLM_PROVIDER_EWMA_ALPHA = 0.3  # Weight of the newest latency sample in each provider's routing score
+LLM_PROVIDER_FAILURE_THRESHOLD = 3  # Consecutive failures that take one provider out of rotation
+LLM_PROVIDER_RESET_SECONDS = 30  # A provider out of rotation gets a trial call after this long
+LLM_PROVIDER_HEALTH_CHECK_SECONDS = 15  # Probe providers out of rotation this often (0 = only via trial calls)
+
+# LLM Copy Cache Settings
+LLM_COPY_CACHE_ENABLED = True  # Reuse sanitized Groq copy for identical prompt signatures
+LLM_COPY_CACHE_SIZE = 2048  # Signatures kept in memory
+LLM_COPY_CACHE_TTL_SECONDS = 21600  # Cached copy expires after 6 hours
+LLM_COPY_MAX_REUSE = 3  # Times one piece of copy is served before it is regenerated (keeps variety)
+LLM_COPY_CACHE_PERSIST = True  # Also store copy in MySQL llm_copy_cache (migrations/create_llm_copy_cache.py)
+
+# Email Copy Library Settings
+EMAIL_COPY_MODE = 'library'  # 'library' fills pre-generated copy (pregenerate_copy.py); 'live' calls Groq per email
+COPY_LIBRARY_VARIANTS = 5  # Variants pre-generated per (category, discount tier, tone)
+COPY_LIBRARY_REFRESH_SECONDS = 900  # Reload the email_copy_library table this often
 
 # Recommendation Settings
 RECOMMENDATION_COUNT = 3
 SIMILARITY_THRESHOLD = 0.01  # Very low threshold to ensure recommendations (was 0.1)
+RECOMMENDATION_CACHE_SIZE = 1024  # Cached recommendation lists (0 disables the cache)
+RECOMMENDATION_CACHE_TTL_SECONDS = 900  # Cached lists expire after 15 minutes
+EMAIL_CARD_CACHE_SIZE = 4096  # Rendered recommendation cards kept per process (0 disables the cache)
+INDEX_REBUILD_INTERVAL_SECONDS = 900  # Rebuild the product index in the background every 15 minutes
+INDEX_WARMUP_TIMEOUT_SECONDS = 120  # Max wait for the first index build when the monitor starts
+CATEGORY_SHARDING_ENABLED = True  # Score cart items against their own category's shard only
+CROSS_CATEGORY_MIN_SIMILARITY = 0.5  # Cross-category products below this similarity are never recommended
+STEM_CACHE_SIZE = 500000  # Token -> stem entries kept in memory across index builds
+STEM_TABLE_PATH = os.getenv('STEM_TABLE_PATH', '')  # Optional JSON file persisting the stem cache between restarts
+RECOMMENDATION_VECTORIZER = 'tfidf'  # 'tfidf' (vocabulary) or 'hashing' (streamed, bounded memory for huge catalogs)
+HASHING_N_FEATURES = 2 ** 20  # Hashed feature columns in 'hashing' mode (more = fewer collisions)
+STREAM_CHUNK_SIZE = 5000  # Products fetched and preprocessed per chunk while building the index
+
+# Co-purchase (collaborative filtering) Settings
+COPURCHASE_ENABLED = True  # Blend order_items co-purchase signal into recommendations
+COPURCHASE_BLEND_WEIGHT = 0.3  # 0 = TF-IDF only, 1 = co-purchase only
+COPURCHASE_TOP_K = 20  # Neighbours precomputed per product
+COPURCHASE_MIN_COUNT = 1  # Minimum times two products were bought together
 
 # Database Settings
 MYSQL_HOST = os.getenv('MYSQL_HOST', 'localhost')
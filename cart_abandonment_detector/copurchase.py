@@ -0,0 +1,206 @@
+"""
+Co-Purchase Model
+Item-item collaborative filtering built from order_items co-occurrence.
+"""
+
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from . import config
+
+logger = logging.getLogger(__name__)
+
+_EMPTY_NEIGHBORS = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64))
+
+
+class CoPurchaseModel:
+    """
+    Sparse item-item co-occurrence model.
+
+    Each order is a basket of product ids. Co-occurrence counts are kept in a
+    symmetric sparse matrix and scored with cosine normalization
+    (count_ij / sqrt(orders_i * orders_j)). The top-K neighbours of every
+    product are precomputed, so lookups at recommendation time are a dict
+    access with no matrix work. New orders are folded in incrementally and
+    only the affected products get their top-K recomputed.
+    """
+
+    def __init__(self, top_k: int = None, min_count: int = None):
+        self.top_k = top_k or config.COPURCHASE_TOP_K
+        self.min_count = min_count or config.COPURCHASE_MIN_COUNT
+
+        self._columns: Dict[int, int] = {}  # product id -> matrix column
+        self._product_ids = np.empty(0, dtype=np.int64)
+        self._counts = sparse.csr_matrix((0, 0), dtype=np.float64)
+        self._order_counts = np.empty(0, dtype=np.float64)
+
+        # product id -> (neighbour product ids, scores), best first
+        self.neighbors: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+        self.version = 0
+        self.orders_seen = 0
+
+        # Incremental refresh watermark (orders.created_at)
+        self._watermark: Optional[datetime] = None
+        self._watermark_orders: Set[str] = set()
+        # Held from reading the watermark until its orders are added, so concurrent
+        # refreshes (index builder + detector cycle) never count an order twice
+        self._refresh_lock = threading.Lock()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.neighbors)
+
+    def similar(self, product_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Return precomputed (neighbour ids, scores) for a product"""
+        return self.neighbors.get(int(product_id), _EMPTY_NEIGHBORS)
+
+    def add_baskets(self, baskets: Iterable[Iterable[int]]) -> int:
+        """
+        Fold new order baskets into the model
+
+        Args:
+            baskets: Iterable of baskets, each an iterable of product ids
+
+        Returns:
+            Number of baskets (with 2+ distinct products) that were added
+        """
+        baskets = [sorted({int(product_id) for product_id in basket}) for basket in baskets]
+        baskets = [basket for basket in baskets if len(basket) > 1]
+        if not baskets:
+            return 0
+
+        with self._lock:
+            # Assign columns to products seen for the first time
+            new_ids = []
+            for basket in baskets:
+                for product_id in basket:
+                    if product_id not in self._columns:
+                        self._columns[product_id] = len(self._columns)
+                        new_ids.append(product_id)
+            size = len(self._columns)
+            if new_ids:
+                self._product_ids = np.concatenate([self._product_ids, np.asarray(new_ids, dtype=np.int64)])
+                self._order_counts = np.concatenate([self._order_counts, np.zeros(len(new_ids))])
+                counts = self._counts.tocoo()
+                self._counts = sparse.csr_matrix((counts.data, (counts.row, counts.col)), shape=(size, size))
+
+            # Basket x item incidence matrix; B.T @ B gives pairwise co-occurrence
+            rows = np.repeat(np.arange(len(baskets)), [len(basket) for basket in baskets])
+            cols = np.fromiter((self._columns[p] for basket in baskets for p in basket), dtype=np.int64)
+            incidence = sparse.csr_matrix((np.ones(len(cols)), (rows, cols)), shape=(len(baskets), size))
+            delta = (incidence.T @ incidence).tocsr()
+
+            self._order_counts += delta.diagonal()
+            delta.setdiag(0)
+            delta.eliminate_zeros()
+            self._counts = (self._counts + delta).tocsr()
+
+            # Cosine scores change for touched products and everyone co-bought with them
+            touched = np.unique(cols)
+            affected = np.union1d(touched, self._counts[touched].indices)
+            self._recompute_neighbors(affected)
+
+            self.orders_seen += len(baskets)
+            self.version += 1
+
+        logger.info(f"Co-purchase model updated: +{len(baskets)} orders, {len(affected)} products rescored (version {self.version})")
+        return len(baskets)
+
+    def _recompute_neighbors(self, columns: np.ndarray):
+        """Recompute top-K neighbours for the given matrix columns"""
+        counts = self._counts
+        norms = np.sqrt(np.maximum(self._order_counts, 1))
+        for col in columns:
+            start, end = counts.indptr[col], counts.indptr[col + 1]
+            if start == end:
+                self.neighbors.pop(int(self._product_ids[col]), None)
+                continue
+
+            neighbor_cols = counts.indices[start:end]
+            co_counts = counts.data[start:end]
+            keep = co_counts >= self.min_count
+            neighbor_cols, co_counts = neighbor_cols[keep], co_counts[keep]
+            if len(neighbor_cols) == 0:
+                self.neighbors.pop(int(self._product_ids[col]), None)
+                continue
+
+            scores = co_counts / (norms[col] * norms[neighbor_cols])
+            if len(scores) > self.top_k:
+                top = np.argpartition(scores, -self.top_k)[-self.top_k:]
+                neighbor_cols, scores = neighbor_cols[top], scores[top]
+            order = np.argsort(scores)[::-1]
+
+            # Single dict assignment, so concurrent readers see old or new, never partial
+            self.neighbors[int(self._product_ids[col])] = (self._product_ids[neighbor_cols[order]], scores[order])
+
+    def refresh_from_db(self, connection_factory) -> int:
+        """
+        Load orders created since the last refresh and fold them in
+
+        Args:
+            connection_factory: Callable returning a DictCursor MySQL connection
+
+        Returns:
+            Number of new baskets added
+        """
+        with self._refresh_lock:
+            conn = connection_factory()
+            cursor = conn.cursor()
+            try:
+                if self._watermark is None:
+                    cursor.execute("""
+                        SELECT oi.order_id, oi.product_id, o.created_at
+                        FROM order_items oi
+                        JOIN orders o ON oi.order_id = o.id
+                        WHERE o.status != 'cancelled'
+                        ORDER BY o.created_at
+                    """)
+                else:
+                    # >= so orders sharing the watermark timestamp are not missed;
+                    # ones already counted are skipped below
+                    cursor.execute("""
+                        SELECT oi.order_id, oi.product_id, o.created_at
+                        FROM order_items oi
+                        JOIN orders o ON oi.order_id = o.id
+                        WHERE o.status != 'cancelled'
+                        AND o.created_at >= %s
+                        ORDER BY o.created_at
+                    """, (self._watermark,))
+                rows = cursor.fetchall()
+            finally:
+                cursor.close()
+                conn.close()
+
+            baskets: Dict[str, List[int]] = {}
+            latest = self._watermark
+            for row in rows:
+                if row['created_at'] == self._watermark and row['order_id'] in self._watermark_orders:
+                    continue
+                baskets.setdefault(row['order_id'], []).append(row['product_id'])
+                if latest is None or row['created_at'] > latest:
+                    latest = row['created_at']
+
+            if latest != self._watermark:
+                self._watermark_orders = set()
+            self._watermark = latest
+            self._watermark_orders.update(
+                row['order_id'] for row in rows if row['created_at'] == latest
+            )
+
+            return self.add_baskets(baskets.values())
+
+    def stats(self) -> Dict:
+        """Return model size information"""
+        return {
+            'products': len(self._columns),
+            'products_with_neighbors': len(self.neighbors),
+            'pairs': int(self._counts.nnz // 2),
+            'orders_seen': self.orders_seen,
+            'version': self.version,
+            'watermark': self._watermark.isoformat() if self._watermark else None,
+        }
@@ -0,0 +1,246 @@
+"""
+LLM Copy Cache
+Reuses sanitized Groq email copy for identical prompt signatures, with TTL,
+a per-signature reuse cap and an optional MySQL tier that survives restarts.
+"""
+
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+from .copy_library import CUSTOMER_SLOT
+
+logger = logging.getLogger(__name__)
+
+# Bump when the prompt changes in a way that makes old copy unsuitable
+# (2: the prompt carries CUSTOMER_SLOT instead of the customer's name)
+PROMPT_VERSION = 2
+
+_CUSTOMER_SLOT = re.compile(rf'\b{CUSTOMER_SLOT}\b')
+
+# Purge expired persistent rows at most this often
+_PURGE_INTERVAL_SECONDS = 3600
+
+
+def copy_signature(cart_items: List[Dict], discount_percent: float, tone: str, approach: str, style: str,
+                   recommendation_ids: List[int], model: str) -> str:
+    """
+    Normalized prompt signature for a Groq email request
+
+    Everything the prompt depends on (the customer is only named by
+    CUSTOMER_SLOT, so the signature is the same for every customer): cart product ids with quantities (the
+    prompt includes line totals), the discount tier, the randomly chosen
+    tone/approach/style, the highlighted recommendation ids and the model.
+    """
+    signature = {
+        'v': PROMPT_VERSION,
+        'model': model,
+        'cart': sorted((int(item['product_id']), int(item.get('quantity', 1))) for item in cart_items),
+        'discount': float(discount_percent),
+        'tone': tone,
+        'approach': approach,
+        'style': style,
+        'recs': sorted(int(product_id) for product_id in recommendation_ids),
+    }
+    return hashlib.sha256(json.dumps(signature, sort_keys=True).encode()).hexdigest()
+
+
+def cacheable(text: str) -> bool:
+    """
+    True if copy can be reused for other customers
+
+    Live prompts name the customer only as CUSTOMER_SLOT, so the model never
+    sees a real name; copy that addresses the customer through the slot is
+    filled per recipient by personalize(). Copy without the slot is sent
+    once and not cached.
+    """
+    return bool(text) and _CUSTOMER_SLOT.search(text) is not None
+
+
+def personalize(text: str, user_name: str) -> str:
+    """Fill CUSTOMER_SLOT in generated or cached copy with this customer's name"""
+    name = user_name or 'there'
+    return _CUSTOMER_SLOT.sub(lambda _: name, text)
+
+
+class LLMCopyCache:
+    """
+    Two-tier cache of sanitized LLM email copy that names the customer only
+    through CUSTOMER_SLOT (see cacheable()).
+
+    The memory tier is an LRU OrderedDict. The persistent tier is the
+    llm_copy_cache table (migrations/create_llm_copy_cache.py): lookups that
+    miss in memory fall through to it and stores are written through, so a
+    restart does not flush the cache. Every entry expires after ttl_seconds
+    and is dropped after max_reuse uses, so popular carts still get fresh copy
+    regularly. Persistent-tier errors are logged and the cache carries on in
+    memory only.
+    """
+
+    def __init__(self, max_entries: int = 2048, ttl_seconds: float = 21600, max_reuse: int = 3,
+                 connection_factory: Optional[Callable] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_reuse = max_reuse
+        self._connection_factory = connection_factory
+        self._persistent = connection_factory is not None
+        self._entries: 'OrderedDict[str, Dict]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.exhausted = 0
+        self.expirations = 0
+        self.persistent_errors = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, signature: str) -> Optional[str]:
+        """
+        Return cached copy for a signature and count one use, or None
+
+        Returns:
+            Depersonalized copy (see personalize) or None on miss
+        """
+        if self.max_entries <= 0:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(signature)
+            if entry is not None and time.time() >= entry['expires_at']:
+                del self._entries[signature]
+                self.expirations += 1
+                entry = None
+
+        if entry is None and self._persistent:
+            entry = self._load(signature)
+            if entry is not None:
+                self.persistent_hits += 1
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        with self._lock:
+            if entry['uses'] >= self.max_reuse:
+                self._entries.pop(signature, None)
+                self.misses += 1
+                return None
+            entry['uses'] += 1
+            if entry['uses'] >= self.max_reuse:
+                # Reuse cap reached: this is the last time this copy is served
+                self._entries.pop(signature, None)
+                self.exhausted += 1
+            else:
+                self._entries[signature] = entry
+                self._entries.move_to_end(signature)
+                self._evict()
+            self.hits += 1
+
+        if self._persistent:
+            self._record_use(signature, entry['uses'] >= self.max_reuse)
+        return entry['text']
+
+    def put(self, signature: str, text: str):
+        """Store freshly generated, sanitized copy (only if cacheable())"""
+        if self.max_entries <= 0 or self.max_reuse <= 1 or not cacheable(text):
+            return
+        entry = {'text': text, 'uses': 1, 'expires_at': time.time() + self.ttl_seconds}
+        with self._lock:
+            self._entries[signature] = entry
+            self._entries.move_to_end(signature)
+            self._evict()
+            self.stores += 1
+
+        if self._persistent:
+            self._save(signature, entry)
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    # --- persistent tier -------------------------------------------------
+
+    def _execute(self, query: str, params: tuple, fetch: bool = False):
+        conn = self._connection_factory()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(query, params)
+            result = cursor.fetchone() if fetch else None
+            conn.commit()
+            return result
+        finally:
+            cursor.close()
+            conn.close()
+
+    def _persistent_error(self, action: str, error: Exception):
+        self.persistent_errors += 1
+        if "doesn't exist" in str(error):
+            # Migration not run: stop trying for the rest of this process
+            self._persistent = False
+            logger.warning("llm_copy_cache table not found, copy cache is memory-only (run migrations/create_llm_copy_cache.py)")
+        else:
+            logger.warning(f"Copy cache {action} failed: {error}")
+
+    def _load(self, signature: str) -> Optional[Dict]:
+        try:
+            row = self._execute("""
+                SELECT copy_text, uses, UNIX_TIMESTAMP(expires_at) AS expires_at
+                FROM llm_copy_cache
+                WHERE signature = %s AND expires_at > NOW() AND uses < %s
+            """, (signature, self.max_reuse), fetch=True)
+        except Exception as e:
+            self._persistent_error('lookup', e)
+            return None
+        if not row:
+            return None
+        return {'text': row['copy_text'], 'uses': int(row['uses']), 'expires_at': float(row['expires_at'])}
+
+    def _record_use(self, signature: str, exhausted: bool):
+        try:
+            if exhausted:
+                self._execute("DELETE FROM llm_copy_cache WHERE signature = %s", (signature,))
+            else:
+                self._execute("UPDATE llm_copy_cache SET uses = uses + 1 WHERE signature = %s", (signature,))
+        except Exception as e:
+            self._persistent_error('update', e)
+
+    def _save(self, signature: str, entry: Dict):
+        try:
+            self._execute("""
+                INSERT INTO llm_copy_cache (signature, copy_text, uses, expires_at)
+                VALUES (%s, %s, %s, FROM_UNIXTIME(%s))
+                ON DUPLICATE KEY UPDATE copy_text = VALUES(copy_text), uses = VALUES(uses), expires_at = VALUES(expires_at)
+            """, (signature, entry['text'], entry['uses'], entry['expires_at']))
+
+            if time.time() - self._last_purge > _PURGE_INTERVAL_SECONDS:
+                self._last_purge = time.time()
+                self._execute("DELETE FROM llm_copy_cache WHERE expires_at <= NOW()", ())
+        except Exception as e:
+            self._persistent_error('store', e)
+
+    def stats(self) -> Dict:
+        """Return hit-rate metrics"""
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'persistent': self._persistent,
+            'hits': self.hits,
+            'persistent_hits': self.persistent_hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits / lookups) if lookups else 0.0,
+            'stores': self.stores,
+            'exhausted': self.exhausted,
+            'expirations': self.expirations,
+            'persistent_errors': self.persistent_errors,
+        }
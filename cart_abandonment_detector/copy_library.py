@@ -0,0 +1,179 @@
+"""
+Copy Library
+Pre-generated, pre-sanitized email copy variants per (category, discount tier),
+filled in at send time so the LLM stays off the send path.
+"""
+
+import logging
+import random
+import re
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .product_store import normalize_category
+from .sanitizer import sanitize_text
+
+logger = logging.getLogger(__name__)
+
+# Slots the pre-generation prompt asks the model to keep verbatim. They are
+# plain word characters, so they survive the email sanitizer unchanged.
+CUSTOMER_SLOT = 'CUSTOMER_NAME'
+CART_ITEM_SLOT = 'CART_ITEM'
+RECOMMENDATION_SLOT = 'RECOMMENDED_ITEM'
+
+# Variants for categories without their own copy
+GENERAL_CATEGORY = 'general'
+
+# Said in place of RECOMMENDED_ITEM when a cart has no recommendations
+_NO_RECOMMENDATION_TEXT = 'a few of our related picks'
+
+_SLOTS = re.compile(rf'\b(?:{CUSTOMER_SLOT}|{CART_ITEM_SLOT}|{RECOMMENDATION_SLOT})\b')
+
+
+def has_required_slots(text: str) -> bool:
+    """True if generated copy kept the customer and cart item slots"""
+    return CUSTOMER_SLOT in text and CART_ITEM_SLOT in text
+
+
+class CopyLibrary:
+    """
+    In-memory view of the email_copy_library table
+    (migrations/create_email_copy_library.py), filled by pregenerate_copy.py.
+
+    Variants are grouped by (normalized category, discount percent) and
+    reloaded every refresh_seconds. Use counts are kept in memory and written
+    back in one batch on reload. If the table is missing or empty the library
+    reports itself unavailable and callers generate copy live instead.
+    """
+
+    def __init__(self, connection_factory: Callable, refresh_seconds: float = 900):
+        self._connection_factory = connection_factory
+        self.refresh_seconds = refresh_seconds
+        self._variants: Dict[Tuple[str, int], List[Dict]] = {}
+        self._loaded_at: Optional[float] = None
+        self._table_missing = False
+        self._lock = threading.Lock()
+        self._pending_uses: Counter = Counter()
+
+        self.renders = 0
+        self.general_fallbacks = 0
+        self.misses = 0
+        self.load_errors = 0
+
+    def __len__(self) -> int:
+        return sum(len(variants) for variants in self._variants.values())
+
+    def ensure_loaded(self) -> bool:
+        """
+        Load the table on first use and reload it once it is stale (blocking)
+
+        Returns:
+            True if there is any copy to render from
+        """
+        if self._table_missing:
+            return False
+        stale = self._loaded_at is None or time.monotonic() - self._loaded_at >= self.refresh_seconds
+        if stale:
+            with self._lock:
+                if self._loaded_at is None or time.monotonic() - self._loaded_at >= self.refresh_seconds:
+                    self.load()
+        return bool(self._variants)
+
+    def load(self) -> int:
+        """Flush use counts and (re)load every variant; returns the variant count"""
+        # Set first so a failing database is retried once per refresh, not per email
+        self._loaded_at = time.monotonic()
+        try:
+            conn = self._connection_factory()
+            cursor = conn.cursor()
+            try:
+                self._flush_uses(cursor)
+                conn.commit()
+                cursor.execute("""
+                    SELECT id, category, discount_percent, tone, copy_text
+                    FROM email_copy_library
+                """)
+                rows = cursor.fetchall()
+            finally:
+                cursor.close()
+                conn.close()
+        except Exception as e:
+            self.load_errors += 1
+            if "doesn't exist" in str(e):
+                self._table_missing = True
+                logger.warning("email_copy_library table not found, generating copy live (run migrations/create_email_copy_library.py)")
+            else:
+                logger.warning(f"Copy library load failed: {e}")
+            return len(self)
+
+        variants: Dict[Tuple[str, int], List[Dict]] = {}
+        for row in rows:
+            key = (normalize_category(row['category']), int(row['discount_percent']))
+            variants.setdefault(key, []).append({'id': row['id'], 'tone': row['tone'], 'text': row['copy_text']})
+        self._variants = variants
+        logger.info(f"📚 Copy library loaded: {len(rows)} variants for {len(variants)} (category, discount) combinations")
+        return len(rows)
+
+    def _flush_uses(self, cursor):
+        pending, self._pending_uses = self._pending_uses, Counter()
+        if pending:
+            cursor.executemany(
+                "UPDATE email_copy_library SET times_used = times_used + %s WHERE id = %s",
+                [(uses, variant_id) for variant_id, uses in pending.items()]
+            )
+
+    def choose(self, category: Optional[str], discount_percent: float) -> Optional[Dict]:
+        """Random variant for a category and discount tier, falling back to general copy"""
+        discount_key = int(discount_percent)
+        variants = self._variants.get((normalize_category(category), discount_key))
+        if not variants:
+            variants = self._variants.get((GENERAL_CATEGORY, discount_key))
+            if variants:
+                self.general_fallbacks += 1
+        if not variants:
+            self.misses += 1
+            return None
+        return random.choice(variants)
+
+    def render(self, recommendations: List[Dict], user_name: str, cart_items: List[Dict], discount_percent: float) -> Optional[str]:
+        """
+        Fill a library variant for this cart
+
+        The copy is chosen by the category of the cart's most valuable item;
+        its name fills CART_ITEM and the first recommendation fills RECOMMENDED_ITEM.
+
+        Returns:
+            Sanitized email copy, or None if the library has nothing for this cart
+        """
+        if not cart_items:
+            return None
+        lead_item = max(cart_items, key=lambda item: float(item.get('total', item.get('price', 0)) or 0))
+        variant = self.choose(lead_item.get('category'), discount_percent)
+        if variant is None:
+            return None
+
+        values = {
+            CUSTOMER_SLOT: user_name or 'there',
+            CART_ITEM_SLOT: lead_item.get('name') or 'your selection',
+            RECOMMENDATION_SLOT: recommendations[0]['name'] if recommendations else _NO_RECOMMENDATION_TEXT,
+        }
+        text = _SLOTS.sub(lambda match: values[match.group(0)], variant['text'])
+
+        self._pending_uses[variant['id']] += 1
+        self.renders += 1
+        # Slot values come from the database, so the filled copy is sanitized like live copy
+        return sanitize_text(text, 'email')
+
+    def stats(self) -> Dict:
+        """Return library size and render counters"""
+        return {
+            'variants': len(self),
+            'combinations': len(self._variants),
+            'available': not self._table_missing and bool(self._variants),
+            'renders': self.renders,
+            'general_fallbacks': self.general_fallbacks,
+            'misses': self.misses,
+            'load_errors': self.load_errors,
+        }
@@ -0,0 +1,99 @@
+"""
+Streamed Copy
+Assembles a streamed Groq completion into clean email copy sentence by
+sentence, so the stream can be closed as soon as the copy is long enough or
+the model starts signing off, instead of waiting for GROQ_MAX_TOKENS.
+"""
+
+import re
+from types import SimpleNamespace
+from typing import Callable, List, Optional, Sequence
+
+# A sentence is complete once its terminator is followed by whitespace
+# (so decimals and URLs are never split mid-token)
+_SENTENCE_END = re.compile(r'[.!?]+["\')]*\s+|\n+')
+
+# Why a stream was closed before the model finished
+CUTOFF_WORD_BUDGET = 'word_budget'
+CUTOFF_CLOSING = 'closing'
+
+
+class StreamedCopy:
+    """
+    Incremental equivalent of RecommendationEngine._clean_ai_text
+
+    Deltas are buffered until a sentence completes; each completed sentence
+    is sanitized on its own (email sanitization collapses whitespace, so the
+    joined sentences match sanitizing the whole text) and checked against the
+    signature patterns. A match ends the copy at the sign-off - the same text
+    the post-processing would strip - and reaching max_words ends it at the
+    sentence that crossed the budget.
+    """
+
+    def __init__(self, clean_fragment: Callable[[str], str], closing_patterns: Sequence[re.Pattern], max_words: int = 150):
+        self.clean_fragment = clean_fragment
+        self.closing_patterns = closing_patterns
+        self.max_words = max_words
+        self.cutoff: Optional[str] = None
+        self.words = 0
+        self._pending = ''
+        self._sentences: List[str] = []
+
+    @property
+    def done(self) -> bool:
+        return self.cutoff is not None
+
+    def feed(self, delta: str) -> bool:
+        """
+        Add streamed text
+
+        Returns:
+            True once the copy is complete and the stream can be closed
+        """
+        if self.done or not delta:
+            return self.done
+        self._pending += delta
+        end = 0
+        for match in _SENTENCE_END.finditer(self._pending):
+            self._accept(self._pending[end:match.end()])
+            end = match.end()
+            if self.done:
+                break
+        self._pending = self._pending[end:]
+        return self.done
+
+    def finish(self) -> str:
+        """Flush the unterminated tail (when the model stopped by itself) and return the copy"""
+        if not self.done and self._pending.strip():
+            self._accept(self._pending)
+        self._pending = ''
+        return ' '.join(self._sentences).strip()
+
+    def _accept(self, sentence: str):
+        text = self.clean_fragment(sentence)
+        for pattern in self.closing_patterns:
+            match = pattern.search(text)
+            if match:
+                text = text[:match.start()]
+                self.cutoff = CUTOFF_CLOSING
+        text = text.strip()
+        if text:
+            self._sentences.append(text)
+            self.words += len(text.split())
+        if not self.done and self.max_words and self.words >= self.max_words:
+            self.cutoff = CUTOFF_WORD_BUDGET
+
+
+def streamed_completion(text: str, finish_reason: Optional[str], usage=None) -> SimpleNamespace:
+    """
+    Response object shaped like a non-streamed chat completion
+
+    `cleaned` tells callers the content already went through the sanitizer
+    and signature stripping.
+    """
+    message = SimpleNamespace(role='assistant', content=text)
+    return SimpleNamespace(
+        choices=[SimpleNamespace(index=0, message=message, finish_reason=finish_reason)],
+        usage=usage,
+        cleaned=True,
+    )
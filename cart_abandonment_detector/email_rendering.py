@@ -0,0 +1,121 @@
+"""
+Email Rendering
+Precompiled Jinja2 templates for the cart abandonment email (templates/email).
+Templates are compiled once per process, HTML is autoescaped, and the static
+header and footer are rendered once and reused for every email.
+"""
+
+import os
+from functools import lru_cache
+from typing import Dict, Iterable, List, Mapping, Optional
+
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from markupsafe import Markup
+
+from . import config
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates', 'email')
+
+STORE_NAME = 'ECommerceStore'
+SUPPORT_EMAIL = 'support@ecommerce.com'
+
+# Hours shown in the urgency banner
+OFFER_HOURS = 24
+
+DESCRIPTION_PREVIEW_LENGTH = 100
+
+
+def _money(value) -> str:
+    return f"{value:.2f}"
+
+
+def _preview(description: Optional[str]) -> str:
+    """Recommendation card description: first 100 characters, with a default"""
+    desc = description or 'A great product for you'
+    return desc[:DESCRIPTION_PREVIEW_LENGTH] + "..." if len(desc) > DESCRIPTION_PREVIEW_LENGTH else desc
+
+
+class EmailRenderer:
+    """
+    Renders the HTML and plain-text cart abandonment email
+
+    Every interpolated value is escaped in the HTML templates (product names,
+    AI copy, URLs). Each email is one render call per part: the cart table is
+    a loop inside cart_abandonment.html, while recommendation cards are
+    rendered per product (recommendation_card, cached by CardFragmentCache)
+    and embedded as Markup like the pre-rendered header and footer.
+    """
+
+    def __init__(self, template_dir: str = TEMPLATE_DIR):
+        self.env = Environment(
+            loader=FileSystemLoader(template_dir),
+            autoescape=select_autoescape(enabled_extensions=('html',), default_for_string=True),
+            trim_blocks=True,
+            lstrip_blocks=True,
+            keep_trailing_newline=True,
+            # Compiled templates are never re-checked against the files
+            auto_reload=False,
+        )
+        # The templates use none of Jinja's default globals (range, cycler, ...);
+        # without them every render skips merging them into a fresh context
+        self.env.globals.clear()
+        self.env.filters['money'] = _money
+        self.env.filters['preview'] = _preview
+
+        self.html_template = self.env.get_template('cart_abandonment.html')
+        self.text_template = self.env.get_template('cart_abandonment.txt')
+        self.card_template = self.env.get_template('_recommendation_card.html')
+
+        # Static shell: rendered once, embedded in every email
+        shell = {'store_name': STORE_NAME, 'support_email': SUPPORT_EMAIL}
+        self.header = Markup(self.env.get_template('_header.html').render(shell))
+        self.footer = Markup(self.env.get_template('_footer.html').render(shell))
+
+    def recommendation_card(self, product: Mapping) -> Markup:
+        """HTML card for one recommended product"""
+        return Markup(self.card_template.render(product=product))
+
+    def email_html(self, user_name: str, cart_items: List[Dict], cart_total: float, discount_percent: float,
+                   discounted_total: float, ai_recommendation_text: str, recommendation_cards: Iterable[Markup],
+                   cart_url: str, free_shipping: bool = False, log_id: Optional[int] = None) -> str:
+        """Complete HTML email: cart table, offer, AI copy and the pre-rendered recommendation cards"""
+        return self.html_template.render(
+            header=self.header,
+            footer=self.footer,
+            first_name=user_name.split()[0],
+            ai_text=ai_recommendation_text,
+            hours_remaining=OFFER_HOURS,
+            discount_percent=discount_percent,
+            cart_total=cart_total,
+            final_total=discounted_total,
+            discount_amount=cart_total * (discount_percent / 100),
+            free_shipping=free_shipping,
+            cart_items=cart_items,
+            recommendations_html=Markup(''.join(recommendation_cards)),
+            cart_url=cart_url,
+            log_id=log_id,
+            base_url=config.BASE_URL,
+        )
+
+    def email_text(self, user_name: str, cart_items: List[Dict], cart_total: float, discount_message: str,
+                   discounted_total: float, recommendations: List[Dict], cart_url: str,
+                   free_shipping: bool = False) -> str:
+        """Plain-text alternative of the email"""
+        return self.text_template.render(
+            user_name=user_name,
+            cart_items=cart_items,
+            cart_total=cart_total,
+            discount_message=discount_message,
+            discounted_total=discounted_total,
+            recommendations=recommendations,
+            cart_url=cart_url,
+            free_shipping=free_shipping,
+            support_email=SUPPORT_EMAIL,
+            store_name=STORE_NAME,
+        )
+
+
+@lru_cache(maxsize=1)
+def email_renderer() -> EmailRenderer:
+    """Process-wide renderer (templates compiled on first use)"""
+    return EmailRenderer()
@@ -0,0 +1,290 @@
+"""
+Detector Load Test
+Drives N synthetic abandoned carts through CartAbandonmentDetector.check_abandoned_carts
+against the bundled mock LLM server (or any OpenAI-compatible --base-url) and
+reports emails/sec. Needs no MySQL or SMTP: the detector's queries are answered
+by an in-memory synthetic shop and emails go to a null mailer.
+
+Usage:
+    python -m cart_abandonment_detector.load_test
+    python -m cart_abandonment_detector.load_test --carts 1000 --concurrency 32 --latency-ms 900
+    python -m cart_abandonment_detector.load_test --batch-size 5 --error-rate 0.05 --rate-limit-rate 0.02
+    python -m cart_abandonment_detector.load_test --stream --token-ms 8 --sign-off-rate 0.5
+    python -m cart_abandonment_detector.load_test --providers 3 --down-providers 1
+    python -m cart_abandonment_detector.load_test --base-url http://127.0.0.1:8765/v1
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from . import config
+from .benchmark_recommendations import generate_catalog
+from .mock_llm_server import add_server_arguments, server_from_args
+
+logger = logging.getLogger(__name__)
+
+
+class SyntheticShop:
+    """
+    In-memory answers to the queries check_abandoned_carts issues
+
+    Every synthetic user is idle with one cart; nothing has been logged or
+    ordered yet. Inserted cart_abandonment_log rows and email_sent updates are
+    counted so the report can check them against the mailer.
+    """
+
+    def __init__(self, catalog: List[Dict], carts: List[List[Dict]]):
+        self.catalog = catalog
+        self.carts = carts
+        idle_since = datetime.now() - timedelta(minutes=config.ABANDONMENT_THRESHOLD_MINUTES + 5)
+        self.users = [
+            {'user_id': user_id, 'created_at': idle_since, 'name': f"Customer {_label(user_id)}",
+             'email': f"customer{user_id}@loadtest.invalid", 'last_activity': idle_since}
+            for user_id in range(len(carts))
+        ]
+        self._lock = threading.Lock()
+        self.logged = 0
+        self.marked_sent = 0
+
+    def connect(self, server_side: bool = False) -> 'SyntheticConnection':
+        """Drop-in for DatabaseConnection.get_connection"""
+        return SyntheticConnection(self)
+
+    def answer(self, cursor: 'SyntheticCursor', query: str, params: tuple) -> List[Dict]:
+        if 'INSERT INTO cart_abandonment_log' in query:
+            with self._lock:
+                self.logged += 1
+                cursor.lastrowid = self.logged
+            return []
+        if 'UPDATE cart_abandonment_log' in query:
+            with self._lock:
+                self.marked_sent += 1
+            return []
+        if 'JOIN users u' in query:
+            return [dict(user) for user in self.users]
+        if 'FROM cart c' in query:
+            return [dict(item) for item in self.carts[params[0]]]
+        if 'FROM products' in query and 'SHOW COLUMNS' not in query:
+            return [dict(row) for row in self.catalog]
+        # SHOW COLUMNS, order_items, cart_abandonment_log lookups, copy tables: nothing there
+        return []
+
+
+class SyntheticConnection:
+    def __init__(self, shop: SyntheticShop):
+        self.shop = shop
+
+    def cursor(self, *args, **kwargs) -> 'SyntheticCursor':
+        return SyntheticCursor(self)
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class SyntheticCursor:
+    def __init__(self, connection: SyntheticConnection):
+        self.connection = connection
+        self.lastrowid = None
+        self._rows: List[Dict] = []
+
+    def execute(self, query: str, params: tuple = ()):
+        self._rows = self.connection.shop.answer(self, query, params)
+
+    def executemany(self, query: str, seq_params):
+        for params in seq_params:
+            self.execute(query, params)
+
+    def fetchall(self) -> List[Dict]:
+        rows, self._rows = self._rows, []
+        return rows
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchmany(self, size: int) -> List[Dict]:
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+    def close(self):
+        pass
+
+
+class NullMailer:
+    """Stands in for EmailService.send_email: waits send_latency seconds and counts"""
+
+    def __init__(self, send_latency: float = 0.0):
+        self.send_latency = send_latency
+        self.sent = 0
+
+    async def __call__(self, to_email: str, subject: str, html_content: str, text_content: str) -> bool:
+        if self.send_latency > 0:
+            await asyncio.sleep(self.send_latency)
+        self.sent += 1
+        return True
+
+
+def _label(number: int) -> str:
+    """Letters-only label (digits in names would be scrubbed by the sanitizer)"""
+    label = ''
+    number += 1
+    while number:
+        number, remainder = divmod(number - 1, 26)
+        label = chr(65 + remainder) + label
+    return label
+
+
+def generate_carts(catalog: List[Dict], count: int, seed: int = 3) -> List[List[Dict]]:
+    """1-3 item carts shaped like the detector's cart query rows"""
+    rng = random.Random(seed)
+    carts = []
+    for _ in range(count):
+        items = []
+        for row in rng.sample(catalog, rng.randint(1, 3)):
+            quantity = rng.randint(1, 3)
+            items.append({
+                'id': len(items) + 1, 'product_id': row['id'], 'quantity': quantity, 'name': row['name'],
+                'description': row['description'], 'price': row['price'], 'category': row['category'],
+                'image': row['image'], 'total': row['price'] * quantity,
+            })
+        carts.append(items)
+    return carts
+
+
+def start_mock_servers(args) -> List:
+    """
+    args.providers mock servers; server n is (n + 1) times slower than the first,
+    and the first args.down_providers answer every request with HTTP 500
+    """
+    servers = []
+    for n in range(max(1, args.providers)):
+        server = server_from_args(args)
+        server.latency.mean_ms *= n + 1
+        if n < args.down_providers:
+            server.error_rate = 1.0
+        server.start()
+        servers.append(server)
+    return servers
+
+
+def run_load_test(args) -> Dict:
+    """Run one detector cycle over args.carts synthetic carts and return the report"""
+    servers = []
+    base_url = args.base_url
+    if not base_url:
+        servers = start_mock_servers(args)
+        base_url = servers[0].base_url
+
+    # Everything the detector reads at construction time must be set first
+    config.GROQ_BASE_URL = base_url
+    if len(servers) > 1:
+        config.LLM_PROVIDERS = json.dumps([
+            {'name': f"mock{n + 1}", 'base_url': server.base_url, 'model': 'mock'} for n, server in enumerate(servers)
+        ])
+    config.GROQ_API_KEY = config.GROQ_API_KEY or 'mock'
+    config.EMAIL_COPY_MODE = args.copy_mode
+    config.LLM_MAX_CONCURRENCY = args.concurrency
+    config.LLM_BATCH_SIZE = args.batch_size
+    config.GROQ_STREAM = args.stream
+    config.LLM_COPY_CACHE_ENABLED = args.copy_cache
+    config.LLM_COPY_CACHE_PERSIST = False
+    if not args.client_rate_limits:
+        # The detector's Groq RPM/TPM limits would measure Groq's quota, not the detector
+        config.GROQ_REQUESTS_PER_MINUTE = 0
+        config.GROQ_TOKENS_PER_MINUTE = 0
+
+    from .cart_abandonment_detector import CartAbandonmentDetector, DatabaseConnection
+
+    if not args.verbose:
+        # Per-email INFO logging (detector and HTTP client) would dominate the timings
+        logging.getLogger().setLevel(logging.WARNING)
+        logging.getLogger('cart_abandonment_detector').setLevel(logging.WARNING)
+
+    catalog = generate_catalog(args.catalog_size, seed=args.seed)
+    shop = SyntheticShop(catalog, generate_carts(catalog, args.carts, seed=args.seed))
+    DatabaseConnection.get_connection = staticmethod(shop.connect)
+
+    detector = CartAbandonmentDetector()
+    mailer = NullMailer(args.send_latency_ms / 1000.0)
+    detector.email_service.send_email = mailer
+    engine = detector.email_service.recommendation_engine
+    engine.build_index(catalog)
+
+    print(f"Driving {args.carts} carts through check_abandoned_carts against {base_url} "
+          f"(concurrency {args.concurrency}, batch size {args.batch_size}, copy mode {args.copy_mode}, "
+          f"{'streamed' if args.stream else 'whole'} completions, {max(1, args.providers)} provider(s))")
+    start = time.perf_counter()
+    asyncio.run(detector.check_abandoned_carts())
+    elapsed = time.perf_counter() - start
+
+    report = {
+        'generated_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': vars(args),
+        'base_url': base_url,
+        'carts': args.carts,
+        'emails_sent': mailer.sent,
+        'emails_marked_sent': shop.marked_sent,
+        'seconds': round(elapsed, 3),
+        'emails_per_second': round(mailer.sent / elapsed, 2) if elapsed else None,
+        'llm': engine.llm_health(),
+    }
+    if servers:
+        report['mock_servers'] = [server.stats() for server in servers]
+        for server in servers:
+            server.stop()
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test check_abandoned_carts against a mock LLM")
+    parser.add_argument('--carts', type=int, default=200, help="Synthetic abandoned carts in the cycle")
+    parser.add_argument('--catalog-size', type=int, default=2000, help="Synthetic catalog size")
+    parser.add_argument('--base-url', help="Use this OpenAI-compatible endpoint instead of starting the mock server")
+    parser.add_argument('--concurrency', type=int, default=config.LLM_MAX_CONCURRENCY, help="LLM_MAX_CONCURRENCY")
+    parser.add_argument('--batch-size', type=int, default=config.LLM_BATCH_SIZE, help="LLM_BATCH_SIZE")
+    parser.add_argument('--stream', action='store_true', help="GROQ_STREAM (close streams once the copy is complete)")
+    parser.add_argument('--providers', type=int, default=1, help="Mock servers behind the LLM provider pool")
+    parser.add_argument('--down-providers', type=int, default=0, help="How many of those mock servers fail every request")
+    parser.add_argument('--copy-mode', choices=['live', 'library'], default='live', help="EMAIL_COPY_MODE")
+    parser.add_argument('--copy-cache', action='store_true', help="Keep the LLM copy cache on")
+    parser.add_argument('--client-rate-limits', action='store_true', help="Keep the detector's Groq RPM/TPM limits")
+    parser.add_argument('--send-latency-ms', type=float, default=20, help="Simulated time to hand one email to SMTP")
+    parser.add_argument('--output', default='load_test.json', help="JSON report path")
+    parser.add_argument('--verbose', action='store_true', help="Keep the detector's INFO logging on")
+    add_server_arguments(parser)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    report = run_load_test(args)
+    latency = report['llm']['latency']
+    print(f"\n{report['emails_sent']}/{report['carts']} emails in {report['seconds']:.2f}s "
+          f"→ {report['emails_per_second']} emails/sec")
+    if latency['count']:
+        print(f"LLM latency p50 {latency['p50_seconds']:.3f}s / p95 {latency['p95_seconds']:.3f}s / p99 {latency['p99_seconds']:.3f}s, "
+              f"breaker {report['llm']['breaker']['state']}, {report['llm']['timeouts']} timeouts, {report['llm']['hedged']} hedged")
+    pool = report['llm']['providers']
+    if pool and len(pool['providers']) > 1:
+        print(f"Providers: {pool['failovers']} failovers; " + ', '.join(
+            f"{p['name']} {p['requests']} requests (EWMA {p['ewma_seconds']}s, {p['breaker']['state']})" for p in pool['providers']))
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, default=str)
+    print(f"Report written to {args.output}")
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+"""
+Metrics
+Lightweight in-process counters and histograms for the detector's external
+calls, readable as JSON and as Prometheus text.
+"""
+
+import bisect
+import threading
+from collections import deque
+from typing import Dict, Optional, Sequence, Tuple
+
+# Upper bounds (seconds) of the histogram buckets; the last bucket is +Inf
+DEFAULT_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0)
+
+# Upper bounds for per-call token counts
+DEFAULT_TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+
+class Histogram:
+    """
+    Cumulative bucketed histogram plus a window of recent samples.
+
+    Buckets give all-time counts (Prometheus style); percentiles are
+    computed exactly over the most recent `window` observations.
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS, window: int = 1024, unit: str = 'seconds'):
+        self.buckets = tuple(sorted(buckets))
+        self.unit = unit
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float):
+        """Record one sample"""
+        with self._lock:
+            self._counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._recent.append(value)
+            self.count += 1
+            self.total += value
+
+    def percentile(self, q: float) -> Optional[float]:
+        """q-th percentile (0-100) of the recent window, or None if empty"""
+        with self._lock:
+            samples = sorted(self._recent)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, max(0, int(round(q / 100.0 * (len(samples) - 1)))))
+        return samples[index]
+
+    def cumulative_buckets(self) -> Tuple[list, int, float]:
+        """(upper bound, cumulative count) pairs with the +Inf bucket last, total count and sum"""
+        with self._lock:
+            counts = list(self._counts)
+            count, total = self.count, self.total
+        running, cumulative = 0, []
+        for bound, n in zip(self.buckets + (float('inf'),), counts):
+            running += n
+            cumulative.append((bound, running))
+        return cumulative, count, total
+
+    def snapshot(self) -> Dict:
+        """Return counts, mean and recent percentiles"""
+        with self._lock:
+            counts = list(self._counts)
+            count, total = self.count, self.total
+        buckets = {f"le_{bound:g}": n for bound, n in zip(self.buckets, counts)}
+        buckets['le_inf'] = counts[-1]
+        return {
+            'count': count,
+            f'mean_{self.unit}': round(total / count, 4) if count else None,
+            f'p50_{self.unit}': self.percentile(50),
+            f'p95_{self.unit}': self.percentile(95),
+            f'p99_{self.unit}': self.percentile(99),
+            'buckets': buckets,
+        }
+
+
+class LatencyHistogram(Histogram):
+    """Histogram of durations in seconds"""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS, window: int = 1024):
+        super().__init__(buckets, window, unit='seconds')
+
+
+class MetricsRegistry:
+    """
+    Named counters (optionally labelled) and histograms
+
+    snapshot() is the JSON view for admin endpoints; render_prometheus()
+    is the text exposition format for a /metrics scrape. Histograms also
+    export their recent-window percentiles as a <name>_recent gauge.
+    """
+
+    def __init__(self, prefix: str = ''):
+        self.prefix = prefix
+        self._counters: Dict[str, Dict[Tuple, float]] = {}
+        self._histograms: Dict[str, Histogram] = {}
+        self._help: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name: str, help_text: str = '', buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS,
+                  unit: str = 'seconds', window: int = 1024) -> Histogram:
+        """Get or create a histogram"""
+        with self._lock:
+            if name not in self._histograms:
+                self._histograms[name] = Histogram(buckets, window, unit)
+                self._help[name] = help_text
+            return self._histograms[name]
+
+    def counter(self, name: str, help_text: str = ''):
+        """Declare a counter so it is exported (as 0) before its first increment"""
+        with self._lock:
+            self._counters.setdefault(name, {})
+            self._help.setdefault(name, help_text)
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        """Add to a counter; keyword arguments become Prometheus labels"""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name: str, value: float):
+        """Record a sample in a histogram created with histogram()"""
+        self._histograms[name].observe(value)
+
+    def snapshot(self) -> Dict:
+        """JSON-friendly view: counters (by label set) and histogram snapshots"""
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            histograms = dict(self._histograms)
+        result = {}
+        for name, series in counters.items():
+            if all(not key for key in series) and len(series) <= 1:
+                result[name] = series.get((), 0)
+            else:
+                result[name] = {','.join(f"{k}={v}" for k, v in key) or 'total': value for key, value in series.items()}
+        for name, histogram in histograms.items():
+            result[name] = histogram.snapshot()
+        return result
+
+    def render_prometheus(self) -> str:
+        """Prometheus text exposition format"""
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            histograms = dict(self._histograms)
+            help_texts = dict(self._help)
+
+        lines = []
+        for name in sorted(counters):
+            full = self.prefix + name
+            if help_texts.get(name):
+                lines.append(f"# HELP {full} {help_texts[name]}")
+            lines.append(f"# TYPE {full} counter")
+            for key, value in sorted(counters[name].items()) or [((), 0)]:
+                lines.append(f"{full}{_labels(key)} {value:g}")
+
+        for name in sorted(histograms):
+            full = self.prefix + name
+            histogram = histograms[name]
+            cumulative, count, total = histogram.cumulative_buckets()
+            if help_texts.get(name):
+                lines.append(f"# HELP {full} {help_texts[name]}")
+            lines.append(f"# TYPE {full} histogram")
+            for bound, n in cumulative:
+                le = '+Inf' if bound == float('inf') else f"{bound:g}"
+                lines.append(f'{full}_bucket{{le="{le}"}} {n}')
+            lines.append(f"{full}_sum {total:g}")
+            lines.append(f"{full}_count {count}")
+            lines.append(f"# TYPE {full}_recent gauge")
+            for q in (50, 95, 99):
+                value = histogram.percentile(q)
+                lines.append(f'{full}_recent{{quantile="{q / 100:g}"}} {value if value is not None else "NaN"}')
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(key: Tuple) -> str:
+    if not key:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in key)
+    return '{' + ','.join(f'{label}="{value}"' for (label, _), value in zip(key, escaped)) + '}'
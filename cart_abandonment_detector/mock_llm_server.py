@@ -0,0 +1,409 @@
+"""
+Mock LLM Server
+Local OpenAI-compatible chat-completions endpoint for offline load tests of the
+detector, with configurable latency, server errors, 429s and canned outputs.
+
+Point the detector at it with GROQ_BASE_URL (any non-empty GROQ_API_KEY works):
+
+Usage:
+    python -m cart_abandonment_detector.mock_llm_server
+    python -m cart_abandonment_detector.mock_llm_server --latency-ms 800 --latency-jitter-ms 400 --latency-dist lognormal
+    python -m cart_abandonment_detector.mock_llm_server --error-rate 0.05 --rate-limit-rpm 30 --outputs canned.json
+    python -m cart_abandonment_detector.mock_llm_server --token-ms 8 --sign-off-rate 0.5
+
+    GROQ_BASE_URL=http://127.0.0.1:8765/v1 GROQ_API_KEY=mock python cart_abandonment_detector/run_detector.py
+"""
+
+import argparse
+import json
+import logging
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+from .metrics import LatencyHistogram
+from .rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+LATENCY_DISTRIBUTIONS = ('fixed', 'uniform', 'normal', 'lognormal', 'exponential')
+
+# Used when no --outputs file is given; {name} and {item} are filled from the prompt
+DEFAULT_OUTPUTS = [
+    "Hi {name}! Your {item} is still waiting in your cart, and it's a great pick. "
+    "Your discount is ready whenever you are, and we've lined up a few extras that pair nicely with it. "
+    "Stock moves fast this week, so come back soon!",
+    "Hey {name}, still thinking about the {item}? Good taste! "
+    "We saved your cart and added a little discount to make the decision easier. "
+    "Take a look at the suggestions below, they go perfectly with your picks.",
+    "{name}, your cart misses you! The {item} you picked is one of our favourites. "
+    "Finish checking out today to lock in your offer before it's gone.",
+]
+
+# Appended with probability sign_off_rate: what GROQ_STREAM cuts off early
+SIGN_OFF = (
+    "\n\nBest regards,\nThe Shop Team\n\n"
+    "P.S. Reply to this email if you have any questions about your order, sizes or delivery times - we're always happy to help."
+)
+
+_NAME = re.compile(r'email for ([^.\n]+)\.')
+_ITEM = re.compile(r'^- (.+?) \(Qty', re.MULTILINE)
+_BRIEF = re.compile(r'^=== (\S+) ===$', re.MULTILINE)
+_TOKEN = re.compile(r'\s*\S+')
+
+
+class LatencyModel:
+    """
+    Random response latency
+
+    mean_ms is the mean of every distribution. jitter_ms is the half-width
+    for 'uniform' and the standard deviation for 'normal' and 'lognormal';
+    'exponential' is fully determined by the mean.
+    """
+
+    def __init__(self, distribution: str = 'fixed', mean_ms: float = 300, jitter_ms: float = 0, seed: Optional[int] = None):
+        if distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution: {distribution}")
+        self.distribution = distribution
+        self.mean_ms = mean_ms
+        self.jitter_ms = jitter_ms
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self) -> float:
+        """One latency in seconds (never negative)"""
+        mean, jitter = self.mean_ms, self.jitter_ms
+        with self._lock:
+            if self.distribution == 'uniform':
+                ms = self._rng.uniform(mean - jitter, mean + jitter)
+            elif self.distribution == 'normal':
+                ms = self._rng.gauss(mean, jitter)
+            elif self.distribution == 'lognormal' and mean > 0:
+                # Parameters of the underlying normal that give this mean and standard deviation
+                sigma = math.sqrt(math.log(1 + (jitter / mean) ** 2))
+                ms = self._rng.lognormvariate(math.log(mean) - sigma ** 2 / 2, sigma)
+            elif self.distribution == 'exponential' and mean > 0:
+                ms = self._rng.expovariate(1.0 / mean)
+            else:
+                ms = mean
+        return max(0.0, ms) / 1000.0
+
+
+class MockLLMServer:
+    """
+    Threaded HTTP server answering POST .../chat/completions like the OpenAI API
+
+    Per request, in order: a 429 if the server-side rate limit is exhausted or
+    with probability rate_limit_rate; otherwise the sampled latency, then a 500
+    with probability error_rate, otherwise a completion built from the canned
+    outputs. JSON-mode requests (response_format json_object) get a JSON object
+    with one canned email per "=== id ===" brief, like batched detector prompts.
+
+    token_ms adds generation time per completion token (one word here), so
+    the sampled latency acts as the time to first token. Requests with
+    "stream": true get server-sent chunk events paced by token_ms; a client
+    that closes the stream early stops generation.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8765, latency: Optional[LatencyModel] = None,
+                 error_rate: float = 0.0, rate_limit_rate: float = 0.0, rate_limit_rpm: float = 0,
+                 outputs: Optional[List[str]] = None, seed: Optional[int] = None,
+                 token_ms: float = 0.0, sign_off_rate: float = 0.0):
+        self.latency = latency or LatencyModel()
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.rate_limiter = TokenBucket.per_minute(rate_limit_rpm)
+        self.outputs = outputs or DEFAULT_OUTPUTS
+        self.token_seconds = max(0.0, token_ms) / 1000.0
+        self.sign_off_rate = sign_off_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+        self.requests = 0
+        self.completions = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.streams = 0
+        self.streams_closed_early = 0
+        self.tokens_generated = 0
+        self.injected_latency = LatencyHistogram()
+
+        self.httpd = ThreadingHTTPServer((host, port), _make_handler(self))
+        self.httpd.daemon_threads = True
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> str:
+        """Serve in a background thread; returns the base URL"""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='mock-llm-server', daemon=True)
+        self._thread.start()
+        logger.info(f"Mock LLM server listening on {self.base_url}")
+        return self.base_url
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _roll(self, probability: float) -> bool:
+        with self._lock:
+            return probability > 0 and self._rng.random() < probability
+
+    def _choose_output(self) -> str:
+        with self._lock:
+            return self._rng.choice(self.outputs)
+
+    def handle_completion(self, body: Dict):
+        """
+        Produce one response for a chat-completions request body
+
+        Returns:
+            (HTTP status, headers, JSON payload)
+        """
+        with self._lock:
+            self.requests += 1
+
+        if not self.rate_limiter.try_acquire() or self._roll(self.rate_limit_rate):
+            with self._lock:
+                self.rate_limited += 1
+            return 429, {'Retry-After': '1'}, _error_payload('Rate limit reached (mock)', 'rate_limit_exceeded')
+
+        delay = self.latency.sample()
+        self.injected_latency.observe(delay)
+        time.sleep(delay)
+
+        if self._roll(self.error_rate):
+            with self._lock:
+                self.errors += 1
+            return 500, {}, _error_payload('Injected server error (mock)', 'server_error')
+
+        prompt = '\n'.join(str(message.get('content', '')) for message in body.get('messages', []) if message.get('role') == 'user')
+        if (body.get('response_format') or {}).get('type') == 'json_object':
+            sections = {}
+            for brief_id, brief in _split_briefs(prompt):
+                sections[brief_id] = self._fill(self._choose_output(), brief)
+            content = json.dumps(sections)
+        else:
+            content = self._fill(self._choose_output(), prompt)
+            if self._roll(self.sign_off_rate):
+                content += SIGN_OFF
+
+        with self._lock:
+            self.completions += 1
+        if not body.get('stream'):
+            # Streams are paced chunk by chunk in stream_events instead
+            self._generate(len(_TOKEN.findall(content)))
+        prompt_tokens = sum(len(str(message.get('content', ''))) for message in body.get('messages', [])) // 4
+        completion_tokens = len(content) // 4
+        return 200, {}, {
+            'id': f"chatcmpl-mock-{uuid.uuid4().hex[:12]}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': body.get('model', 'mock'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': content},
+                'finish_reason': 'stop',
+            }],
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'total_tokens': prompt_tokens + completion_tokens,
+            },
+        }
+
+    def _generate(self, tokens: int):
+        """Spend token_ms per generated token"""
+        with self._lock:
+            self.tokens_generated += tokens
+        if self.token_seconds > 0 and tokens:
+            time.sleep(self.token_seconds * tokens)
+
+    def stream_events(self, payload: Dict, include_usage: bool = False):
+        """
+        Chat-completion chunk events for a completed payload, one per token
+
+        Generation is paced lazily, so a client that stops reading stops it.
+        """
+        with self._lock:
+            self.streams += 1
+        base = {key: payload[key] for key in ('id', 'created', 'model')}
+        base['object'] = 'chat.completion.chunk'
+        choice = payload['choices'][0]
+        yield dict(base, choices=[{'index': 0, 'delta': {'role': 'assistant', 'content': ''}, 'finish_reason': None}])
+        for token in _TOKEN.findall(choice['message']['content']):
+            self._generate(1)
+            yield dict(base, choices=[{'index': 0, 'delta': {'content': token}, 'finish_reason': None}])
+        yield dict(base, choices=[{'index': 0, 'delta': {}, 'finish_reason': choice['finish_reason']}])
+        if include_usage:
+            yield dict(base, choices=[], usage=payload['usage'])
+
+    def record_closed_stream(self):
+        with self._lock:
+            self.streams_closed_early += 1
+
+    @staticmethod
+    def _fill(template: str, prompt: str) -> str:
+        name = _NAME.search(prompt)
+        item = _ITEM.search(prompt)
+        return template.replace('{name}', name.group(1) if name else 'there').replace('{item}', item.group(1) if item else 'pick')
+
+    def stats(self) -> Dict:
+        """Return request counters and the injected latency histogram"""
+        with self._lock:
+            counters = {
+                'requests': self.requests,
+                'completions': self.completions,
+                'errors': self.errors,
+                'rate_limited': self.rate_limited,
+                'streams': self.streams,
+                'streams_closed_early': self.streams_closed_early,
+                'tokens_generated': self.tokens_generated,
+            }
+        counters['injected_latency'] = self.injected_latency.snapshot()
+        return counters
+
+
+def _split_briefs(prompt: str):
+    """(brief id, brief text) pairs of a batched prompt"""
+    matches = list(_BRIEF.finditer(prompt))
+    for n, match in enumerate(matches):
+        end = matches[n + 1].start() if n + 1 < len(matches) else len(prompt)
+        yield match.group(1), prompt[match.end():end]
+
+
+def _error_payload(message: str, code: str) -> Dict:
+    return {'error': {'message': message, 'type': code, 'code': code}}
+
+
+def _make_handler(server: MockLLMServer):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _send_json(self, status: int, payload: Dict, headers: Optional[Dict] = None):
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _send_stream(self, events):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            # No Content-Length: the body ends when the connection closes
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            self.close_connection = True
+            try:
+                for event in events:
+                    self.wfile.write(f"data: {json.dumps(event)}\n\n".encode())
+                    self.wfile.flush()
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                server.record_closed_stream()
+
+        def do_GET(self):
+            if self.path.rstrip('/').endswith('/models'):
+                self._send_json(200, {'object': 'list', 'data': [{'id': 'mock', 'object': 'model', 'owned_by': 'mock'}]})
+            elif self.path.rstrip('/') in ('/stats', '/health'):
+                self._send_json(200, server.stats())
+            else:
+                self._send_json(404, _error_payload(f"Unknown path {self.path}", 'not_found'))
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            try:
+                body = json.loads(self.rfile.read(length) or b'{}')
+            except ValueError:
+                self._send_json(400, _error_payload('Request body is not JSON', 'invalid_request_error'))
+                return
+            if not self.path.rstrip('/').endswith('/chat/completions'):
+                self._send_json(404, _error_payload(f"Unknown path {self.path}", 'not_found'))
+                return
+            status, headers, payload = server.handle_completion(body)
+            if status == 200 and body.get('stream'):
+                self._send_stream(server.stream_events(payload, bool((body.get('stream_options') or {}).get('include_usage'))))
+            else:
+                self._send_json(status, payload, headers)
+
+        def log_message(self, format, *args):
+            logger.debug(f"{self.address_string()} - {format % args}")
+
+    return Handler
+
+
+def load_outputs(path: str) -> List[str]:
+    """Canned outputs from a JSON list of strings"""
+    with open(path) as f:
+        outputs = json.load(f)
+    if not isinstance(outputs, list) or not all(isinstance(text, str) for text in outputs) or not outputs:
+        raise ValueError(f"{path} must contain a non-empty JSON list of strings")
+    return outputs
+
+
+def add_server_arguments(parser: argparse.ArgumentParser):
+    """Mock server options (shared with load_test.py)"""
+    parser.add_argument('--latency-dist', choices=LATENCY_DISTRIBUTIONS, default='lognormal', help="Response latency distribution")
+    parser.add_argument('--latency-ms', type=float, default=600, help="Mean response latency")
+    parser.add_argument('--latency-jitter-ms', type=float, default=300,
+                        help="Half-width (uniform) or standard deviation (normal, lognormal)")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of requests answered with HTTP 500")
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help="Fraction of requests answered with HTTP 429")
+    parser.add_argument('--rate-limit-rpm', type=float, default=0, help="Server-side requests/minute before 429s (0 = unlimited)")
+    parser.add_argument('--token-ms', type=float, default=0, help="Generation time per completion token (streams are paced by it)")
+    parser.add_argument('--sign-off-rate', type=float, default=0.0,
+                        help="Fraction of completions that end with a signature and P.S. (what GROQ_STREAM cuts off)")
+    parser.add_argument('--outputs', help="JSON list of canned outputs ({name} and {item} are filled from the prompt)")
+    parser.add_argument('--seed', type=int, default=42)
+
+
+def server_from_args(args, host: str = '127.0.0.1', port: int = 0) -> MockLLMServer:
+    """Build a MockLLMServer from add_server_arguments options"""
+    return MockLLMServer(
+        host=host,
+        port=port,
+        latency=LatencyModel(args.latency_dist, args.latency_ms, args.latency_jitter_ms, seed=args.seed),
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        rate_limit_rpm=args.rate_limit_rpm,
+        outputs=load_outputs(args.outputs) if args.outputs else None,
+        seed=args.seed,
+        token_ms=args.token_ms,
+        sign_off_rate=args.sign_off_rate,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a local OpenAI-compatible mock LLM server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    add_server_arguments(parser)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    server = server_from_args(args, args.host, args.port)
+    print(f"Mock LLM server on {server.base_url} (set GROQ_BASE_URL to this, any GROQ_API_KEY)")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        print(json.dumps(server.stats(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,346 @@
+"""
+Email Outbox
+Durable queue of fully rendered emails (the email_outbox table, see
+migrations/create_email_outbox.py). With EMAIL_DELIVERY_MODE = 'outbox' the
+detector only enqueues messages; OutboxWorker processes (outbox_worker.py)
+deliver them, so a slow SMTP server never stalls detection and the two can
+be scaled separately.
+"""
+
+import logging
+import os
+import random
+import smtplib
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from . import config
+from .metrics import MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+# Row states
+PENDING = 'pending'
+SENDING = 'sending'
+SENT = 'sent'
+DEAD = 'dead'
+
+# Queue latencies run from milliseconds (idle worker) to hours (retries)
+DELIVERY_LATENCY_BUCKETS = (0.5, 1.0, 2.5, 5.0, 15.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+
+LAST_ERROR_LENGTH = 500
+
+
+def retry_delay(attempts: int, base_seconds: float, max_seconds: float) -> float:
+    """Exponential backoff after the given number of failed attempts, with ±20% jitter"""
+    delay = min(max_seconds, base_seconds * 2 ** max(0, attempts - 1))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def is_permanent(error: Exception) -> bool:
+    """5xx rejections of the message itself; retrying would fail the same way"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return True
+    # Bad credentials are a configuration problem: keep retrying until they are fixed
+    if isinstance(error, smtplib.SMTPAuthenticationError):
+        return False
+    return isinstance(error, smtplib.SMTPResponseException) and 500 <= error.smtp_code < 600
+
+
+class EmailOutbox:
+    """
+    Producer and consumer side of the email_outbox table
+
+    Claims lock rows with SELECT ... FOR UPDATE SKIP LOCKED (MySQL 8.0+ /
+    MariaDB 10.6+), so any number of workers can poll the table without
+    handing out the same message twice. A claimed row stays 'sending' until
+    its outcome is recorded; rows left 'sending' by a crashed worker are
+    claimed again after claim_timeout seconds (delivery is at-least-once).
+    """
+
+    def __init__(self, connection_factory: Callable, max_attempts: int = 5, retry_base_seconds: float = 30,
+                 retry_max_seconds: float = 3600, claim_timeout: float = 300):
+        self._connection_factory = connection_factory
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.claim_timeout = claim_timeout
+        self.enqueued = 0
+        self.enqueue_errors = 0
+
+    @classmethod
+    def from_config(cls, connection_factory: Callable) -> 'EmailOutbox':
+        return cls(
+            connection_factory,
+            max_attempts=config.OUTBOX_MAX_ATTEMPTS,
+            retry_base_seconds=config.OUTBOX_RETRY_BASE_SECONDS,
+            retry_max_seconds=config.OUTBOX_RETRY_MAX_SECONDS,
+            claim_timeout=config.OUTBOX_CLAIM_TIMEOUT_SECONDS,
+        )
+
+    def connect(self):
+        return self._connection_factory()
+
+    def enqueue(self, cursor, log_id: Optional[int], to_email: str, subject: str, html: str, text: str) -> Optional[int]:
+        """
+        Queue one rendered email (committed on the cursor's connection)
+
+        Returns:
+            The outbox row id, or None if the row could not be written
+        """
+        try:
+            cursor.execute("""
+                INSERT INTO email_outbox (log_id, to_email, subject, html_body, text_body, status, next_attempt_at)
+                VALUES (%s, %s, %s, %s, %s, %s, NOW())
+            """, (log_id, to_email, subject, html, text, PENDING))
+            cursor.connection.commit()
+        except Exception as e:
+            self.enqueue_errors += 1
+            if "doesn't exist" in str(e):
+                logger.error("email_outbox table not found (run migrations/create_email_outbox.py)")
+            else:
+                logger.error(f"Error queueing email for {to_email}: {e}")
+            return None
+        self.enqueued += 1
+        return cursor.lastrowid
+
+    def is_queued(self, cursor, log_id: int) -> bool:
+        """True if the abandonment log entry's email is waiting for (or in) delivery"""
+        try:
+            cursor.execute("""
+                SELECT id FROM email_outbox
+                WHERE log_id = %s AND status IN (%s, %s)
+                LIMIT 1
+            """, (log_id, PENDING, SENDING))
+            return cursor.fetchone() is not None
+        except Exception as e:
+            logger.warning(f"Could not check the outbox for log_id {log_id}: {e}")
+            return False
+
+    def dead_letter_id(self, cursor, log_id: int) -> Optional[int]:
+        """
+        Id of the abandonment log entry's dead-lettered outbox row, if any
+
+        Its email must not be rendered and queued again; an operator requeues
+        the row by hand once the cause is fixed.
+        """
+        try:
+            cursor.execute("""
+                SELECT id FROM email_outbox
+                WHERE log_id = %s AND status = %s
+                ORDER BY id DESC
+                LIMIT 1
+            """, (log_id, DEAD))
+            row = cursor.fetchone()
+        except Exception as e:
+            logger.warning(f"Could not check the outbox for log_id {log_id}: {e}")
+            return None
+        return row['id'] if row else None
+
+    def claim(self, conn, worker_id: str, limit: int) -> List[Dict]:
+        """
+        Lock and mark up to `limit` due messages as 'sending' (one short transaction)
+
+        Returns:
+            Claimed rows, with attempts already counting this delivery
+        """
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                SELECT id, log_id, to_email, subject, html_body, text_body, attempts, created_at
+                FROM email_outbox
+                WHERE (status = %s AND next_attempt_at <= NOW())
+                   OR (status = %s AND claimed_at < NOW() - INTERVAL %s SECOND)
+                ORDER BY next_attempt_at
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            """, (PENDING, SENDING, int(self.claim_timeout), limit))
+            rows = list(cursor.fetchall())
+            if rows:
+                placeholders = ', '.join(['%s'] * len(rows))
+                cursor.execute(f"""
+                    UPDATE email_outbox
+                    SET status = %s, claimed_at = NOW(), claimed_by = %s, attempts = attempts + 1
+                    WHERE id IN ({placeholders})
+                """, (SENDING, worker_id, *[row['id'] for row in rows]))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+        for row in rows:
+            row['attempts'] += 1
+        return rows
+
+    def mark_sent(self, conn, row: Dict):
+        """Record a delivery and flag the abandonment log entry as sent, in one transaction"""
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                UPDATE email_outbox
+                SET status = %s, sent_at = NOW(), last_error = NULL
+                WHERE id = %s
+            """, (SENT, row['id']))
+            if row.get('log_id'):
+                cursor.execute("""
+                    UPDATE cart_abandonment_log
+                    SET email_sent = TRUE
+                    WHERE id = %s
+                """, (row['log_id'],))
+            conn.commit()
+        finally:
+            cursor.close()
+
+    def mark_failed(self, conn, row: Dict, error: Exception) -> str:
+        """
+        Schedule a retry with backoff, or dead-letter the message
+
+        Returns:
+            The new status (pending or dead)
+        """
+        message = f"{type(error).__name__}: {error}"[:LAST_ERROR_LENGTH]
+        dead = row['attempts'] >= self.max_attempts or is_permanent(error)
+        cursor = conn.cursor()
+        try:
+            if dead:
+                cursor.execute("""
+                    UPDATE email_outbox
+                    SET status = %s, last_error = %s
+                    WHERE id = %s
+                """, (DEAD, message, row['id']))
+            else:
+                delay = retry_delay(row['attempts'], self.retry_base_seconds, self.retry_max_seconds)
+                cursor.execute("""
+                    UPDATE email_outbox
+                    SET status = %s, last_error = %s, next_attempt_at = NOW() + INTERVAL %s SECOND
+                    WHERE id = %s
+                """, (PENDING, message, int(round(delay)), row['id']))
+            conn.commit()
+        finally:
+            cursor.close()
+        return DEAD if dead else PENDING
+
+    def depth(self, cursor) -> Dict[str, int]:
+        """Row count per status (pending, sending, sent, dead)"""
+        cursor.execute("SELECT status, COUNT(*) AS n FROM email_outbox GROUP BY status")
+        counts = {PENDING: 0, SENDING: 0, SENT: 0, DEAD: 0}
+        for row in cursor.fetchall():
+            counts[row['status']] = int(row['n'])
+        return counts
+
+
+class OutboxWorker:
+    """
+    Delivers claimed outbox messages with a thread per in-flight send
+
+    deliver(to_email, subject, html, text) must raise on failure
+    (EmailService.deliver does). Each run_once() claims one batch, sends it
+    `concurrency` messages at a time and records every outcome.
+    """
+
+    def __init__(self, outbox: EmailOutbox, deliver: Callable[[str, str, str, str], None],
+                 concurrency: int = 4, batch_size: int = 20, poll_seconds: float = 2.0, worker_id: str = None,
+                 stats_interval: float = 60.0):
+        self.outbox = outbox
+        self.deliver = deliver
+        self.concurrency = max(1, concurrency)
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self.stats_interval = stats_interval
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self._stop = threading.Event()
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='outbox-send')
+
+        self.metrics = MetricsRegistry(prefix='cart_recovery_')
+        self.metrics.histogram('email_delivery_latency_seconds', 'Time from enqueue to successful delivery',
+                               buckets=DELIVERY_LATENCY_BUCKETS)
+        self.metrics.histogram('email_send_seconds', 'Time to hand one message to the SMTP server')
+        self.metrics.counter('email_outbox_deliveries_total', 'Delivery attempts, by result (sent, retry, dead)')
+
+    def run_once(self) -> int:
+        """
+        Claim and deliver one batch
+
+        Returns:
+            Number of messages claimed (0 when nothing was due)
+        """
+        conn = self.outbox.connect()
+        try:
+            rows = self.outbox.claim(conn, self.worker_id, self.batch_size)
+            if not rows:
+                return 0
+            outcomes = self._executor.map(self._send, rows)
+            for row, (error, seconds) in zip(rows, outcomes):
+                self._record(conn, row, error, seconds)
+            return len(rows)
+        finally:
+            conn.close()
+
+    def _send(self, row: Dict):
+        started = time.perf_counter()
+        try:
+            self.deliver(row['to_email'], row['subject'], row['html_body'], row['text_body'])
+        except Exception as e:
+            return e, time.perf_counter() - started
+        return None, time.perf_counter() - started
+
+    def _record(self, conn, row: Dict, error: Optional[Exception], seconds: float):
+        self.metrics.observe('email_send_seconds', seconds)
+        try:
+            if error is None:
+                self.outbox.mark_sent(conn, row)
+                self.metrics.inc('email_outbox_deliveries_total', result='sent')
+                self.metrics.observe('email_delivery_latency_seconds', max(0.0, (datetime.now() - row['created_at']).total_seconds()))
+                logger.info(f"Delivered outbox email {row['id']} to {row['to_email']} (attempt {row['attempts']})")
+                return
+            status = self.outbox.mark_failed(conn, row, error)
+        except Exception as e:
+            # The row stays 'sending' and is claimed again after the claim timeout
+            logger.error(f"Could not record the outcome of outbox email {row['id']}: {e}")
+            return
+        if status == DEAD:
+            self.metrics.inc('email_outbox_deliveries_total', result='dead')
+            logger.error(f"Outbox email {row['id']} to {row['to_email']} dead-lettered after {row['attempts']} attempts: {error}")
+        else:
+            self.metrics.inc('email_outbox_deliveries_total', result='retry')
+            logger.warning(f"Outbox email {row['id']} to {row['to_email']} failed (attempt {row['attempts']}), will retry: {error}")
+
+    def run_forever(self):
+        """Poll until stop(); a full batch is followed immediately by the next claim"""
+        logger.info(f"Outbox worker {self.worker_id} started (concurrency {self.concurrency}, batch size {self.batch_size})")
+        last_stats = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                claimed = self.run_once()
+            except Exception as e:
+                logger.error(f"Outbox worker error: {e}")
+                claimed = 0
+            if self.stats_interval and time.monotonic() - last_stats >= self.stats_interval:
+                self.log_stats()
+                last_stats = time.monotonic()
+            if claimed < self.batch_size:
+                self._stop.wait(self.poll_seconds)
+        self._executor.shutdown(wait=True)
+        self.log_stats()
+        logger.info(f"Outbox worker {self.worker_id} stopped")
+
+    def stop(self):
+        self._stop.set()
+
+    def log_stats(self):
+        metrics = self.metrics.snapshot()
+        deliveries = metrics['email_outbox_deliveries_total']
+        latency = metrics['email_delivery_latency_seconds']
+        counts = {key.split('=')[-1]: value for key, value in deliveries.items()} if isinstance(deliveries, dict) else {}
+        summary = f"{counts.get('sent', 0):.0f} sent, {counts.get('retry', 0):.0f} retries, {counts.get('dead', 0):.0f} dead"
+        if latency['count']:
+            summary += f"; delivery latency p50 {latency['p50_seconds']:.1f}s / p99 {latency['p99_seconds']:.1f}s"
+        logger.info(f"📬 Outbox worker {self.worker_id}: {summary}")
+
+    def stats(self) -> Dict:
+        return {'worker_id': self.worker_id, 'metrics': self.metrics.snapshot()}
@@ -0,0 +1,76 @@
+"""
+Email Outbox Worker
+Delivers the emails the detector queued in email_outbox
+(EMAIL_DELIVERY_MODE = 'outbox'). Run as many workers as SMTP throughput
+needs; SKIP LOCKED claims keep them from sending the same message twice.
+
+Usage:
+    python -m cart_abandonment_detector.outbox_worker
+    python -m cart_abandonment_detector.outbox_worker --concurrency 8 --batch-size 50
+    python -m cart_abandonment_detector.outbox_worker --once
+"""
+
+import argparse
+import logging
+import signal
+from typing import Tuple
+
+from . import config
+from .cart_abandonment_detector import DatabaseConnection
+from .outbox import EmailOutbox, OutboxWorker
+from .smtp_pool import SMTPConnectionPool, mime_message, smtp_settings
+
+logger = logging.getLogger(__name__)
+
+
+def build_worker(concurrency: int, batch_size: int, poll_seconds: float) -> Tuple[OutboxWorker, SMTPConnectionPool]:
+    """Worker sending through a pooled SMTP connection configured from the MAIL_* environment"""
+    pool = SMTPConnectionPool.from_settings(smtp_settings())
+
+    def deliver(to_email: str, subject: str, html_content: str, text_content: str):
+        pool.send(mime_message(to_email, subject, html_content, text_content))
+
+    worker = OutboxWorker(
+        EmailOutbox.from_config(DatabaseConnection.get_connection),
+        deliver,
+        concurrency=concurrency,
+        batch_size=batch_size,
+        poll_seconds=poll_seconds,
+    )
+    return worker, pool
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Deliver queued cart abandonment emails from email_outbox")
+    parser.add_argument('--concurrency', type=int, default=config.OUTBOX_WORKER_CONCURRENCY, help="Messages sent at once")
+    parser.add_argument('--batch-size', type=int, default=config.OUTBOX_BATCH_SIZE, help="Messages claimed per poll")
+    parser.add_argument('--poll-seconds', type=float, default=config.OUTBOX_POLL_SECONDS, help="Sleep when nothing is due")
+    parser.add_argument('--once', action='store_true', help="Deliver everything that is due now, then exit")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    worker, pool = build_worker(args.concurrency, args.batch_size, args.poll_seconds)
+
+    try:
+        if args.once:
+            total = 0
+            while True:
+                claimed = worker.run_once()
+                total += claimed
+                if claimed < args.batch_size:
+                    break
+            worker.log_stats()
+            print(f"\nClaimed {total} queued emails")
+        else:
+            signal.signal(signal.SIGTERM, lambda *_: worker.stop())
+            try:
+                worker.run_forever()
+            except KeyboardInterrupt:
+                print("\nOutbox worker stopped by user")
+    finally:
+        pool.close()
+    return worker.stats()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""
+Email Copy Pre-generation
+Batch job that fills the email_copy_library table with sanitized Groq copy
+variants for every (category, discount tier, tone) combination, so the
+detector only has to fill in names at send time (EMAIL_COPY_MODE = 'library').
+
+Usage:
+    python -m cart_abandonment_detector.pregenerate_copy
+    python -m cart_abandonment_detector.pregenerate_copy --variants 3 --categories electronics books
+    python -m cart_abandonment_detector.pregenerate_copy --replace
+"""
+
+import argparse
+import logging
+import random
+import time
+from typing import List
+
+from . import config
+from .cart_abandonment_detector import (
+    DatabaseConnection, PROMPT_APPROACHES, PROMPT_STYLES, PROMPT_TONES, RecommendationEngine, compose_prompt
+)
+from .copy_cache import PROMPT_VERSION
+from .copy_library import CART_ITEM_SLOT, CUSTOMER_SLOT, GENERAL_CATEGORY, RECOMMENDATION_SLOT, has_required_slots
+from .product_store import normalize_category
+
+logger = logging.getLogger(__name__)
+
+_SLOT_REQUIREMENT = (
+    f"Write {CUSTOMER_SLOT}, {CART_ITEM_SLOT} and {RECOMMENDATION_SLOT} exactly as written "
+    f"(they are replaced with real names when the email is sent)"
+)
+
+
+def discount_tiers() -> List[int]:
+    """Every discount percent calculate_discount can return"""
+    return sorted({0, int(config.DISCOUNT_TIER_1_PERCENT), int(config.DISCOUNT_TIER_2_PERCENT)})
+
+
+def library_prompt(category: str, discount_percent: int, tone: str, approach: str, style: str) -> str:
+    """The live email prompt with slots in place of the customer, cart and recommendations"""
+    product_kind = 'product' if category == GENERAL_CATEGORY else f"product from the {category} category"
+    return compose_prompt(
+        CUSTOMER_SLOT,
+        "Cart contents:",
+        f"- {CART_ITEM_SLOT} (a {product_kind})",
+        discount_percent,
+        f"- {RECOMMENDATION_SLOT}: a {product_kind} that pairs well with {CART_ITEM_SLOT}",
+        tone, approach, style,
+        extra_requirements=(_SLOT_REQUIREMENT,)
+    )
+
+
+def load_categories() -> List[str]:
+    """Normalized categories in the catalog, plus the general fallback"""
+    conn = DatabaseConnection.get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT DISTINCT category FROM products WHERE category IS NOT NULL AND category != ''")
+        categories = {normalize_category(row['category']) for row in cursor.fetchall()}
+    finally:
+        cursor.close()
+        conn.close()
+    categories.discard('')
+    return sorted(categories) + [GENERAL_CATEGORY]
+
+
+def generate_variant(engine: RecommendationEngine, prompt: str) -> str:
+    """One blocking Groq completion paced by the engine's rate limiters, cleaned like live copy"""
+    wait = max(engine.groq_request_limiter.reserve(), engine.groq_token_limiter.reserve(engine._estimate_groq_tokens(prompt)))
+    if wait > 0:
+        time.sleep(wait)
+    response = engine._request_groq_completion(prompt)
+    return engine._clean_ai_text(response.choices[0].message.content)
+
+
+def pregenerate(categories: List[str], variants: int, replace: bool = False) -> dict:
+    """
+    Generate and store copy variants
+
+    Args:
+        categories: Normalized categories to generate for
+        variants: Variants per (category, discount tier, tone)
+        replace: Delete existing copy for these categories first
+
+    Returns:
+        Counts of generated, stored and rejected variants
+    """
+    engine = RecommendationEngine()
+    if not engine.groq_client:
+        raise RuntimeError("GROQ_API_KEY is not set - cannot pre-generate copy")
+
+    conn = DatabaseConnection.get_connection()
+    cursor = conn.cursor()
+    totals = {'generated': 0, 'stored': 0, 'rejected': 0, 'errors': 0}
+    try:
+        if replace:
+            cursor.executemany("DELETE FROM email_copy_library WHERE category = %s", [(c,) for c in categories])
+            conn.commit()
+            logger.info(f"Removed existing copy for {len(categories)} categories")
+
+        for category in categories:
+            for discount_percent in discount_tiers():
+                rows = []
+                for tone in PROMPT_TONES:
+                    for _ in range(variants):
+                        approach = random.choice(PROMPT_APPROACHES)
+                        style = random.choice(PROMPT_STYLES)
+                        try:
+                            text = generate_variant(engine, library_prompt(category, discount_percent, tone, approach, style))
+                        except Exception as e:
+                            totals['errors'] += 1
+                            logger.warning(f"Generation failed ({category}, {discount_percent}%, {tone}): {e}")
+                            continue
+                        totals['generated'] += 1
+                        if not has_required_slots(text):
+                            # Model rewrote a slot; this copy can't be personalized
+                            totals['rejected'] += 1
+                            continue
+                        rows.append((category, discount_percent, tone, approach, style, text, config.GROQ_MODEL, PROMPT_VERSION))
+
+                if rows:
+                    cursor.executemany("""
+                        INSERT INTO email_copy_library
+                            (category, discount_percent, tone, approach, style, copy_text, model, prompt_version)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                    """, rows)
+                    conn.commit()
+                    totals['stored'] += len(rows)
+                logger.info(f"✓ {category} @ {discount_percent}%: stored {len(rows)} variants")
+    finally:
+        cursor.close()
+        conn.close()
+
+    return totals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-generate email copy variants into email_copy_library")
+    parser.add_argument('--variants', type=int, default=config.COPY_LIBRARY_VARIANTS,
+                        help="Variants per (category, discount tier, tone)")
+    parser.add_argument('--categories', nargs='+', help="Only these categories (default: every catalog category plus general)")
+    parser.add_argument('--replace', action='store_true', help="Delete existing copy for the selected categories first")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    categories = [normalize_category(c) for c in args.categories] if args.categories else load_categories()
+    calls = len(categories) * len(discount_tiers()) * len(PROMPT_TONES) * args.variants
+    logger.info(f"Pre-generating {calls} variants for {len(categories)} categories (limited to {config.GROQ_REQUESTS_PER_MINUTE} requests/min)")
+
+    totals = pregenerate(categories, args.variants, args.replace)
+    print(f"\nGenerated {totals['generated']}, stored {totals['stored']}, "
+          f"rejected {totals['rejected']} (slots missing), {totals['errors']} errors")
+    return totals
+
+
+if __name__ == '__main__':
+    main()
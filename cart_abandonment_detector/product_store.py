@@ -0,0 +1,213 @@
+"""
+Product Store
+Compact, column-oriented product catalog used by the recommendation engine.
+"""
+
+import sys
+from collections.abc import Mapping
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from . import config
+
+# Only a short preview of each description is kept in memory. One extra
+# character is stored so callers can still tell when the text was truncated.
+DESCRIPTION_PREVIEW_CHARS = 100
+
+# Category code used for products without a category
+NO_CATEGORY = -1
+
+
+def normalize_category(category: Optional[str]) -> str:
+    """Normalize a category label the same way for products and cart items"""
+    return (category or '').strip().lower()
+
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    """Intern a string so repeated values share one object"""
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class ProductStore:
+    """
+    Column-oriented product catalog.
+
+    Numeric columns (id, price, stock, category code) live in NumPy arrays,
+    categories are stored once and referenced by code, and repeated strings
+    are interned. Rows are appended with add() and the store becomes
+    read-only once freeze() has been called.
+    """
+
+    def __init__(self):
+        self._ids: List[int] = []
+        self._prices: List[float] = []
+        self._stock: List[int] = []
+        self._category_codes: List[int] = []
+
+        self.names: List[str] = []
+        self.descriptions: List[Optional[str]] = []
+        self.categories: List[Optional[str]] = []  # Raw category label per row
+        self.images: List[Optional[str]] = []
+
+        self.category_names: List[str] = []  # Code -> normalized category
+        self._category_lookup: Dict[str, int] = {}
+        self._row_lookup: Dict[int, int] = {}
+
+        self.ids = np.empty(0, dtype=np.int64)
+        self.prices = np.empty(0, dtype=np.float64)
+        self.stock = np.empty(0, dtype=np.int32)
+        self.category_codes = np.empty(0, dtype=np.int32)
+        self.frozen = False
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Dict]) -> 'ProductStore':
+        """Build a frozen store from database rows"""
+        store = cls()
+        for row in rows:
+            store.add(row)
+        return store.freeze()
+
+    def add(self, row: Dict) -> int:
+        """Append a product row and return its row number"""
+        if self.frozen:
+            raise RuntimeError("ProductStore is frozen")
+
+        category = row.get('category')
+        normalized = normalize_category(category)
+        if normalized:
+            code = self._category_lookup.get(normalized)
+            if code is None:
+                code = len(self.category_names)
+                self.category_names.append(_intern(normalized))
+                self._category_lookup[normalized] = code
+        else:
+            code = NO_CATEGORY
+
+        description = row.get('description')
+        if description:
+            description = description[:DESCRIPTION_PREVIEW_CHARS + 1]
+
+        row_number = len(self._ids)
+        self._ids.append(int(row['id']))
+        self._prices.append(float(row.get('price') or 0))
+        self._stock.append(int(row.get('stock') or 0))
+        self._category_codes.append(code)
+        self.names.append(_intern(row.get('name')))
+        self.descriptions.append(description)
+        self.categories.append(_intern(category))
+        self.images.append(_intern(row.get('image')))
+        return row_number
+
+    def freeze(self) -> 'ProductStore':
+        """Convert the accumulated columns to NumPy arrays and build the id index"""
+        if self.frozen:
+            return self
+
+        self.ids = np.asarray(self._ids, dtype=np.int64)
+        self.prices = np.asarray(self._prices, dtype=np.float64)
+        self.stock = np.asarray(self._stock, dtype=np.int32)
+        self.category_codes = np.asarray(self._category_codes, dtype=np.int32)
+        self._row_lookup = {product_id: row for row, product_id in enumerate(self._ids)}
+        self._ids = self._prices = self._stock = self._category_codes = None
+        self.frozen = True
+        return self
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __bool__(self) -> bool:
+        return len(self.names) > 0
+
+    def row_of(self, product_id: int) -> Optional[int]:
+        """Return the row number for a product id, or None if not loaded"""
+        return self._row_lookup.get(int(product_id))
+
+    def category_code(self, category: Optional[str]) -> Optional[int]:
+        """Return the code for a (raw or normalized) category, or None if unknown"""
+        normalized = normalize_category(category)
+        if not normalized:
+            return NO_CATEGORY
+        return self._category_lookup.get(normalized)
+
+    def category_of(self, row: int) -> str:
+        """Return the normalized category for a row"""
+        code = self.category_codes[row]
+        return self.category_names[code] if code != NO_CATEGORY else ''
+
+    def rows_excluding(self, product_ids: Iterable[int], categories: Optional[Iterable[str]] = None) -> np.ndarray:
+        """
+        Return row numbers (in catalog order) whose id is not in product_ids,
+        optionally restricted to the given normalized categories
+        """
+        mask = ~np.isin(self.ids, np.fromiter(product_ids, dtype=np.int64))
+        if categories is not None:
+            codes = [self.category_code(cat) for cat in categories]
+            codes = [code for code in codes if code is not None]
+            mask &= np.isin(self.category_codes, np.asarray(codes, dtype=np.int32))
+        return np.flatnonzero(mask)
+
+    def view(self, row: int, similarity_score: float = 0.0, recommended_because_of: Optional[str] = None) -> 'ProductView':
+        """Return a lightweight view of one row"""
+        return ProductView(self, row, similarity_score, recommended_because_of)
+
+
+class ProductView(Mapping):
+    """
+    Read-only, dict-like view of one ProductStore row plus recommendation fields.
+
+    Supports product['name'] / product.get('description') like the database
+    rows it replaces; call to_dict() to materialize a plain dict.
+    """
+
+    __slots__ = ('_store', '_row', 'similarity_score', 'recommended_because_of')
+
+    def __init__(self, store: ProductStore, row: int, similarity_score: float = 0.0, recommended_because_of: Optional[str] = None):
+        self._store = store
+        self._row = row
+        self.similarity_score = float(similarity_score)
+        self.recommended_because_of = recommended_because_of
+
+    def _keys(self) -> List[str]:
+        keys = ['id', 'name', 'description', 'price', 'category', 'image', 'stock', 'similarity_score']
+        if self.recommended_because_of is not None:
+            keys.append('recommended_because_of')
+        keys.append('url')
+        return keys
+
+    def __getitem__(self, key: str):
+        store, row = self._store, self._row
+        if key == 'id':
+            return int(store.ids[row])
+        if key == 'name':
+            return store.names[row]
+        if key == 'description':
+            return store.descriptions[row]
+        if key == 'price':
+            return float(store.prices[row])
+        if key == 'category':
+            return store.categories[row]
+        if key == 'image':
+            return store.images[row]
+        if key == 'stock':
+            return int(store.stock[row])
+        if key == 'similarity_score':
+            return self.similarity_score
+        if key == 'recommended_because_of' and self.recommended_because_of is not None:
+            return self.recommended_because_of
+        if key == 'url':
+            return f"{config.BASE_URL}/product/{int(store.ids[row])}"
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._keys())
+
+    def __len__(self) -> int:
+        return len(self._keys())
+
+    def __repr__(self) -> str:
+        return f"ProductView(id={self['id']}, name={self['name']!r}, score={self.similarity_score:.4f})"
+
+    def to_dict(self) -> Dict:
+        """Materialize the view as a plain dict (e.g. for email rendering)"""
+        return {key: self[key] for key in self._keys()}
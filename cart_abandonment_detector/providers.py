@@ -0,0 +1,261 @@
+"""
+LLM Provider Pool
+Several OpenAI-compatible endpoints/models behind one call: each request is
+routed to the fastest healthy provider (EWMA latency, per-provider circuit
+breakers) and fails over to the next one instead of losing the email.
+
+Providers come from LLM_PROVIDERS, a JSON list such as
+    [{"name": "groq", "base_url": "https://api.groq.com/openai/v1", "model": "llama-3.3-70b-versatile"},
+     {"name": "backup", "base_url": "http://10.0.0.5:8000/v1", "model": "llama-3.1-8b", "api_key_env": "BACKUP_KEY"}]
+With LLM_PROVIDERS unset the pool holds one provider built from the GROQ_* settings.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from openai import OpenAI
+
+from . import config
+from .resilience import CircuitBreaker
+
+logger = logging.getLogger(__name__)
+
+
+class NoProviderAvailable(RuntimeError):
+    """Every provider's circuit breaker is open"""
+
+
+class Provider:
+    """One OpenAI-compatible endpoint and model, with its own breaker and latency score"""
+
+    def __init__(self, name: str, base_url: str, model: str, api_key: str, timeout: float, max_retries: int,
+                 ewma_alpha: float = 0.3, failure_threshold: int = 3, reset_timeout: float = 60.0):
+        self.name = name
+        self.base_url = base_url
+        self.model = model
+        self.client = OpenAI(api_key=api_key, base_url=base_url, timeout=timeout, max_retries=max_retries)
+        self.timeout = timeout
+        self.ewma_alpha = ewma_alpha
+        self.breaker = CircuitBreaker(f"llm:{name}", failure_threshold=failure_threshold, reset_timeout=reset_timeout)
+        self._lock = threading.Lock()
+
+        self.ewma_seconds: Optional[float] = None
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.health_checks = 0
+        self.health_check_failures = 0
+
+    def score(self) -> float:
+        """Expected wait for one more request: EWMA latency scaled by requests in flight"""
+        with self._lock:
+            # Unmeasured providers score 0 so they get tried (and measured) first
+            return (self.ewma_seconds or 0.0) * (1 + self.in_flight)
+
+    def _observe(self, seconds: float):
+        if self.ewma_seconds is None:
+            self.ewma_seconds = seconds
+        else:
+            self.ewma_seconds += self.ewma_alpha * (seconds - self.ewma_seconds)
+
+    def started(self):
+        with self._lock:
+            self.in_flight += 1
+            self.requests += 1
+
+    def succeeded(self, seconds: float):
+        with self._lock:
+            self.in_flight -= 1
+            self._observe(seconds)
+        self.breaker.record_success()
+
+    def failed(self, seconds: float):
+        with self._lock:
+            self.in_flight -= 1
+            self.failures += 1
+            # A failure costs at least a timeout's worth of latency in the ranking
+            self._observe(max(seconds, self.timeout))
+        self.breaker.record_failure()
+
+    def check_health(self) -> bool:
+        """Probe GET /models; the result feeds the breaker but not the latency score"""
+        with self._lock:
+            self.health_checks += 1
+        try:
+            self.client.with_options(max_retries=0).models.list()
+        except Exception as e:
+            with self._lock:
+                self.health_check_failures += 1
+            self.breaker.record_failure()
+            logger.warning(f"LLM provider '{self.name}' failed its health check: {e}")
+            return False
+        self.breaker.record_success()
+        return True
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = {
+                'name': self.name,
+                'base_url': self.base_url,
+                'model': self.model,
+                'ewma_seconds': round(self.ewma_seconds, 4) if self.ewma_seconds is not None else None,
+                'in_flight': self.in_flight,
+                'requests': self.requests,
+                'failures': self.failures,
+                'health_checks': self.health_checks,
+                'health_check_failures': self.health_check_failures,
+            }
+        stats['breaker'] = self.breaker.stats()
+        return stats
+
+
+class ProviderPool:
+    """
+    Latency-aware routing with failover across providers
+
+    call() tries providers fastest-first (lowest score), skipping any whose
+    breaker refuses the call, and moves on to the next provider when one
+    raises. For streamed calls the measured latency is the time to the
+    response headers. An optional daemon thread probes providers that are
+    not closed every health_check_seconds, so a recovered endpoint comes
+    back without waiting for live traffic to risk a trial call.
+    """
+
+    def __init__(self, providers: List[Provider], health_check_seconds: float = 0):
+        if not providers:
+            raise ValueError("ProviderPool needs at least one provider")
+        self.providers = providers
+        self.health_check_seconds = health_check_seconds
+        self._stop = threading.Event()
+        self._health_thread: Optional[threading.Thread] = None
+        self.failovers = 0
+
+    @classmethod
+    def from_config(cls) -> Optional['ProviderPool']:
+        """Pool from LLM_PROVIDERS (or the GROQ_* settings); None if no provider has an API key"""
+        specs = load_provider_specs(config.LLM_PROVIDERS)
+        # Client retries would only delay failover to the next provider
+        max_retries = config.GROQ_MAX_RETRIES if len(specs) == 1 else 0
+        providers = []
+        for spec in specs:
+            if spec.get('api_key_env'):
+                api_key = os.getenv(spec['api_key_env'], '')
+            else:
+                api_key = spec.get('api_key') or config.GROQ_API_KEY
+            if not api_key:
+                logger.warning(f"LLM provider '{spec['name']}' has no API key - skipped")
+                continue
+            providers.append(Provider(
+                spec['name'], spec['base_url'], spec['model'], api_key,
+                timeout=float(spec.get('timeout', config.GROQ_TIMEOUT_SECONDS)),
+                max_retries=int(spec.get('max_retries', max_retries)),
+                ewma_alpha=config.LLM_PROVIDER_EWMA_ALPHA,
+                failure_threshold=config.LLM_PROVIDER_FAILURE_THRESHOLD,
+                reset_timeout=config.LLM_PROVIDER_RESET_SECONDS,
+            ))
+        if not providers:
+            return None
+        return cls(providers, health_check_seconds=config.LLM_PROVIDER_HEALTH_CHECK_SECONDS)
+
+    @property
+    def primary(self) -> Provider:
+        return self.providers[0]
+
+    def route(self) -> List[Provider]:
+        """Providers in the order call() would try them (breakers not consulted)"""
+        # Stable sort: ties (e.g. all unmeasured) keep the configured order
+        return sorted(self.providers, key=lambda provider: provider.score())
+
+    def call(self, request: Callable[[Provider], object]):
+        """
+        Run request(provider) on the best provider, failing over on errors
+
+        Returns:
+            The first successful result
+
+        Raises:
+            NoProviderAvailable: If every breaker refused the call
+            Exception: The last provider's error, if every attempted provider failed
+        """
+        last_error = None
+        attempted = 0
+        for provider in self.route():
+            if not provider.breaker.allow():
+                continue
+            if attempted:
+                self.failovers += 1
+                logger.warning(f"Failing over to LLM provider '{provider.name}' after: {last_error}")
+            attempted += 1
+            provider.started()
+            started = time.perf_counter()
+            try:
+                result = request(provider)
+            except Exception as e:
+                provider.failed(time.perf_counter() - started)
+                last_error = e
+                continue
+            provider.succeeded(time.perf_counter() - started)
+            return result
+        if last_error is not None:
+            raise last_error
+        raise NoProviderAvailable("All LLM providers are unavailable (circuit breakers open)")
+
+    def check_health(self, all_providers: bool = False) -> Dict[str, bool]:
+        """Probe providers whose breaker is not closed (or every provider)"""
+        results = {}
+        for provider in self.providers:
+            if all_providers or provider.breaker.state != CircuitBreaker.CLOSED:
+                results[provider.name] = provider.check_health()
+        return results
+
+    def start_health_checks(self) -> bool:
+        """Start the background prober (only useful with several providers)"""
+        if self.health_check_seconds <= 0 or len(self.providers) < 2 or self._health_thread is not None:
+            return False
+        self._health_thread = threading.Thread(target=self._health_loop, name='llm-provider-health', daemon=True)
+        self._health_thread.start()
+        return True
+
+    def _health_loop(self):
+        while not self._stop.wait(self.health_check_seconds):
+            try:
+                self.check_health()
+            except Exception as e:
+                logger.error(f"LLM provider health check failed: {e}")
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self) -> Dict:
+        return {
+            'failovers': self.failovers,
+            'routing_order': [provider.name for provider in self.route()],
+            'providers': [provider.stats() for provider in self.providers],
+        }
+
+
+def load_provider_specs(raw: str) -> List[Dict]:
+    """
+    Parse LLM_PROVIDERS
+
+    Returns:
+        Provider specs (name, base_url, model and optional api_key, api_key_env,
+        timeout, max_retries); the GROQ_* provider when raw is empty
+
+    Raises:
+        ValueError: If raw is not a JSON list of objects with base_url and model
+    """
+    if not raw or not raw.strip():
+        return [{'name': 'groq', 'base_url': config.GROQ_BASE_URL, 'model': config.GROQ_MODEL}]
+    specs = json.loads(raw)
+    if not isinstance(specs, list) or not specs:
+        raise ValueError("LLM_PROVIDERS must be a non-empty JSON list")
+    for n, spec in enumerate(specs):
+        if not isinstance(spec, dict) or not spec.get('base_url') or not spec.get('model'):
+            raise ValueError(f"LLM_PROVIDERS[{n}] needs base_url and model")
+        spec.setdefault('name', f"provider{n + 1}")
+    return specs
@@ -0,0 +1,109 @@
+"""
+Rate Limiting
+Token-bucket limiter used to keep concurrent Groq calls inside the API's
+request and token rate limits.
+"""
+
+import asyncio
+import threading
+import time
+from typing import Dict
+
+
+class TokenBucket:
+    """
+    Token bucket that refills at a fixed rate up to a burst capacity.
+
+    Callers reserve tokens under a thread lock and then sleep (outside the
+    lock) until their reservation is covered, so waiters are served in
+    arrival order and the bucket works from any thread or event loop.
+    A rate of 0 disables limiting.
+    """
+
+    def __init__(self, rate_per_second: float, capacity: float = 1.0):
+        self.rate_per_second = rate_per_second
+        self.capacity = max(capacity, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+        self.acquired = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.rejected = 0
+
+    @classmethod
+    def per_minute(cls, rate_per_minute: float, burst_seconds: float = 1.0) -> 'TokenBucket':
+        """
+        Create a bucket from a per-minute limit (as API rate limits are quoted)
+
+        Args:
+            rate_per_minute: Sustained limit
+            burst_seconds: Bucket holds this many seconds' worth of tokens
+        """
+        rate_per_second = rate_per_minute / 60.0
+        return cls(rate_per_second, rate_per_second * burst_seconds)
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate_per_second > 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate_per_second)
+        self._updated = now
+
+    def reserve(self, tokens: float = 1.0) -> float:
+        """
+        Take tokens now (the balance may go negative)
+
+        Returns:
+            Seconds the caller must wait before using them
+        """
+        if not self.enabled:
+            return 0.0
+        with self._lock:
+            self._refill()
+            self._tokens -= tokens
+            self.acquired += 1
+            wait = -self._tokens / self.rate_per_second if self._tokens < 0 else 0.0
+            if wait > 0:
+                self.waits += 1
+                self.wait_seconds += wait
+            return wait
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """Take tokens only if they are available right now (server-side limiting)"""
+        if not self.enabled:
+            return True
+        with self._lock:
+            self._refill()
+            if self._tokens < tokens:
+                self.rejected += 1
+                return False
+            self._tokens -= tokens
+            self.acquired += 1
+            return True
+
+    async def acquire(self, tokens: float = 1.0) -> float:
+        """
+        Wait until tokens are available
+
+        Returns:
+            Seconds spent waiting
+        """
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def stats(self) -> Dict:
+        """Return limiter counters"""
+        return {
+            'rate_per_minute': self.rate_per_second * 60,
+            'capacity': self.capacity,
+            'acquired': self.acquired,
+            'waits': self.waits,
+            'wait_seconds': round(self.wait_seconds, 3),
+            'rejected': self.rejected,
+        }
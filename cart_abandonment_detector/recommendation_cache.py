@@ -0,0 +1,101 @@
+"""
+Recommendation Cache
+LRU + TTL cache of recommendation lists keyed by cart contents and catalog index version.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Tuple
+
+
+def generate_cart_hash(cart_items: List[Dict]) -> str:
+    """Generate a unique hash for cart contents to identify the same cart"""
+    # Sort items by product_id and create a string representation
+    sorted_items = sorted(cart_items, key=lambda x: x['product_id'])
+    cart_signature = "|".join([
+        f"{item['product_id']}:{item['quantity']}"
+        for item in sorted_items
+    ])
+    # Generate SHA256 hash
+    return hashlib.sha256(cart_signature.encode()).hexdigest()
+
+
+class RecommendationCache:
+    """
+    Thread-safe LRU cache with per-entry TTL.
+
+    Keys are (cart_hash, index_version, count) tuples, so entries computed
+    against an older index can never be returned; clear() is also called
+    whenever the index is rebuilt so they don't occupy space either.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 900):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: 'OrderedDict[Hashable, Tuple[float, List]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def make_key(cart_hash: str, index_version: int, count: int) -> Tuple[str, int, int]:
+        """Build a cache key for a cart at a given index version"""
+        return (cart_hash, index_version, count)
+
+    def get(self, key: Hashable) -> Optional[List]:
+        """Return a copy of the cached list, or None on miss/expiry"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            stored_at, value = entry
+            if time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return list(value)
+
+    def put(self, key: Hashable, value: List):
+        """Store a list, evicting the least recently used entries when full"""
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), list(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop all entries (called when the catalog index is rebuilt)"""
+        with self._lock:
+            self.evictions += len(self._entries)
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict:
+        """Return hit-rate metrics"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits / lookups) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
@@ -0,0 +1,128 @@
+"""
+Recommendation Index
+Immutable snapshot of the product catalog plus its TF-IDF matrix, and a
+background builder that swaps new snapshots in atomically.
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+from .product_store import ProductStore
+
+logger = logging.getLogger(__name__)
+
+
+class RecommendationIndex:
+    """
+    Everything needed to score products, built together and never mutated.
+
+    Readers grab the engine's current index once per call and use only that
+    object, so a concurrent rebuild can never mix a new matrix with an old
+    product store.
+    """
+
+    __slots__ = ('store', 'vectorizer', 'tfidf_matrix', 'shards', 'version', 'built_at', 'build_seconds')
+
+    def __init__(self, store: ProductStore, vectorizer, tfidf_matrix, version: int, build_seconds: float, shards=None):
+        self.store = store
+        self.vectorizer = vectorizer
+        self.tfidf_matrix = tfidf_matrix
+        self.shards = shards  # CategoryShards, or None to always score the full catalog
+        self.version = version
+        self.built_at = time.time()
+        self.build_seconds = build_seconds
+
+    def age_seconds(self) -> float:
+        """Seconds since this index was built (staleness)"""
+        return time.time() - self.built_at
+
+
+class BackgroundIndexBuilder:
+    """
+    Runs index builds on a daemon thread, one at a time.
+
+    The build function does the full work (query, sanitize, stem, vectorize)
+    and publishes the new index itself with a single reference assignment;
+    this class only handles scheduling, de-duplication and bookkeeping.
+    """
+
+    def __init__(self, build: Callable[[], None], name: str = 'recommendation-index-builder'):
+        self._build = build
+        self._name = name
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+        self._rerun = False
+
+        self.builds_completed = 0
+        self.builds_failed = 0
+        self.last_build_seconds: Optional[float] = None
+        self.last_started_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    @property
+    def building(self) -> bool:
+        thread = self._thread
+        return thread is not None and thread.is_alive()
+
+    def start(self, rerun: bool = False) -> bool:
+        """
+        Start a build unless one is already running
+
+        Args:
+            rerun: If a build is already running, run another one right after it
+                   (the running build may have read its rows before a change)
+
+        Returns:
+            True if a new build was started
+        """
+        with self._lock:
+            if self.building:
+                self._rerun = self._rerun or rerun
+                return False
+            self._spawn()
+            return True
+
+    def _spawn(self):
+        # Caller holds self._lock
+        self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+        self.last_started_at = time.time()
+        self._thread.start()
+
+    def _run(self):
+        start = time.perf_counter()
+        try:
+            self._build()
+            self.builds_completed += 1
+            self.last_error = None
+        except Exception as e:
+            self.builds_failed += 1
+            self.last_error = str(e)
+            logger.error(f"Background index build failed: {e}")
+        finally:
+            self.last_build_seconds = time.perf_counter() - start
+            self._ready.set()
+            logger.info(f"Background index build finished in {self.last_build_seconds:.2f}s")
+            with self._lock:
+                if self._rerun:
+                    self._rerun = False
+                    self._spawn()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until at least one build has finished (for warm-up only)"""
+        return self._ready.wait(timeout)
+
+    def stats(self) -> Dict:
+        """Return builder bookkeeping"""
+        return {
+            'building': self.building,
+            'rerun_pending': self._rerun,
+            'builds_completed': self.builds_completed,
+            'builds_failed': self.builds_failed,
+            'last_build_seconds': self.last_build_seconds,
+            'last_started_at': datetime.fromtimestamp(self.last_started_at).isoformat() if self.last_started_at else None,
+            'last_error': self.last_error,
+        }
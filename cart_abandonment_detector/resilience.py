@@ -0,0 +1,108 @@
+"""
+Resilience
+Circuit breaker that short-circuits calls to a failing dependency (Groq).
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """
+    Classic three-state circuit breaker.
+
+    - closed: calls go through; failure_threshold consecutive failures open it
+    - open: calls are refused until reset_timeout seconds have passed
+    - half_open: one trial call at a time; success closes, failure re-opens
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 60.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._trial_started = 0.0
+        self._lock = threading.Lock()
+
+        self.successes = 0
+        self.failures = 0
+        self.short_circuited = 0
+        self.times_opened = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._trial_in_flight = False
+        return self._state
+
+    def allow(self) -> bool:
+        """Return True if a call may be attempted now (counts refusals)"""
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+            # A trial that never reported back (e.g. abandoned) doesn't block the breaker forever
+            if state == self.HALF_OPEN and (not self._trial_in_flight or time.monotonic() - self._trial_started > self.reset_timeout):
+                self._trial_in_flight = True
+                self._trial_started = time.monotonic()
+                return True
+            self.short_circuited += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.successes += 1
+            self._consecutive_failures = 0
+            if self._state != self.CLOSED:
+                logger.info(f"Circuit '{self.name}' closed")
+            self._state = self.CLOSED
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._consecutive_failures += 1
+            state = self._current_state()
+            if state == self.HALF_OPEN or (state == self.CLOSED and self._consecutive_failures >= self.failure_threshold):
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+                self.times_opened += 1
+                logger.warning(f"Circuit '{self.name}' opened after {self._consecutive_failures} consecutive failures (retry in {self.reset_timeout:.0f}s)")
+
+    def stats(self) -> Dict:
+        """Return breaker state and counters"""
+        with self._lock:
+            state = self._current_state()
+            opened_at = None
+            if self._opened_at is not None:
+                opened_at = datetime.fromtimestamp(time.time() - (time.monotonic() - self._opened_at)).isoformat(timespec='seconds')
+            return {
+                'name': self.name,
+                'state': state,
+                'consecutive_failures': self._consecutive_failures,
+                'failure_threshold': self.failure_threshold,
+                'reset_timeout_seconds': self.reset_timeout,
+                'last_opened_at': opened_at,
+                'successes': self.successes,
+                'failures': self.failures,
+                'short_circuited': self.short_circuited,
+                'times_opened': self.times_opened,
+            }
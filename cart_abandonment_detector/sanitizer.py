@@ -0,0 +1,149 @@
+"""
+Safe Sanitizer
+Precompiled, batch-friendly implementation of the Responsible AI text sanitizer
+used for product text (before TF-IDF) and AI-generated email content.
+"""
+
+import logging
+import re
+from typing import Iterable, List
+
+logger = logging.getLogger(__name__)
+
+# 1. HTML tags
+_HTML_TAG = re.compile(r'<[^>]+>')
+
+# 2. PII and identifiers (order matters: emails before URLs before numbers).
+# Each pattern is skipped outright when its cheap precondition is absent.
+_DIGIT = re.compile(r'\d')
+_PII_PATTERNS = [
+    (lambda s: '@' in s, re.compile(r'\b[\w\.-]+@[\w\.-]+\.\w{2,}\b'), '[EMAIL_REMOVED]'),
+    (lambda s: '://' in s or 'www.' in s, re.compile(r'https?://\S+|www\.\S+'), '[URL_REMOVED]'),
+    (lambda s: '-' in s, re.compile(r'\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b'), '[ID_REMOVED]'),
+    (_DIGIT.search, re.compile(r'\b(?:user|uid|id|account)[_\-:]?\d+\b', re.IGNORECASE), '[USER_ID_REMOVED]'),
+    (_DIGIT.search, re.compile(r'\b\d{4,}\b'), '[NUMBER_REMOVED]'),
+    (lambda s: '@' in s or '#' in s, re.compile(r'[@#]\w+'), ''),
+]
+
+# 3. Offensive/manipulative words for email content, as one alternation.
+# "you'll regret" is not listed separately: every "regret" is already removed,
+# which is what happened when the patterns were applied one after another.
+OFFENSIVE_WORDS = [
+    'regret', 'failure', 'shame', 'stupid', 'idiot', 'loser', 'pathetic', 'worthless',
+    'missing out', 'fomo', 'last chance', 'act now or never', "don't be a fool",
+    "what's wrong with you",
+]
+_OFFENSIVE = re.compile(r'\b(?:' + '|'.join(re.escape(word) for word in OFFENSIVE_WORDS) + r')\b', re.IGNORECASE)
+
+# 4 + 5. Remove special characters and collapse whitespace in one pass:
+# every run of removed characters and/or whitespace becomes a single space
+_PRODUCT_SPECIAL_AND_SPACE = re.compile(r'[^a-zA-Z0-9]+')
+_EMAIL_SPECIAL_AND_SPACE = re.compile(r'[^\w\.,!?\-\'%$]+')
+
+# Placeholder markers stripped from product text, in a single pass
+_PRODUCT_PLACEHOLDERS = re.compile(r'\[(?:email|url|id|user_id|number)_removed\]')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def _clean(text: str, content_type: str) -> str:
+    """Run the sanitization steps without audit logging"""
+    s = _HTML_TAG.sub(' ', text) if '<' in text else text
+    for precondition, pattern, replacement in _PII_PATTERNS:
+        if precondition(s):
+            s = pattern.sub(replacement, s)
+
+    if content_type == "email":
+        s = _OFFENSIVE.sub('', s)
+
+    if content_type == "product":
+        s = _PRODUCT_SPECIAL_AND_SPACE.sub(' ', s).strip().lower()
+        if '_removed]' in s:
+            s = _WHITESPACE.sub(' ', _PRODUCT_PLACEHOLDERS.sub('', s)).strip()
+    else:
+        s = _EMAIL_SPECIAL_AND_SPACE.sub(' ', s).strip()
+    return s
+
+
+def _changes_made(original_text: str, s: str) -> List[str]:
+    """Describe what the sanitizer removed (for the audit log)"""
+    changes_made = []
+    if '[EMAIL_REMOVED]' in s:
+        changes_made.append('email')
+    if '[URL_REMOVED]' in s:
+        changes_made.append('url')
+    if '[ID_REMOVED]' in s or '[USER_ID_REMOVED]' in s or '[NUMBER_REMOVED]' in s:
+        changes_made.append('identifiers')
+    if _HTML_TAG.search(original_text):
+        changes_made.append('html_tags')
+    return changes_made
+
+
+def unsafe_content(text: str) -> List[str]:
+    """Kinds of unsafe content the sanitizer removes from text: html, pii, offensive"""
+    kinds = []
+    if _HTML_TAG.search(text):
+        kinds.append('html')
+    if any(precondition(text) and pattern.search(text) for precondition, pattern, _ in _PII_PATTERNS[:-1]):
+        kinds.append('pii')
+    if _OFFENSIVE.search(text):
+        kinds.append('offensive')
+    return kinds
+
+
+def sanitize_text(text: str, content_type: str = "product") -> str:
+    """
+    Sanitize one string
+
+    Args:
+        text: Input text to sanitize
+        content_type: Type of content - "product" or "email"
+
+    Returns:
+        Sanitized text
+    """
+    if not text:
+        return ""
+
+    s = _clean(text, content_type)
+
+    # Log sanitization for auditing
+    if text != s:
+        changes_made = _changes_made(text, s)
+        logger.info(f"[SAFE_SANITIZER] {content_type.upper()} text sanitized. Removed: {', '.join(changes_made) if changes_made else 'special_chars'}")
+        logger.debug(f"[SAFE_SANITIZER] Original length: {len(text)}, Sanitized length: {len(s)}")
+
+    return s
+
+
+def sanitize_many(texts: Iterable[str], content_type: str = "product") -> List[str]:
+    """
+    Sanitize a batch of strings
+
+    Produces exactly what sanitize_text would for each string, but writes one
+    audit summary for the whole batch instead of one log line per string.
+
+    Args:
+        texts: Input texts to sanitize
+        content_type: Type of content - "product" or "email"
+
+    Returns:
+        Sanitized texts, in input order
+    """
+    results = []
+    changed = 0
+    change_counts = {}
+    for text in texts:
+        if not text:
+            results.append("")
+            continue
+        s = _clean(text, content_type)
+        if text != s:
+            changed += 1
+            for change in _changes_made(text, s) or ['special_chars']:
+                change_counts[change] = change_counts.get(change, 0) + 1
+        results.append(s)
+
+    if changed:
+        summary = ', '.join(f"{change}={count}" for change, count in sorted(change_counts.items()))
+        logger.info(f"[SAFE_SANITIZER] {content_type.upper()} batch: sanitized {changed}/{len(results)} texts. Removed: {summary}")
+    return results
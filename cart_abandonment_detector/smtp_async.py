@@ -0,0 +1,474 @@
+"""
+Async SMTP
+Native asyncio SMTP client for the detector's event loop. Every send is
+queued onto a few long-lived connections instead of taking an executor
+thread, and with ESMTP PIPELINING (RFC 2920) a message's envelope
+(MAIL, RCPT, DATA) goes out in one write - in the same write as the previous
+message's body when more messages are waiting - so a connection spends about
+one round trip per message instead of four.
+"""
+
+import asyncio
+import base64
+import copy
+import io
+import logging
+import re
+import smtplib
+import socket
+import ssl
+import time
+from email.generator import BytesGenerator
+from email.message import Message
+from email.utils import getaddresses
+from typing import Dict, List, Mapping, Optional, Set, Tuple
+
+from . import config
+
+logger = logging.getLogger(__name__)
+
+# Errors after which a connection is unusable (the server went away)
+_DISCONNECTED = (smtplib.SMTPServerDisconnected, ConnectionError, asyncio.IncompleteReadError)
+
+_EOL = re.compile(rb'\r\n|\n|\r')
+_LEADING_DOT = re.compile(rb'(?m)^\.')
+
+
+class AsyncSMTPUnavailable(smtplib.SMTPException):
+    """The async client can't be used with this server or Python; send through the threaded path"""
+
+
+def message_payload(msg: Message) -> bytes:
+    """DATA payload: CRLF line endings, dot-stuffed, ending in CRLF (the final '.' not included)"""
+    # Serialized like smtplib.send_message: the message's own policy, CRLF line endings
+    with io.BytesIO() as buffer:
+        BytesGenerator(buffer, policy=msg.policy.clone(linesep='\r\n')).flatten(msg, linesep='\r\n')
+        data = _EOL.sub(b'\r\n', buffer.getvalue())
+    data = _LEADING_DOT.sub(b'..', data)
+    return data if data.endswith(b'\r\n') else data + b'\r\n'
+
+
+class _Job:
+    __slots__ = ('from_addr', 'recipients', 'payload', 'future', 'attempts')
+
+    def __init__(self, from_addr: str, recipients: List[str], payload: bytes, future: asyncio.Future):
+        self.from_addr = from_addr
+        self.recipients = recipients
+        self.payload = payload
+        self.future = future
+        self.attempts = 0
+
+
+class _Connection:
+    """One logged-in SMTP connection (used by a single connection task)"""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, timeout: float):
+        self.reader = reader
+        self.writer = writer
+        self.timeout = timeout
+        self.extensions: Dict[str, str] = {}
+        self.messages = 0
+
+    @property
+    def pipelining(self) -> bool:
+        return 'pipelining' in self.extensions
+
+    async def read_reply(self) -> Tuple[int, str]:
+        lines = []
+        while True:
+            line = await asyncio.wait_for(self.reader.readline(), self.timeout)
+            if not line:
+                raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+            try:
+                code = int(line[:3])
+            except ValueError:
+                raise smtplib.SMTPResponseException(-1, line.decode('utf-8', 'replace').strip())
+            lines.append(line[4:].strip().decode('utf-8', 'replace'))
+            if line[3:4] != b'-':
+                return code, '\n'.join(lines)
+
+    async def command(self, line: str) -> Tuple[int, str]:
+        self.writer.write(line.encode('ascii') + b'\r\n')
+        await self.writer.drain()
+        return await self.read_reply()
+
+    async def ehlo(self, local_hostname: str):
+        code, text = await self.command(f"EHLO {local_hostname}")
+        if code != 250:
+            raise smtplib.SMTPHeloError(code, text)
+        self.extensions = {}
+        for line in text.split('\n')[1:]:
+            keyword, _, params = line.partition(' ')
+            self.extensions[keyword.lower()] = params
+
+    async def login(self, username: str, password: str):
+        mechanisms = self.extensions.get('auth', '').upper().split()
+        if 'PLAIN' in mechanisms:
+            token = base64.b64encode(f"\0{username}\0{password}".encode('utf-8')).decode('ascii')
+            code, text = await self.command(f"AUTH PLAIN {token}")
+        elif 'LOGIN' in mechanisms:
+            code, text = await self.command("AUTH LOGIN " + base64.b64encode(username.encode('utf-8')).decode('ascii'))
+            if code == 334:
+                code, text = await self.command(base64.b64encode(password.encode('utf-8')).decode('ascii'))
+        else:
+            raise AsyncSMTPUnavailable(f"no supported AUTH mechanism (server offers: {' '.join(mechanisms) or 'none'})")
+        if code not in (235, 503):  # 503: already authenticated
+            raise smtplib.SMTPAuthenticationError(code, text)
+
+    def write_envelope(self, job: _Job):
+        """Queue MAIL, RCPT and DATA for a pipelined transaction (no drain)"""
+        lines = [f"MAIL FROM:<{job.from_addr}>"] + [f"RCPT TO:<{rcpt}>" for rcpt in job.recipients] + ["DATA"]
+        self.writer.write(''.join(line + '\r\n' for line in lines).encode('utf-8'))
+
+    async def finish_envelope(self, job: _Job, written: bool) -> Dict[str, Tuple[int, str]]:
+        """
+        Read the replies of a written envelope (or run it step by step without PIPELINING)
+
+        Returns:
+            Refused recipients (the server is waiting for the message body)
+
+        Raises:
+            smtplib.SMTPSenderRefused, SMTPRecipientsRefused, SMTPDataError: The
+            transaction was rejected (the connection has been RSET and stays usable)
+        """
+        if not written:
+            self.writer.write(f"MAIL FROM:<{job.from_addr}>\r\n".encode('utf-8'))
+            await self.writer.drain()
+        code, text = await self.read_reply()
+        error: Optional[smtplib.SMTPException] = None
+        if code != 250:
+            error = smtplib.SMTPSenderRefused(code, text, job.from_addr)
+            if not written:
+                await self._reset()
+                raise error
+
+        refused = {}
+        for rcpt in job.recipients:
+            if not written:
+                self.writer.write(f"RCPT TO:<{rcpt}>\r\n".encode('utf-8'))
+                await self.writer.drain()
+            code, text = await self.read_reply()
+            if code not in (250, 251):
+                refused[rcpt] = (code, text)
+        if error is None and len(refused) == len(job.recipients):
+            error = smtplib.SMTPRecipientsRefused(refused)
+            if not written:
+                await self._reset()
+                raise error
+
+        if not written:
+            self.writer.write(b"DATA\r\n")
+            await self.writer.drain()
+        code, text = await self.read_reply()
+        if code == 354 and error is not None:
+            # Pipelined DATA was accepted although the envelope failed: send an empty body
+            self.writer.write(b".\r\n")
+            await self.writer.drain()
+            await self.read_reply()
+        if code != 354 and error is None:
+            error = smtplib.SMTPDataError(code, text)
+        if error is not None:
+            await self._reset()
+            raise error
+        return refused
+
+    async def _reset(self):
+        code, text = await self.command("RSET")
+        if code != 250:
+            raise smtplib.SMTPServerDisconnected(f"RSET failed: {code} {text}")
+
+    async def quit(self):
+        try:
+            await asyncio.wait_for(self.command("QUIT"), self.timeout)
+        except Exception:
+            pass
+        self.close()
+
+    def close(self):
+        self.writer.close()
+
+
+class AsyncSMTPSender:
+    """
+    Pipelining SMTP client shared by every send on one event loop
+
+    send() queues the message; up to `connections` connection tasks (opened
+    on demand, each logged in once) take messages off the queue. A task
+    whose connection has sent max_messages_per_connection messages QUITs and
+    reconnects; one that has waited idle_timeout seconds for work closes its
+    connection and exits. A message whose reused connection drops is retried
+    once on a fresh connection, like SMTPConnectionPool.
+
+    Server or Python limitations (no usable AUTH mechanism, STARTTLS without
+    StreamWriter.start_tls, TLS setup errors) raise AsyncSMTPUnavailable and
+    mark the sender unavailable, so callers switch to the threaded path.
+    """
+
+    def __init__(self, host: str, port: int, username: str = '', password: str = '', use_tls: bool = True,
+                 use_ssl: bool = False, connections: int = 2, max_messages_per_connection: int = 100,
+                 idle_timeout: float = 60.0, timeout: float = 30.0):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.use_ssl = use_ssl
+        self.connections = max(1, connections)
+        self.max_messages_per_connection = max_messages_per_connection
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.local_hostname = socket.getfqdn()
+        self.unavailable: Optional[str] = None
+
+        # Bound to the running loop on first send (and rebound if it changes)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._waiting = 0
+
+        self.messages_sent = 0
+        self.send_failures = 0
+        self.connections_opened = 0
+        self.reconnects = 0
+        self.retired = 0
+        self.idle_closed = 0
+        self.pipelined = 0
+        self.fallbacks = 0
+        self.connect_seconds = 0.0
+        self._first_send: Optional[float] = None
+        self._last_send: Optional[float] = None
+
+    @classmethod
+    def from_settings(cls, settings: Mapping) -> 'AsyncSMTPSender':
+        """Sender from Flask-Mail style MAIL_* settings (a Flask app config or smtp_settings())"""
+        return cls(
+            settings.get('MAIL_SERVER') or 'smtp.gmail.com',
+            int(settings.get('MAIL_PORT') or 587),
+            username=settings.get('MAIL_USERNAME') or '',
+            password=settings.get('MAIL_PASSWORD') or '',
+            use_tls=bool(settings.get('MAIL_USE_TLS')),
+            use_ssl=bool(settings.get('MAIL_USE_SSL')),
+            connections=config.SMTP_ASYNC_CONNECTIONS,
+            max_messages_per_connection=config.SMTP_MAX_MESSAGES_PER_CONNECTION,
+            idle_timeout=config.SMTP_IDLE_TIMEOUT_SECONDS,
+            timeout=config.SMTP_TIMEOUT_SECONDS,
+        )
+
+    async def send(self, msg: Message, from_addr: Optional[str] = None, to_addrs: Optional[List[str]] = None) -> Dict:
+        """
+        Send one message on a shared connection
+
+        Returns:
+            Refused recipients (empty if all were accepted), like smtplib
+
+        Raises:
+            AsyncSMTPUnavailable: If the async client can't be used (send through the threaded path)
+            smtplib.SMTPException: If the server rejected the message
+            OSError: If no connection to the server could be opened
+        """
+        if self.unavailable:
+            raise AsyncSMTPUnavailable(self.unavailable)
+        if from_addr is None:
+            from_addr = getaddresses([msg['Sender'] or msg['From']])[0][1]
+        if to_addrs is None:
+            to_addrs = [addr for _, addr in getaddresses(msg.get_all('To', []) + msg.get_all('Cc', []) + msg.get_all('Bcc', [])) if addr]
+        if msg['Bcc'] is not None:
+            msg = copy.copy(msg)
+            del msg['Bcc']
+
+        self._bind_loop()
+        job = _Job(from_addr, list(to_addrs), message_payload(msg), self._loop.create_future())
+        self._queue.put_nowait(job)
+        if self._queue.qsize() > self._waiting and len(self._tasks) < self.connections:
+            task = self._loop.create_task(self._run_connection())
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return await job.future
+
+    def _bind_loop(self):
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Connection tasks of a finished loop (e.g. an earlier asyncio.run) are gone
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._tasks = set()
+            self._waiting = 0
+
+    async def _open(self) -> _Connection:
+        started = time.perf_counter()
+        try:
+            tls = ssl.create_default_context() if self.use_ssl else None
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port, ssl=tls), self.timeout)
+        except ssl.SSLError as e:
+            raise AsyncSMTPUnavailable(f"TLS setup failed: {e}")
+        conn = _Connection(reader, writer, self.timeout)
+        try:
+            code, text = await conn.read_reply()
+            if code != 220:
+                raise smtplib.SMTPConnectError(code, text)
+            await conn.ehlo(self.local_hostname)
+            if self.use_tls and not self.use_ssl:
+                if 'starttls' not in conn.extensions:
+                    raise smtplib.SMTPNotSupportedError("STARTTLS extension not supported by server.")
+                if not hasattr(writer, 'start_tls'):
+                    raise AsyncSMTPUnavailable("STARTTLS needs Python 3.11+ (StreamWriter.start_tls)")
+                code, text = await conn.command("STARTTLS")
+                if code != 220:
+                    raise smtplib.SMTPResponseException(code, text)
+                try:
+                    await asyncio.wait_for(writer.start_tls(ssl.create_default_context()), self.timeout)
+                except ssl.SSLError as e:
+                    raise AsyncSMTPUnavailable(f"TLS setup failed: {e}")
+                await conn.ehlo(self.local_hostname)
+            if self.username:
+                await conn.login(self.username, self.password)
+        except BaseException:
+            conn.close()
+            raise
+        self.connections_opened += 1
+        self.connect_seconds += time.perf_counter() - started
+        return conn
+
+    def _next_job(self) -> Optional[_Job]:
+        try:
+            job = self._queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return None
+        if job.future.done():  # caller gave up (cancelled)
+            return self._next_job()
+        return job
+
+    async def _run_connection(self):
+        conn: Optional[_Connection] = None
+        carried: Optional[_Job] = None  # next job, envelope already written behind the previous body
+        try:
+            while True:
+                job, written = carried, carried is not None
+                carried = None
+                if job is None:
+                    self._waiting += 1
+                    try:
+                        job = await asyncio.wait_for(self._queue.get(), self.idle_timeout)
+                    except asyncio.TimeoutError:
+                        if conn is not None:
+                            self.idle_closed += 1
+                        return
+                    finally:
+                        self._waiting -= 1
+                    if job.future.done():
+                        continue
+
+                reused = conn is not None
+                try:
+                    if conn is None:
+                        conn = await self._open()
+                    if not written and conn.pipelining:
+                        conn.write_envelope(job)
+                        await conn.writer.drain()
+                        written = True
+                    refused = await conn.finish_envelope(job, written)
+
+                    # Body, plus the next waiting message's envelope in the same write
+                    conn.writer.write(job.payload + b'.\r\n')
+                    if conn.pipelining and conn.messages + 1 < (self.max_messages_per_connection or float('inf')):
+                        carried = self._next_job()
+                        if carried is not None:
+                            conn.write_envelope(carried)
+                            self.pipelined += 1
+                    await conn.writer.drain()
+                    code, text = await conn.read_reply()
+                    conn.messages += 1
+                    if code != 250:
+                        raise smtplib.SMTPDataError(code, text)
+                    self._delivered(job, refused)
+                except AsyncSMTPUnavailable as e:
+                    self._mark_unavailable(str(e))
+                    self._fail(job, e)
+                    if carried is not None:
+                        self._fail(carried, e)
+                    while (pending := self._next_job()) is not None:
+                        self._fail(pending, e)
+                    return
+                except smtplib.SMTPException as e:
+                    if not isinstance(e, smtplib.SMTPServerDisconnected):
+                        # Rejected transaction: the connection was RSET and stays usable
+                        # (checked first: SMTPException is an OSError)
+                        self._fail(job, e)
+                    else:
+                        conn, carried = self._dropped(conn, carried, job, reused, e)
+                        continue
+                except (*_DISCONNECTED, asyncio.TimeoutError, OSError) as e:
+                    conn, carried = self._dropped(conn, carried, job, reused, e)
+                    continue
+
+                if conn is not None and self.max_messages_per_connection and conn.messages >= self.max_messages_per_connection:
+                    self.retired += 1
+                    await conn.quit()
+                    conn = None
+        finally:
+            if carried is not None and not carried.future.done():
+                self._queue.put_nowait(carried)
+            if conn is not None:
+                await conn.quit()
+
+    def _dropped(self, conn: Optional[_Connection], carried: Optional[_Job], job: _Job, reused: bool, error: Exception):
+        """Close a failed connection; retry the job once if a reused connection was dropped. Returns (None, None)"""
+        if conn is not None:
+            conn.close()
+        if carried is not None:
+            # Its body was never sent: safe to hand to any connection
+            self._queue.put_nowait(carried)
+        job.attempts += 1
+        if reused and job.attempts == 1 and isinstance(error, _DISCONNECTED):
+            logger.info(f"Async SMTP connection to {self.host} was dropped ({error}), reconnecting")
+            self.reconnects += 1
+            self._queue.put_nowait(job)
+        else:
+            self._fail(job, error)
+        return None, None
+
+    def _delivered(self, job: _Job, refused: Dict):
+        now = time.perf_counter()
+        self.messages_sent += 1
+        if self._first_send is None:
+            self._first_send = now
+        self._last_send = now
+        if not job.future.done():
+            job.future.set_result(refused)
+
+    def _fail(self, job: _Job, error: Exception):
+        self.send_failures += 1
+        if not job.future.done():
+            job.future.set_exception(error)
+
+    def _mark_unavailable(self, reason: str):
+        if not self.unavailable:
+            self.unavailable = reason
+            logger.warning(f"Async SMTP client disabled for {self.host}:{self.port} ({reason}); using the threaded SMTP path")
+
+    def close(self):
+        """Stop the connection tasks (each QUITs its connection)"""
+        for task in list(self._tasks):
+            if self._loop is not None and not self._loop.is_closed():
+                self._loop.call_soon_threadsafe(task.cancel)
+
+    def stats(self) -> Dict:
+        """Return connection reuse, pipelining and throughput metrics"""
+        active_seconds = (self._last_send - self._first_send) if self._first_send is not None else 0.0
+        return {
+            'host': f"{self.host}:{self.port}",
+            'connections': self.connections,
+            'open_connections': len(self._tasks),
+            'unavailable': self.unavailable,
+            'messages_sent': self.messages_sent,
+            'send_failures': self.send_failures,
+            'fallbacks': self.fallbacks,
+            'connections_opened': self.connections_opened,
+            'reconnects': self.reconnects,
+            'retired': self.retired,
+            'idle_closed': self.idle_closed,
+            'pipelined': self.pipelined,
+            'messages_per_connection': (self.messages_sent / self.connections_opened) if self.connections_opened else 0.0,
+            'avg_connect_seconds': (self.connect_seconds / self.connections_opened) if self.connections_opened else 0.0,
+            'messages_per_second': (self.messages_sent / active_seconds) if active_seconds > 0 else 0.0,
+        }
@@ -0,0 +1,287 @@
+"""
+SMTP Connection Pool
+Reuses authenticated SMTP connections across emails and threads, so the
+TCP connect, STARTTLS handshake and AUTH happen once per connection instead
+of once per message.
+"""
+
+import logging
+import os
+import smtplib
+import threading
+import time
+from email.message import Message
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from typing import Dict, List, Mapping, Optional
+
+from . import config
+
+logger = logging.getLogger(__name__)
+
+# Errors after which a reused connection is assumed dead (server-side idle
+# timeout, dropped socket) and the message is retried on a fresh one
+_DISCONNECTED = (smtplib.SMTPServerDisconnected, ConnectionError)
+
+
+class SMTPPoolTimeout(smtplib.SMTPException):
+    """No pooled connection became free within the timeout"""
+
+
+class _PooledConnection:
+    __slots__ = ('smtp', 'opened_at', 'last_used', 'messages')
+
+    def __init__(self, smtp: smtplib.SMTP):
+        self.smtp = smtp
+        self.opened_at = time.monotonic()
+        self.last_used = self.opened_at
+        self.messages = 0
+
+
+class SMTPConnectionPool:
+    """
+    Thread-safe pool of logged-in SMTP connections
+
+    At most max_connections sends run at once, each on its own connection.
+    Idle connections are kept LIFO (the most recently used one is the least
+    likely to have been dropped by the server) and closed once they have been
+    idle for idle_timeout seconds or have sent max_messages_per_connection
+    messages. A send that fails with SMTPServerDisconnected on a reused
+    connection is retried once on a fresh connection.
+    """
+
+    def __init__(self, host: str, port: int, username: str = '', password: str = '', use_tls: bool = True,
+                 use_ssl: bool = False, max_connections: int = 4, max_messages_per_connection: int = 100,
+                 idle_timeout: float = 60.0, timeout: float = 30.0):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.use_ssl = use_ssl
+        self.max_connections = max_connections
+        self.max_messages_per_connection = max_messages_per_connection
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._idle: List[_PooledConnection] = []
+        self._lock = threading.Lock()
+
+        self.messages_sent = 0
+        self.send_failures = 0
+        self.connections_opened = 0
+        self.connections_reused = 0
+        self.reconnects = 0
+        self.retired = 0
+        self.idle_closed = 0
+        self.connect_seconds = 0.0
+        self.send_seconds = 0.0
+        self._first_send: Optional[float] = None
+        self._last_send: Optional[float] = None
+
+    @classmethod
+    def from_settings(cls, settings: Mapping) -> 'SMTPConnectionPool':
+        """Pool from Flask-Mail style MAIL_* settings (a Flask app config or smtp_settings())"""
+        return cls(
+            settings.get('MAIL_SERVER') or 'smtp.gmail.com',
+            int(settings.get('MAIL_PORT') or 587),
+            username=settings.get('MAIL_USERNAME') or '',
+            password=settings.get('MAIL_PASSWORD') or '',
+            use_tls=bool(settings.get('MAIL_USE_TLS')),
+            use_ssl=bool(settings.get('MAIL_USE_SSL')),
+            max_connections=config.SMTP_POOL_SIZE,
+            max_messages_per_connection=config.SMTP_MAX_MESSAGES_PER_CONNECTION,
+            idle_timeout=config.SMTP_IDLE_TIMEOUT_SECONDS,
+            timeout=config.SMTP_TIMEOUT_SECONDS,
+        )
+
+    def send(self, msg: Message, from_addr: Optional[str] = None, to_addrs=None):
+        """
+        Send one message on a pooled connection
+
+        Returns:
+            The refused-recipients dict from smtplib (empty if all were accepted)
+
+        Raises:
+            SMTPPoolTimeout: If every connection stayed busy for `timeout` seconds
+            smtplib.SMTPException: If the server rejected the message
+            OSError: If no connection to the server could be opened
+        """
+        if not self._slots.acquire(timeout=self.timeout):
+            raise SMTPPoolTimeout(f"No SMTP connection free after {self.timeout:.0f}s ({self.max_connections} in use)")
+        try:
+            conn = self._checkout()
+            try:
+                refused = self._send_on(conn, msg, from_addr, to_addrs)
+            except _DISCONNECTED as e:
+                self._discard(conn)
+                if conn.messages == 0:
+                    # A brand-new connection failing is a server problem, not a stale socket
+                    self._count_failure()
+                    raise
+                logger.info(f"SMTP connection to {self.host} was dropped ({e}), reconnecting")
+                with self._lock:
+                    self.reconnects += 1
+                conn = self._open()
+                try:
+                    refused = self._send_on(conn, msg, from_addr, to_addrs)
+                except Exception:
+                    self._discard(conn)
+                    self._count_failure()
+                    raise
+            except Exception:
+                self._count_failure()
+                self._release_after_error(conn)
+                raise
+            self._release(conn)
+            return refused
+        finally:
+            self._slots.release()
+
+    def _send_on(self, conn: _PooledConnection, msg: Message, from_addr, to_addrs):
+        started = time.perf_counter()
+        refused = conn.smtp.send_message(msg, from_addr=from_addr, to_addrs=to_addrs)
+        finished = time.perf_counter()
+        conn.messages += 1
+        conn.last_used = time.monotonic()
+        with self._lock:
+            self.messages_sent += 1
+            self.send_seconds += finished - started
+            if self._first_send is None:
+                self._first_send = started
+            self._last_send = finished
+        return refused
+
+    def _checkout(self) -> _PooledConnection:
+        """Most recently used live idle connection, or a new one"""
+        now = time.monotonic()
+        stale = []
+        conn = None
+        with self._lock:
+            while self._idle:
+                candidate = self._idle.pop()
+                if now - candidate.last_used > self.idle_timeout:
+                    stale.append(candidate)
+                    continue
+                conn = candidate
+                break
+            # Everything below the first stale connection is older still
+            if stale:
+                stale.extend(self._idle)
+                self._idle.clear()
+            self.idle_closed += len(stale)
+            if conn is not None:
+                self.connections_reused += 1
+        for old in stale:
+            self._quit(old)
+        return conn if conn is not None else self._open()
+
+    def _open(self) -> _PooledConnection:
+        started = time.perf_counter()
+        if self.use_ssl:
+            smtp = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+        else:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.use_tls and not self.use_ssl:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password)
+        except Exception:
+            smtp.close()
+            raise
+        with self._lock:
+            self.connections_opened += 1
+            self.connect_seconds += time.perf_counter() - started
+        return _PooledConnection(smtp)
+
+    def _release(self, conn: _PooledConnection):
+        if self.max_messages_per_connection and conn.messages >= self.max_messages_per_connection:
+            with self._lock:
+                self.retired += 1
+            self._quit(conn)
+            return
+        with self._lock:
+            self._idle.append(conn)
+
+    def _release_after_error(self, conn: _PooledConnection):
+        """Keep a connection the server rejected a message on, if it still answers RSET"""
+        try:
+            conn.smtp.rset()
+        except Exception:
+            self._discard(conn)
+            return
+        self._release(conn)
+
+    def _count_failure(self):
+        with self._lock:
+            self.send_failures += 1
+
+    @staticmethod
+    def _discard(conn: _PooledConnection):
+        try:
+            conn.smtp.close()
+        except Exception:
+            pass
+
+    @staticmethod
+    def _quit(conn: _PooledConnection):
+        try:
+            conn.smtp.quit()
+        except Exception:
+            SMTPConnectionPool._discard(conn)
+
+    def close(self):
+        """QUIT every idle connection (later sends open new ones)"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            self._quit(conn)
+
+    def stats(self) -> Dict:
+        """Return connection reuse and throughput metrics"""
+        with self._lock:
+            active_seconds = (self._last_send - self._first_send) if self._first_send is not None else 0.0
+            return {
+                'host': f"{self.host}:{self.port}",
+                'max_connections': self.max_connections,
+                'idle_connections': len(self._idle),
+                'messages_sent': self.messages_sent,
+                'send_failures': self.send_failures,
+                'connections_opened': self.connections_opened,
+                'connections_reused': self.connections_reused,
+                'reconnects': self.reconnects,
+                'retired': self.retired,
+                'idle_closed': self.idle_closed,
+                'messages_per_connection': (self.messages_sent / self.connections_opened) if self.connections_opened else 0.0,
+                'avg_connect_seconds': (self.connect_seconds / self.connections_opened) if self.connections_opened else 0.0,
+                'avg_send_seconds': (self.send_seconds / self.messages_sent) if self.messages_sent else 0.0,
+                'messages_per_second': (self.messages_sent / active_seconds) if active_seconds > 0 else 0.0,
+            }
+
+
+def smtp_settings(flask_app=None) -> Dict:
+    """MAIL_* settings from the Flask app config, or from the environment like app.py reads them"""
+    if flask_app is not None:
+        return dict(flask_app.config)
+    return {
+        'MAIL_SERVER': os.getenv('MAIL_SERVER', 'smtp.gmail.com'),
+        'MAIL_PORT': int(os.getenv('MAIL_PORT', '587')),
+        'MAIL_USE_TLS': os.getenv('MAIL_USE_TLS', 'True').lower() == 'true',
+        'MAIL_USE_SSL': os.getenv('MAIL_USE_SSL', 'False').lower() == 'true',
+        'MAIL_USERNAME': os.getenv('MAIL_USERNAME', ''),
+        'MAIL_PASSWORD': os.getenv('MAIL_PASSWORD', ''),
+    }
+
+
+def mime_message(to_email: str, subject: str, html_content: str, text_content: str) -> MIMEMultipart:
+    """multipart/alternative message with the plain-text and HTML bodies"""
+    msg = MIMEMultipart('alternative')
+    msg['Subject'] = subject
+    msg['From'] = f"{config.SENDER_NAME} <{config.SENDER_EMAIL}>"
+    msg['To'] = to_email
+
+    msg.attach(MIMEText(text_content, 'plain'))
+    msg.attach(MIMEText(html_content, 'html'))
+    return msg
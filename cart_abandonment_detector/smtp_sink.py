@@ -0,0 +1,346 @@
+"""
+SMTP Sink
+Local asyncio SMTP server that accepts and counts every message, for offline
+benchmarks of the detector's SMTP paths. Supports EHLO/HELO, PIPELINING,
+AUTH PLAIN/LOGIN (any credentials), MAIL/RCPT/DATA, RSET, NOOP and QUIT; no
+STARTTLS, so point the detector at it with MAIL_USE_TLS=False.
+
+Replies are held back by --rtt-ms per read from the client, which emulates a
+mail server that many milliseconds away: commands sent in one write
+(pipelined) cost one round trip, commands sent one by one cost one each.
+Accepting a message additionally takes a per-message latency (--latency-ms,
+distributions as in mock_llm_server.py), and a fraction of messages can be
+answered with 451 or 554 or have the connection dropped instead.
+
+Usage:
+    python -m cart_abandonment_detector.smtp_sink --port 2525
+    python -m cart_abandonment_detector.smtp_sink --port 2525 --rtt-ms 40
+    python -m cart_abandonment_detector.smtp_sink --latency-ms 150 --latency-jitter-ms 100 --temp-failure-rate 0.02 --disconnect-rate 0.01
+
+    MAIL_SERVER=127.0.0.1 MAIL_PORT=2525 MAIL_USE_TLS=False python cart_abandonment_detector/run_detector.py
+"""
+
+import argparse
+import asyncio
+import base64
+import logging
+import random
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from .mock_llm_server import LATENCY_DISTRIBUTIONS, LatencyModel
+
+logger = logging.getLogger(__name__)
+
+_EHLO_EXTENSIONS = (b'PIPELINING', b'8BITMIME', b'AUTH PLAIN LOGIN', b'SIZE 52428800')
+
+
+class SMTPSink:
+    """
+    SMTP server on its own event loop thread; messages are counted, not stored
+
+    Each message's final reply is delayed by a latency sample on top of the
+    round trip. At the end of DATA the message is dropped with the connection
+    (disconnect_rate), rejected with 554 (perm_failure_rate) or 451
+    (temp_failure_rate), or accepted.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 2525, rtt_ms: float = 0, latency: Optional[LatencyModel] = None,
+                 temp_failure_rate: float = 0.0, perm_failure_rate: float = 0.0, disconnect_rate: float = 0.0,
+                 seed: Optional[int] = None):
+        self.host = host
+        self.port = port
+        self.rtt = max(0.0, rtt_ms) / 1000.0
+        self.latency = latency or LatencyModel('fixed', 0)
+        self.temp_failure_rate = temp_failure_rate
+        self.perm_failure_rate = perm_failure_rate
+        self.disconnect_rate = disconnect_rate
+        self._rng = random.Random(seed)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+        self.connections = 0
+        self.open_connections = 0
+        self.commands = 0
+        self.messages = 0
+        self.recipients = 0
+        self.bytes_received = 0
+        self.temp_failures = 0
+        self.perm_failures = 0
+        self.disconnects = 0
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self.host, self.port
+
+    def start(self) -> Tuple[str, int]:
+        """Serve in a background thread; returns (host, port) (port 0 picks a free one)"""
+        self._loop = asyncio.new_event_loop()
+        ready = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(self._loop)
+            self._server = self._loop.run_until_complete(
+                self._loop.create_server(lambda: _SMTPSession(self), self.host, self.port)
+            )
+            self.port = self._server.sockets[0].getsockname()[1]
+            ready.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name='smtp-sink', daemon=True)
+        self._thread.start()
+        ready.wait()
+        logger.info(f"SMTP sink listening on {self.host}:{self.port}")
+        return self.address
+
+    def stop(self):
+        if self._loop is None:
+            return
+
+        async def shutdown():
+            self._server.close()
+            await self._server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop).result(timeout=5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self._loop.close()
+        self._loop = None
+
+    def outcome(self) -> str:
+        """Injected fate of one message: 'disconnect', 'reject', 'defer' or 'accept'"""
+        draw = self._rng.random()
+        if draw < self.disconnect_rate:
+            return 'disconnect'
+        draw -= self.disconnect_rate
+        if draw < self.perm_failure_rate:
+            return 'reject'
+        draw -= self.perm_failure_rate
+        if draw < self.temp_failure_rate:
+            return 'defer'
+        return 'accept'
+
+    def _count(self, **amounts):
+        with self._lock:
+            for name, amount in amounts.items():
+                setattr(self, name, getattr(self, name) + amount)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'address': f"{self.host}:{self.port}",
+                'rtt_ms': self.rtt * 1000,
+                'latency': {'distribution': self.latency.distribution, 'mean_ms': self.latency.mean_ms, 'jitter_ms': self.latency.jitter_ms},
+                'connections': self.connections,
+                'open_connections': self.open_connections,
+                'commands': self.commands,
+                'messages': self.messages,
+                'recipients': self.recipients,
+                'bytes_received': self.bytes_received,
+                'temp_failures': self.temp_failures,
+                'perm_failures': self.perm_failures,
+                'disconnects': self.disconnects,
+            }
+
+
+class _SMTPSession(asyncio.Protocol):
+    """One client connection: line-based command/DATA state machine"""
+
+    def __init__(self, sink: SMTPSink):
+        self.sink = sink
+        self.transport: Optional[asyncio.Transport] = None
+        self._buffer = b''
+        self._in_data = False
+        self._data_bytes = 0
+        self._recipients = 0
+        self._auth: Optional[str] = None  # mechanism awaiting a continuation line
+        self._closing = False
+        self._delay = 0.0  # per-message latency owed by the replies being collected
+        # Replies held back by the emulated round trip, in send order: (due, payload, close)
+        self._held: Deque[Tuple[float, bytes, bool]] = deque()
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.sink._count(connections=1, open_connections=1)
+        self._reply([b'220 smtp-sink ESMTP ready'])
+
+    def connection_lost(self, exc):
+        self.sink._count(open_connections=-1)
+
+    def data_received(self, data: bytes):
+        self._buffer += data
+        replies: List[bytes] = []
+        while not self._closing:
+            end = self._buffer.find(b'\n')
+            if end < 0:
+                break
+            line, self._buffer = self._buffer[:end + 1], self._buffer[end + 1:]
+            replies.extend(self._handle_line(line))
+        if replies or self._closing:
+            self._reply(replies)
+
+    def _reply(self, lines: List[bytes]):
+        payload = b''.join(line + b'\r\n' for line in lines)
+        delay, self._delay = self.sink.rtt + self._delay, 0.0
+        if delay <= 0 and not self._held:
+            self._write(payload, self._closing)
+            return
+        loop = asyncio.get_running_loop()
+        # Never overtake an earlier reply
+        due = max(loop.time() + delay, self._held[-1][0] if self._held else 0.0)
+        self._held.append((due, payload, self._closing))
+        if len(self._held) == 1:
+            loop.call_at(due, self._release)
+
+    def _release(self):
+        loop = asyncio.get_running_loop()
+        while self._held and self._held[0][0] <= loop.time():
+            _, payload, close = self._held.popleft()
+            self._write(payload, close)
+        if self._held:
+            loop.call_at(self._held[0][0], self._release)
+
+    def _write(self, payload: bytes, close: bool):
+        if self.transport.is_closing():
+            return
+        if payload:
+            self.transport.write(payload)
+        if close:
+            self.transport.close()
+
+    def _handle_line(self, line: bytes) -> List[bytes]:
+        if self._in_data:
+            if line.rstrip(b'\r\n') == b'.':
+                self._in_data = False
+                recipients, self._recipients = self._recipients, 0
+                self._delay += self.sink.latency.sample()
+                outcome = self.sink.outcome()
+                if outcome == 'disconnect':
+                    self.sink._count(disconnects=1)
+                    self._closing = True
+                    return []
+                if outcome == 'reject':
+                    self.sink._count(perm_failures=1)
+                    return [b'554 5.7.1 Message rejected (injected failure)']
+                if outcome == 'defer':
+                    self.sink._count(temp_failures=1)
+                    return [b'451 4.3.0 Try again later (injected failure)']
+                self.sink._count(messages=1, recipients=recipients, bytes_received=self._data_bytes)
+                return [b'250 2.0.0 Ok: queued']
+            self._data_bytes += len(line)
+            return []
+
+        self.sink._count(commands=1)
+        text = line.rstrip(b'\r\n')
+        if self._auth:
+            return self._continue_auth(text)
+        verb, _, arg = text.partition(b' ')
+        verb = verb.upper()
+        if verb == b'EHLO':
+            return [b'250-smtp-sink'] + [b'250-' + ext for ext in _EHLO_EXTENSIONS[:-1]] + [b'250 ' + _EHLO_EXTENSIONS[-1]]
+        if verb == b'HELO':
+            return [b'250 smtp-sink']
+        if verb == b'AUTH':
+            mechanism, _, initial = arg.partition(b' ')
+            mechanism = mechanism.upper()
+            if mechanism == b'PLAIN':
+                if initial:
+                    return [b'235 2.7.0 Authentication successful']
+                self._auth = 'plain'
+                return [b'334 ']
+            if mechanism == b'LOGIN':
+                # smtplib sends the username as an initial response
+                if initial:
+                    self._auth = 'login-password'
+                    return [b'334 ' + base64.b64encode(b'Password:')]
+                self._auth = 'login-user'
+                return [b'334 ' + base64.b64encode(b'Username:')]
+            return [b'504 5.5.4 Unrecognized authentication type']
+        if verb == b'MAIL':
+            self._recipients = 0
+            return [b'250 2.1.0 Ok']
+        if verb == b'RCPT':
+            self._recipients += 1
+            return [b'250 2.1.5 Ok']
+        if verb == b'DATA':
+            if not self._recipients:
+                return [b'503 5.5.1 Error: need RCPT command']
+            self._in_data = True
+            self._data_bytes = 0
+            return [b'354 End data with <CR><LF>.<CR><LF>']
+        if verb == b'RSET':
+            self._recipients = 0
+            return [b'250 2.0.0 Ok']
+        if verb == b'NOOP':
+            return [b'250 2.0.0 Ok']
+        if verb == b'QUIT':
+            self._closing = True
+            return [b'221 2.0.0 Bye']
+        if verb == b'STARTTLS':
+            return [b'454 4.7.0 TLS not available']
+        return [b'502 5.5.2 Error: command not recognized']
+
+    def _continue_auth(self, text: bytes) -> List[bytes]:
+        if self._auth == 'login-user':
+            self._auth = 'login-password'
+            return [b'334 ' + base64.b64encode(b'Password:')]
+        self._auth = None
+        return [b'235 2.7.0 Authentication successful']
+
+
+def add_sink_arguments(parser: argparse.ArgumentParser):
+    """SMTP sink options (shared with benchmark_email_throughput.py)"""
+    parser.add_argument('--rtt-ms', type=float, default=0, help="Emulated network round-trip time per client write")
+    parser.add_argument('--latency-dist', choices=LATENCY_DISTRIBUTIONS, default='fixed', help="Per-message latency distribution")
+    parser.add_argument('--latency-ms', type=float, default=0, help="Mean time to accept a message (after the round trip)")
+    parser.add_argument('--latency-jitter-ms', type=float, default=0,
+                        help="Half-width (uniform) or standard deviation (normal, lognormal)")
+    parser.add_argument('--temp-failure-rate', type=float, default=0.0, help="Fraction of messages answered with 451")
+    parser.add_argument('--perm-failure-rate', type=float, default=0.0, help="Fraction of messages answered with 554")
+    parser.add_argument('--disconnect-rate', type=float, default=0.0, help="Fraction of messages answered by closing the connection")
+    parser.add_argument('--seed', type=int, default=42)
+
+
+def sink_from_args(args, host: str = '127.0.0.1', port: int = 0) -> SMTPSink:
+    """Build an SMTPSink from add_sink_arguments options"""
+    return SMTPSink(
+        host=host,
+        port=port,
+        rtt_ms=args.rtt_ms,
+        latency=LatencyModel(args.latency_dist, args.latency_ms, args.latency_jitter_ms, seed=args.seed),
+        temp_failure_rate=args.temp_failure_rate,
+        perm_failure_rate=args.perm_failure_rate,
+        disconnect_rate=args.disconnect_rate,
+        seed=args.seed,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local SMTP sink for email delivery benchmarks")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=2525)
+    add_sink_arguments(parser)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    sink = sink_from_args(args, args.host, args.port)
+    sink.start()
+    print(f"SMTP sink on {args.host}:{sink.port} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(10)
+            stats = sink.stats()
+            print(f"{stats['messages']} messages over {stats['connections']} connections ({stats['open_connections']} open), "
+                  f"{stats['temp_failures']} deferred, {stats['perm_failures']} rejected, {stats['disconnects']} dropped")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sink.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+Streaming TF-IDF
+Hashing-trick TF-IDF that is fitted chunk by chunk, for catalogs too large to
+hold as one text list plus a vocabulary dict.
+"""
+
+import logging
+from typing import Iterable, List
+
+import numpy as np
+from scipy import sparse
+
+logger = logging.getLogger(__name__)
+
+
+class StreamingHashingVectorizer:
+    """
+    HashingVectorizer + TF-IDF weighting, fitted incrementally.
+
+    Mirrors the TfidfVectorizer settings the engine uses (smooth idf,
+    sublinear_tf off, l2 norm, max_df) but has no vocabulary: tokens are
+    hashed into n_features columns. Each chunk of texts is hashed to raw
+    counts as it arrives and only document frequencies are accumulated, so
+    peak memory is the count matrix plus one chunk of text. IDF weighting
+    and normalization are then applied to the stored counts in place.
+    """
+
+    def __init__(self, n_features: int = 2 ** 20, stop_words='english', ngram_range=(1, 2), max_df: float = 1.0):
+        from sklearn.feature_extraction.text import HashingVectorizer
+
+        self.n_features = n_features
+        self.max_df = max_df
+        self._hasher = HashingVectorizer(
+            n_features=n_features,
+            stop_words=stop_words,
+            ngram_range=ngram_range,
+            alternate_sign=False,
+            norm=None,
+            dtype=np.float64
+        )
+        self.idf_ = None
+        self.n_documents = 0
+
+    def fit_transform_chunks(self, chunks: Iterable[List[str]]) -> sparse.csr_matrix:
+        """
+        Fit IDF weights on a stream of text chunks and return the TF-IDF matrix
+
+        Args:
+            chunks: Iterable of lists of (preprocessed) texts, in row order
+
+        Returns:
+            CSR matrix with one l2-normalized row per text
+        """
+        count_chunks = []
+        document_frequency = np.zeros(self.n_features, dtype=np.int64)
+        for texts in chunks:
+            if not texts:
+                continue
+            counts = self._hasher.transform(texts).tocsr()
+            counts.sum_duplicates()
+            document_frequency += np.bincount(counts.indices, minlength=self.n_features)
+            count_chunks.append(counts)
+            self.n_documents += len(texts)
+
+        # Smooth idf, as TfidfVectorizer: ln((1 + n) / (1 + df)) + 1
+        n = self.n_documents
+        idf = np.log((1.0 + n) / (1.0 + document_frequency)) + 1.0
+        # max_df: terms in more than this share of documents are dropped (weight 0)
+        idf[document_frequency > self.max_df * n] = 0.0
+        self.idf_ = idf
+
+        matrix = _concatenate_rows(count_chunks, self.n_features)
+        self._weight(matrix)
+        logger.info(f"Hashed {n} documents into {self.n_features} features ({matrix.nnz} non-zeros, no vocabulary)")
+        return matrix
+
+    def transform(self, texts: List[str]) -> sparse.csr_matrix:
+        """Vectorize texts (e.g. cart items) with the fitted IDF weights"""
+        if self.idf_ is None:
+            raise ValueError("StreamingHashingVectorizer is not fitted")
+        matrix = self._hasher.transform(texts).tocsr()
+        matrix.sum_duplicates()
+        self._weight(matrix)
+        return matrix
+
+    def _weight(self, matrix: sparse.csr_matrix):
+        """Apply idf weights and l2-normalize rows, in place"""
+        from sklearn.preprocessing import normalize
+
+        matrix.data *= self.idf_[matrix.indices]
+        matrix.eliminate_zeros()
+        if matrix.shape[0]:  # sklearn rejects 0-row input (empty catalog)
+            normalize(matrix, norm='l2', copy=False)
+
+
+def _concatenate_rows(chunks: List[sparse.csr_matrix], n_features: int) -> sparse.csr_matrix:
+    """
+    Stack CSR chunks into one matrix, releasing each chunk once copied.
+
+    Unlike sparse.vstack this never holds a full second copy of the data,
+    so peak memory is the final matrix plus the largest chunk.
+    """
+    nnz = sum(chunk.nnz for chunk in chunks)
+    n_rows = sum(chunk.shape[0] for chunk in chunks)
+    index_dtype = np.int32 if max(nnz, n_features) < 2 ** 31 else np.int64
+    data = np.empty(nnz, dtype=np.float64)
+    indices = np.empty(nnz, dtype=index_dtype)
+    indptr = np.empty(n_rows + 1, dtype=index_dtype)
+    indptr[0] = 0
+
+    row, offset = 0, 0
+    while chunks:
+        chunk = chunks.pop(0)
+        rows, size = chunk.shape[0], chunk.nnz
+        data[offset:offset + size] = chunk.data
+        indices[offset:offset + size] = chunk.indices
+        indptr[row + 1:row + rows + 1] = chunk.indptr[1:] + offset
+        row += rows
+        offset += size
+    return sparse.csr_matrix((data, indices, indptr), shape=(n_rows, n_features))
@@ -0,0 +1,247 @@
+"""
+Text Pipeline
+Batch tokenizer and shared token -> stem cache used to prepare product and
+cart text for TF-IDF.
+"""
+
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+from typing import Dict, Iterable, List, Optional
+
+import nltk
+from nltk.stem import PorterStemmer
+
+from . import config
+from .sanitizer import sanitize_many, sanitize_text
+
+logger = logging.getLogger(__name__)
+
+# Same tokens as lowercasing, replacing [^a-zA-Z0-9\s] with spaces and splitting
+_TOKEN = re.compile(r'[a-zA-Z0-9]+')
+
+_TABLE_FORMAT = 1
+
+# Bump whenever sanitizer/tokenizer/stemmer output changes, so stored
+# products.search_text written by an older pipeline is recomputed
+SEARCH_TEXT_VERSION = 1
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase and split text into alphanumeric tokens"""
+    return _TOKEN.findall(text.lower())
+
+
+def tokenize_many(texts: Iterable[str]) -> List[List[str]]:
+    """Tokenize a batch of texts"""
+    findall = _TOKEN.findall
+    return [findall(text.lower()) for text in texts]
+
+
+class StemCache:
+    """
+    Bounded token -> stem dictionary in front of a PorterStemmer.
+
+    Catalog text repeats heavily (names 3x, categories 4x, shared vocabulary
+    across products), so after the first build almost every token is a dict
+    hit. When full, the oldest entries are dropped first. The table can be
+    saved to and loaded from a JSON file so that a restarted process only
+    stems tokens it has never seen.
+    """
+
+    def __init__(self, max_entries: int = 500_000, stemmer: PorterStemmer = None):
+        self.max_entries = max_entries
+        self.stemmer = stemmer or PorterStemmer()
+        self._stems: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._dirty = False
+
+    def __len__(self) -> int:
+        return len(self._stems)
+
+    def stem(self, token: str) -> str:
+        """Return the stem of one (lowercase) token"""
+        stem = self._stems.get(token)
+        if stem is None:
+            self.misses += 1
+            stem = self.stemmer.stem(token)
+            self._store({token: stem})
+        else:
+            self.hits += 1
+        return stem
+
+    def stem_tokens(self, token_lists: List[List[str]]) -> List[str]:
+        """
+        Stem a batch of token lists and join each back into text
+
+        Unique unseen tokens across the whole batch are stemmed once, then
+        every document is rebuilt with plain dict lookups.
+
+        Args:
+            token_lists: Output of tokenize_many
+
+        Returns:
+            Space-joined stemmed text per document
+        """
+        unique = set()
+        for tokens in token_lists:
+            unique.update(tokens)
+
+        # Resolve every unique token up front, so concurrent evictions can't drop one mid-batch
+        stems = self._stems
+        resolved = {token: stems.get(token) for token in unique}
+        missing = [token for token, stem in resolved.items() if stem is None]
+        if missing:
+            stemmer = self.stemmer
+            new = {token: stemmer.stem(token) for token in missing}
+            resolved.update(new)
+            self._store(new)
+        self.misses += len(missing)
+        self.hits += len(unique) - len(missing)
+
+        return [' '.join([resolved[token] for token in tokens]) for tokens in token_lists]
+
+    def _store(self, new: Dict[str, str]):
+        with self._lock:
+            self._stems.update(new)
+            overflow = len(self._stems) - self.max_entries
+            if overflow > 0:
+                # Dicts keep insertion order, so the first keys are the oldest
+                for token in list(self._stems)[:overflow]:
+                    del self._stems[token]
+                self.evictions += overflow
+            self._dirty = True
+
+    def _signature(self) -> Dict:
+        return {
+            'format': _TABLE_FORMAT,
+            'nltk': nltk.__version__,
+            'stemmer': type(self.stemmer).__name__,
+            'mode': getattr(self.stemmer, 'mode', None),
+        }
+
+    def load(self, path: str) -> int:
+        """
+        Load a persisted stem table (ignored if it came from a different stemmer)
+
+        Returns:
+            Number of entries loaded
+        """
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return 0
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read stem table {path}: {e}")
+            return 0
+
+        if data.get('signature') != self._signature():
+            logger.info(f"Stem table {path} was built by a different stemmer, ignoring it")
+            return 0
+
+        stems = data.get('stems') or {}
+        self._store(stems)
+        self._dirty = False
+        logger.info(f"Loaded {len(stems)} stems from {path}")
+        return len(stems)
+
+    def save(self, path: str) -> bool:
+        """
+        Persist the stem table if it changed since the last load/save
+
+        Returns:
+            True if the file was written
+        """
+        if not self._dirty:
+            return False
+        with self._lock:
+            data = {'signature': self._signature(), 'stems': dict(self._stems)}
+            self._dirty = False
+
+        directory = os.path.dirname(os.path.abspath(path))
+        try:
+            os.makedirs(directory, exist_ok=True)
+            # Write to a temp file and rename, so readers never see a partial table
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write stem table {path}: {e}")
+            self._dirty = True
+            return False
+        logger.info(f"Saved {len(data['stems'])} stems to {path}")
+        return True
+
+    def stats(self) -> Dict:
+        """Return hit/miss counters"""
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._stems),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'evictions': self.evictions,
+        }
+
+
+def stem_many(texts: Iterable[str], cache: StemCache) -> List[str]:
+    """Tokenize and stem a batch of texts through a shared StemCache"""
+    return cache.stem_tokens(tokenize_many(texts))
+
+
+def shared_stem_cache() -> StemCache:
+    """Process-wide StemCache (loaded from STEM_TABLE_PATH on first use)"""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = StemCache(max_entries=config.STEM_CACHE_SIZE)
+            if config.STEM_TABLE_PATH:
+                _shared_cache.load(config.STEM_TABLE_PATH)
+        return _shared_cache
+
+
+def build_product_text(name: str, category: str, description: str) -> str:
+    """
+    Raw text indexed for a product or cart item
+
+    Category is repeated 4x and name 3x to SIGNIFICANTLY boost their TF-IDF
+    importance, which reduces false positives from word coincidences.
+    """
+    return f"{name} {name} {name} {category} {category} {category} {category} {description}"
+
+
+def preprocess_product(name: Optional[str], category: Optional[str], description: Optional[str]) -> str:
+    """
+    Sanitized + stemmed search text for one product (products.search_text)
+
+    Args:
+        name: Product name
+        category: Product category (None/empty indexes as 'general')
+        description: Product description
+
+    Returns:
+        Text ready for the TF-IDF vectorizer
+    """
+    text = build_product_text(name or '', category or 'general', description or '')
+    return shared_stem_cache().stem_tokens([tokenize(sanitize_text(text, content_type="product"))])[0]
+
+
+def preprocess_products(rows: Iterable[Dict]) -> List[str]:
+    """Batch version of preprocess_product for product rows (name, category, description)"""
+    texts = [
+        build_product_text(row.get('name') or '', row.get('category') or 'general', row.get('description') or '')
+        for row in rows
+    ]
+    return stem_many(sanitize_many(texts, content_type="product"), shared_stem_cache())
@@ -0,0 +1,134 @@
+"""
+Database migration: Add search_text column to products table
+Stores each product's sanitized + stemmed text so recommendation index
+builds don't re-run the text pipeline over the whole catalog.
+
+Usage:
+    python migrations/add_search_text_to_products.py
+    python migrations/add_search_text_to_products.py --chunk-size 1000
+    python migrations/add_search_text_to_products.py --backfill-only --all
+"""
+import argparse
+import os
+import sys
+import time
+
+import mysql.connector
+from mysql.connector import Error
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cart_abandonment_detector import config
+from cart_abandonment_detector.text_pipeline import SEARCH_TEXT_VERSION, preprocess_products, shared_stem_cache
+
+
+def add_columns(cursor, connection):
+    """Add search_text and search_text_version to products"""
+    for name, definition in [
+        ('search_text', "MEDIUMTEXT NULL COMMENT 'Sanitized + stemmed text for the recommendation index'"),
+        ('search_text_version', "SMALLINT NULL COMMENT 'Text pipeline version that produced search_text'"),
+    ]:
+        try:
+            cursor.execute(f"ALTER TABLE products ADD COLUMN {name} {definition}")
+            connection.commit()
+            print(f"✓ Successfully added {name} column to products table")
+        except Error as e:
+            if "Duplicate column name" in str(e):
+                print(f"✓ {name} column already exists")
+            else:
+                raise e
+
+
+def backfill(cursor, connection, chunk_size: int, recompute_all: bool = False) -> int:
+    """
+    Fill search_text in chunks of chunk_size products (keyset pagination on id)
+
+    Args:
+        chunk_size: Products per SELECT/UPDATE/COMMIT round
+        recompute_all: Also rewrite rows that are already current
+
+    Returns:
+        Number of products updated
+    """
+    condition = "" if recompute_all else "AND (search_text IS NULL OR search_text_version IS NULL OR search_text_version <> %s)"
+    last_id = 0
+    updated = 0
+    start = time.perf_counter()
+    while True:
+        params = (last_id,) if recompute_all else (last_id, SEARCH_TEXT_VERSION)
+        cursor.execute(f"""
+            SELECT id, name, category, description
+            FROM products
+            WHERE id > %s {condition}
+            ORDER BY id
+            LIMIT {int(chunk_size)}
+        """, params)
+        columns = [column[0] for column in cursor.description]
+        rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        if not rows:
+            break
+
+        texts = preprocess_products(rows)
+        cursor.executemany(
+            "UPDATE products SET search_text = %s, search_text_version = %s WHERE id = %s",
+            [(text, SEARCH_TEXT_VERSION, row['id']) for text, row in zip(texts, rows)]
+        )
+        connection.commit()
+
+        updated += len(rows)
+        last_id = rows[-1]['id']
+        print(f"  ... {updated} products backfilled (last id {last_id}, {time.perf_counter() - start:.1f}s)")
+    return updated
+
+
+def run_migration(chunk_size: int = 500, backfill_only: bool = False, recompute_all: bool = False):
+    """Add search_text columns to products and backfill them"""
+    try:
+        # Connect to database
+        connection = mysql.connector.connect(
+            host=config.MYSQL_HOST,
+            user=config.MYSQL_USER,
+            password=config.MYSQL_PASSWORD,
+            database=config.MYSQL_DB
+        )
+
+        if connection.is_connected():
+            cursor = connection.cursor()
+
+            print("Connected to MySQL database")
+            print("\n" + "="*60)
+            print("MIGRATION: Add search_text to products table")
+            print("="*60 + "\n")
+
+            if not backfill_only:
+                add_columns(cursor, connection)
+
+            print(f"\nBackfilling search_text (pipeline version {SEARCH_TEXT_VERSION}, chunk size {chunk_size})...")
+            updated = backfill(cursor, connection, chunk_size, recompute_all)
+            print(f"✓ Backfilled {updated} products")
+
+            if config.STEM_TABLE_PATH:
+                shared_stem_cache().save(config.STEM_TABLE_PATH)
+
+            cursor.close()
+            connection.close()
+
+            print("\n" + "="*60)
+            print("✅ MIGRATION COMPLETED SUCCESSFULLY!")
+            print("="*60)
+            print("\nProduct add/edit now keeps search_text current; index builds reuse it.\n")
+
+    except Error as e:
+        print(f"❌ Error: {e}")
+        return False
+
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Add and backfill products.search_text")
+    parser.add_argument('--chunk-size', type=int, default=500, help="Products per backfill chunk")
+    parser.add_argument('--backfill-only', action='store_true', help="Skip ALTER TABLE (columns already exist)")
+    parser.add_argument('--all', action='store_true', help="Recompute search_text for every product")
+    args = parser.parse_args()
+    run_migration(args.chunk_size, args.backfill_only, args.all)
@@ -0,0 +1,66 @@
+"""
+Database migration: Create email_copy_library table
+Pre-generated email copy variants per (category, discount tier, tone), filled by
+python -m cart_abandonment_detector.pregenerate_copy
+"""
+import mysql.connector
+from mysql.connector import Error
+
+def run_migration():
+    """Create the email_copy_library table"""
+    try:
+        # Connect to database
+        connection = mysql.connector.connect(
+            host='localhost',
+            user='root',
+            password='',
+            database='ecommerce'
+        )
+
+        if connection.is_connected():
+            cursor = connection.cursor()
+
+            print("Connected to MySQL database")
+            print("\n" + "="*60)
+            print("MIGRATION: Create email_copy_library table")
+            print("="*60 + "\n")
+
+            cursor.execute("""
+            CREATE TABLE IF NOT EXISTS email_copy_library (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                category VARCHAR(100) NOT NULL COMMENT 'Normalized product category, or general',
+                discount_percent TINYINT UNSIGNED NOT NULL COMMENT 'Discount tier the copy mentions',
+                tone VARCHAR(100) NOT NULL,
+                approach VARCHAR(255) NOT NULL,
+                style VARCHAR(255) NOT NULL,
+                copy_text TEXT NOT NULL COMMENT 'Sanitized copy with CUSTOMER_NAME / CART_ITEM / RECOMMENDED_ITEM slots',
+                model VARCHAR(100) NOT NULL,
+                prompt_version SMALLINT NOT NULL,
+                times_used INT NOT NULL DEFAULT 0,
+                created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                INDEX idx_category_discount (category, discount_percent)
+            )
+            """)
+            connection.commit()
+            print("✓ email_copy_library table is ready")
+
+            # Verify the table
+            cursor.execute("DESCRIBE email_copy_library")
+            columns = cursor.fetchall()
+
+            print("\nTable structure:")
+            for column in columns:
+                print(f"  - {column[0]} ({column[1]})")
+
+            cursor.close()
+            connection.close()
+            print("\nMigration completed successfully!")
+
+    except Error as e:
+        print(f"Error: {e}")
+        return False
+
+    return True
+
+if __name__ == "__main__":
+    run_migration()
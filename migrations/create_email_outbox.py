@@ -0,0 +1,70 @@
+"""
+Database migration: Create email_outbox table
+Durable queue of rendered cart abandonment emails, delivered by outbox_worker.py
+(EMAIL_DELIVERY_MODE = 'outbox'). Claims use FOR UPDATE SKIP LOCKED: MySQL 8.0+ / MariaDB 10.6+
+"""
+import mysql.connector
+from mysql.connector import Error
+
+def run_migration():
+    """Create the email_outbox table"""
+    try:
+        # Connect to database
+        connection = mysql.connector.connect(
+            host='localhost',
+            user='root',
+            password='',
+            database='ecommerce'
+        )
+
+        if connection.is_connected():
+            cursor = connection.cursor()
+
+            print("Connected to MySQL database")
+            print("\n" + "="*60)
+            print("MIGRATION: Create email_outbox table")
+            print("="*60 + "\n")
+
+            cursor.execute("""
+            CREATE TABLE IF NOT EXISTS email_outbox (
+                id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                log_id INT NULL COMMENT 'cart_abandonment_log entry marked email_sent on delivery',
+                to_email VARCHAR(255) NOT NULL,
+                subject VARCHAR(255) NOT NULL,
+                html_body MEDIUMTEXT NOT NULL,
+                text_body MEDIUMTEXT NOT NULL,
+                status ENUM('pending', 'sending', 'sent', 'dead') NOT NULL DEFAULT 'pending',
+                attempts INT NOT NULL DEFAULT 0 COMMENT 'Deliveries tried so far',
+                last_error VARCHAR(500) NULL,
+                next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT 'Pending rows are not claimed before this (retry backoff)',
+                claimed_at TIMESTAMP NULL,
+                claimed_by VARCHAR(100) NULL COMMENT 'host:pid of the worker that claimed the row',
+                created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                sent_at TIMESTAMP NULL,
+                INDEX idx_status_next_attempt (status, next_attempt_at),
+                INDEX idx_log_id (log_id)
+            )
+            """)
+            connection.commit()
+            print("✓ email_outbox table is ready")
+
+            # Verify the table
+            cursor.execute("DESCRIBE email_outbox")
+            columns = cursor.fetchall()
+
+            print("\nTable structure:")
+            for column in columns:
+                print(f"  - {column[0]} ({column[1]})")
+
+            cursor.close()
+            connection.close()
+            print("\nMigration completed successfully!")
+
+    except Error as e:
+        print(f"Error: {e}")
+        return False
+
+    return True
+
+if __name__ == "__main__":
+    run_migration()
@@ -0,0 +1,59 @@
+"""
+Database migration: Create llm_copy_cache table
+Persistent tier of the LLM email copy cache, so cached Groq copy survives restarts
+"""
+import mysql.connector
+from mysql.connector import Error
+
+def run_migration():
+    """Create the llm_copy_cache table"""
+    try:
+        # Connect to database
+        connection = mysql.connector.connect(
+            host='localhost',
+            user='root',
+            password='',
+            database='ecommerce'
+        )
+
+        if connection.is_connected():
+            cursor = connection.cursor()
+
+            print("Connected to MySQL database")
+            print("\n" + "="*60)
+            print("MIGRATION: Create llm_copy_cache table")
+            print("="*60 + "\n")
+
+            cursor.execute("""
+            CREATE TABLE IF NOT EXISTS llm_copy_cache (
+                signature CHAR(64) NOT NULL PRIMARY KEY COMMENT 'SHA-256 of the normalized prompt signature',
+                copy_text TEXT NOT NULL COMMENT 'Sanitized copy with the customer name replaced by a placeholder',
+                uses INT NOT NULL DEFAULT 1 COMMENT 'Times this copy has been served',
+                created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                expires_at TIMESTAMP NOT NULL,
+                INDEX idx_expires_at (expires_at)
+            )
+            """)
+            connection.commit()
+            print("✓ llm_copy_cache table is ready")
+
+            # Verify the table
+            cursor.execute("DESCRIBE llm_copy_cache")
+            columns = cursor.fetchall()
+
+            print("\nTable structure:")
+            for column in columns:
+                print(f"  - {column[0]} ({column[1]})")
+
+            cursor.close()
+            connection.close()
+            print("\nMigration completed successfully!")
+
+    except Error as e:
+        print(f"Error: {e}")
+        return False
+
+    return True
+
+if __name__ == "__main__":
+    run_migration()